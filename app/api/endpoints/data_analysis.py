@@ -1,6 +1,6 @@
 from flask import current_app
 from app.services.data_analysis import DataService 
-from app.services.search import SearchService
+from app.services.search import get_search_service
 from app.schemas.search import PacienteSearch
 from flask import Blueprint, request, jsonify
 
@@ -9,7 +9,7 @@ data_analysis_bp = Blueprint("data_analysis", __name__)
 @data_analysis_bp.route("/metrics", methods=["GET"])
 def get_metrics():
     try:
-        search_service = SearchService()
+        search_service = get_search_service()
         data_service = DataService(search_service, current_app.mongo)
         main_diseases_response = data_service.get_main_diseases()
         main_diseases = main_diseases_response["main_diseases"]
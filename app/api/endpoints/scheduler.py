@@ -1,22 +1,59 @@
-from flask import Blueprint 
+from datetime import datetime
+from flask import Blueprint, current_app, jsonify
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.jobstores.base import JobLookupError
+from pymongo import DESCENDING
+from app.core.config import Config
 from app.services.data_analysis import DataService
-from app.services.search import SearchService
+from app.services.indexer import EmbeddingIndexer
+from app.services.leader import LeaderElector, LeaderLease
+from app.services.lexical import get_lexical_index
+from app.services.local_search import LocalSearchService
+from app.services.search import get_search_service
 import atexit
 
 scheduler_bp = Blueprint("scheduler", __name__)
 scheduler = BackgroundScheduler()
+elector = None
+
+# fleet-wide jobs, only the process holding the scheduler lease runs them
+LEADER_JOBS = ("initial_ingestion_job", "data_ingestion_job", "study_translation_job", "embedding_indexer_job")
 
 @scheduler_bp.record_once
 def init_scheduler(state):
+    global elector
     app = state.app
 
-    with app.app_context():
-        search_service = SearchService()
-        data_service = DataService(search_service, state.app.mongo)
+    # every process keeps its own in-memory lexical index, so this one runs everywhere
+    scheduler.add_job(
+        func=lambda: get_lexical_index().sync(app.mongo),
+        trigger='interval',
+        minutes=Config.LEXICAL_INDEX_SYNC_MINUTES,
+        next_run_time=datetime.now(),
+        id='lexical_index_job',
+        replace_existing=True
+    )
+
+    def add_leader_jobs():
+        with app.app_context():
+            search_service = get_search_service()
+            data_service = DataService(search_service, app.mongo)
+            embedding_indexer = EmbeddingIndexer(search_service, app.mongo)
+
+        def initial_ingestion():
+            data_service.fetch_and_store_studies(full_resync=Config.INGESTION_FULL_RESYNC)
+            # also when the ingestion was skipped, the mirror may predate the search keys
+            data_service.precompute_search_keys()
+            # the translation catch-up only starts once the mirror is up to date, studies translated by the ingestion are skipped
+            data_service.translate_local_studies()
+
+        # in the background, so boot doesn't wait for it (an interrupted ingestion resumes from its checkpoint)
+        scheduler.add_job(
+            func=initial_ingestion,
+            id='initial_ingestion_job',
+            replace_existing=True
+        )
 
-        data_service.fetch_and_store_studies()
-        
         scheduler.add_job(
             func=data_service.fetch_and_store_studies,
             trigger='interval',
@@ -26,5 +63,70 @@ def init_scheduler(state):
             replace_existing=True
         )
 
-        scheduler.start()
-        atexit.register(lambda: scheduler.shutdown())
\ No newline at end of file
+        scheduler.add_job(
+            func=data_service.translate_local_studies,
+            trigger='interval',
+            days=1,
+            id='study_translation_job',
+            replace_existing=True
+        )
+
+        scheduler.add_job(
+            func=embedding_indexer.run,
+            trigger='interval',
+            minutes=Config.EMBEDDING_INDEXER_INTERVAL_MINUTES,
+            next_run_time=datetime.now(),
+            id='embedding_indexer_job',
+            replace_existing=True
+        )
+
+    def remove_leader_jobs():
+        # a job already running finishes, an ingestion run in progress keeps the next leader from starting another one
+        for job_id in LEADER_JOBS:
+            try:
+                scheduler.remove_job(job_id)
+            except JobLookupError:
+                pass
+
+    scheduler.start()
+    elector = LeaderElector(LeaderLease(app.mongo, "scheduler"), on_elected=add_leader_jobs, on_demoted=remove_leader_jobs)
+    elector.start()
+
+    def shutdown():
+        elector.stop()
+        scheduler.shutdown()
+    atexit.register(shutdown)
+
+@scheduler_bp.route("/health", methods=["GET"])
+def health():
+    return jsonify({"status": "ok"}), 200
+
+@scheduler_bp.route("/ready", methods=["GET"])
+def ready():
+    """
+    Readiness, separate from liveness (/health): the process answers as soon as it booted, it is ready once Mongo
+    responds and the local_studies mirror has been ingested at least once.
+
+    VECTOR_BACKEND=local is single-host: only the scheduler leader embeds into its VECTOR_STORE_PATH, so a process
+    on another host than the leader would search an empty store and never reports ready.
+    """
+    db = current_app.mongo
+    status = {
+        "leader": bool(elector and elector.is_leader), "mongo": False, "local_mirror": False, "vector_store": True, "ingestion": None
+    }
+    try:
+        db.command("ping")
+        status["mongo"] = True
+        status["local_mirror"] = LocalSearchService(db).is_available()
+        if Config.VECTOR_BACKEND == "local" and LeaderLease(db, "scheduler").held_by_another_host():
+            current_app.logger.error("VECTOR_BACKEND=local is single-host, but the scheduler leader runs on another host")
+            status["vector_store"] = False
+        status["ingestion"] = db["ingestion_runs"].find_one(
+            {}, {"_id": 0, "status": 1, "mode": 1, "counters": 1, "started_at": 1, "finished_at": 1},
+            sort=[("started_at", DESCENDING)]
+        )
+    except Exception as e:
+        current_app.logger.error(f"Readiness check failed: {e}")
+
+    is_ready = status["mongo"] and status["local_mirror"] and status["vector_store"]
+    return jsonify({"ready": is_ready, **status}), 200 if is_ready else 503
@@ -1,4 +1,4 @@
-from app.services.search import SearchService
+from app.services.search import get_search_service
 from app.schemas.search import PacienteSearch
 from app.schemas.search import MedicoSearch
 from app.core.validation_middleware import validate_json
@@ -12,7 +12,7 @@ search_bp = Blueprint('search', __name__)
 def search_paciente(data: PacienteSearch):
     try:
         current_app.logger.info('Search paciente endpoint called')
-        search_service = SearchService()
+        search_service = get_search_service()
         result = search_service.search_paciente(data)
 
         return jsonify(result), 200
@@ -25,7 +25,7 @@ def search_paciente(data: PacienteSearch):
 def search_medico(data: MedicoSearch):
     try:
         current_app.logger.info('Search medico endpoint called')
-        search_service = SearchService()
+        search_service = get_search_service()
         result = search_service.search_medico(data)
         return jsonify(result), 200
     except ValueError as e:
@@ -37,9 +37,14 @@ def advanced_search():
     try:
         data = request.get_json()
         current_app.logger.info('Advanced search endpoint called')
-        search_service = SearchService()
+        search_service = get_search_service()
         result = search_service.advanced_search(data["query"])
         return jsonify(result), 200
     except ValueError as e:
         current_app.logger.error(f'Error searching paciente: {e}')
         return jsonify({'error': 'error searching paciente'}), 400
+
+@search_bp.route('/cache/stats', methods = ["GET"])
+def cache_stats():
+    search_service = get_search_service()
+    return jsonify(search_service.cache_stats()), 200
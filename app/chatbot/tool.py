@@ -1,11 +1,11 @@
-from app.services.search import SearchService
+from app.services.search import get_search_service
 from app.schemas.study import CreateStudySchema as StudyType 
 from app.schemas.search import PacienteSearch
 from typing import TypedDict
 from app.chatbot import llm 
 
 def api_tool(search_data: TypedDict) -> list[StudyType]:
-    search_service = SearchService()
+    search_service = get_search_service()
     if search_data.get("location"):
         search_data = PacienteSearch(
             location = search_data["location"],
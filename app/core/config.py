@@ -5,4 +5,65 @@ load_dotenv()
 
 class Config:
     MONGO_URI = os.getenv('MONGO_URI')  
-    SECRET_KEY = os.getenv('SECRET_KEY')
\ No newline at end of file
+    SECRET_KEY = os.getenv('SECRET_KEY')
+    EMBEDDING_BATCH_TOKEN_BUDGET = int(os.getenv('EMBEDDING_BATCH_TOKEN_BUDGET', 100000))
+    EMBEDDING_INDEXER_INTERVAL_MINUTES = int(os.getenv('EMBEDDING_INDEXER_INTERVAL_MINUTES', 5))
+    SEARCH_CURSOR_CACHE_SIZE = int(os.getenv('SEARCH_CURSOR_CACHE_SIZE', 1000))
+    SEARCH_CURSOR_CACHE_TTL = int(os.getenv('SEARCH_CURSOR_CACHE_TTL', 900))
+    # studies fetched per upstream call when serving ui pages out of cached blocks, 0 turns block mode off
+    UPSTREAM_BLOCK_SIZE = int(os.getenv('UPSTREAM_BLOCK_SIZE', 100))
+    UPSTREAM_BLOCK_CACHE_SIZE = int(os.getenv('UPSTREAM_BLOCK_CACHE_SIZE', 32))
+    UPSTREAM_RESPONSE_CACHE_SIZE = int(os.getenv('UPSTREAM_RESPONSE_CACHE_SIZE', 512))
+    UPSTREAM_RESPONSE_CACHE_MB = int(os.getenv('UPSTREAM_RESPONSE_CACHE_MB', 64))
+    UPSTREAM_RESPONSE_CACHE_TTL = int(os.getenv('UPSTREAM_RESPONSE_CACHE_TTL', 6 * 60 * 60))
+    UPSTREAM_VERSION_CHECK_INTERVAL = int(os.getenv('UPSTREAM_VERSION_CHECK_INTERVAL', 300))
+    # brazil-scoped patient/doctor searches are answered by the local_studies mirror
+    LOCAL_SEARCH_ENABLED = os.getenv('LOCAL_SEARCH_ENABLED', 'true').lower() == 'true'
+    # how long a worker trusts its last check that the mirror has been ingested
+    LOCAL_SEARCH_AVAILABILITY_TTL = int(os.getenv('LOCAL_SEARCH_AVAILABILITY_TTL', 60))
+    SEARCH_BRANCH_WORKERS = int(os.getenv('SEARCH_BRANCH_WORKERS', 8))
+    SEARCH_API_TIMEOUT = float(os.getenv('SEARCH_API_TIMEOUT', 15))
+    SEARCH_SEMANTIC_TIMEOUT = float(os.getenv('SEARCH_SEMANTIC_TIMEOUT', 5))
+    # connection pool shared by the ClinicalTrials.gov calls of one gunicorn worker (search branches + scheduler jobs)
+    UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 10))
+    UPSTREAM_MAX_CONCURRENCY_PER_HOST = int(os.getenv('UPSTREAM_MAX_CONCURRENCY_PER_HOST', 8))
+    UPSTREAM_MAX_RETRIES = int(os.getenv('UPSTREAM_MAX_RETRIES', 3))
+    UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 3.05))
+    UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', 20))
+    TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', 20000))
+    TRANSLATION_CACHE_MB = int(os.getenv('TRANSLATION_CACHE_MB', 32))
+    QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', 2048))
+    QUERY_EMBEDDING_CACHE_PERSIST = os.getenv('QUERY_EMBEDDING_CACHE_PERSIST', 'true').lower() == 'true'
+    # 'pinecone' (the remote sprint-hsl index) or 'local' (LocalVectorStore, memory-mapped under VECTOR_STORE_PATH,
+    # single-host: the workers of the scheduler leader's host share it, other hosts report not ready)
+    VECTOR_BACKEND = os.getenv('VECTOR_BACKEND', 'pinecone')
+    VECTOR_STORE_PATH = os.getenv('VECTOR_STORE_PATH', 'data/vector_store')
+    VECTOR_STORE_QUANTIZATION = os.getenv('VECTOR_STORE_QUANTIZATION', 'float32')
+    VECTOR_ANN_THRESHOLD = int(os.getenv('VECTOR_ANN_THRESHOLD', 20000))
+    VECTOR_ANN_NPROBE = int(os.getenv('VECTOR_ANN_NPROBE', 8))
+    # hot platform studies hydrated after a vector query
+    STUDY_CACHE_SIZE = int(os.getenv('STUDY_CACHE_SIZE', 1000))
+    STUDY_CACHE_TTL = int(os.getenv('STUDY_CACHE_TTL', 300))
+    # how many more vector hits are asked for than top_k, so top_k is still met after the hydration checks
+    VECTOR_QUERY_OVERSAMPLE = int(os.getenv('VECTOR_QUERY_OVERSAMPLE', 2))
+    LEXICAL_INDEX_SYNC_MINUTES = int(os.getenv('LEXICAL_INDEX_SYNC_MINUTES', 5))
+    # merged result snapshots paged with a cursor: how long they live, and how many api and semantic results they hold
+    SEARCH_SNAPSHOT_TTL = int(os.getenv('SEARCH_SNAPSHOT_TTL', 1800))
+    SEARCH_SNAPSHOT_CACHE_SIZE = int(os.getenv('SEARCH_SNAPSHOT_CACHE_SIZE', 256))
+    SEARCH_SNAPSHOT_DEPTH = int(os.getenv('SEARCH_SNAPSHOT_DEPTH', 60))
+    SEARCH_SNAPSHOT_SEMANTIC_DEPTH = int(os.getenv('SEARCH_SNAPSHOT_SEMANTIC_DEPTH', 30))
+    # optional csv (city,state,latitude,longitude) extending the built-in gazetteer of brazilian cities
+    GAZETTEER_PATH = os.getenv('GAZETTEER_PATH', '')
+    # forces the startup ingestion to re-fetch every brazilian study instead of the ones updated since the last run
+    INGESTION_FULL_RESYNC = os.getenv('INGESTION_FULL_RESYNC', 'false').lower() == 'true'
+    # ingestion pipeline: bulk_write threads, and how many fetched pages may wait for them before the fetcher blocks
+    INGESTION_WRITERS = int(os.getenv('INGESTION_WRITERS', 2))
+    INGESTION_QUEUE_PAGES = int(os.getenv('INGESTION_QUEUE_PAGES', 4))
+    # ingestion_runs: a running run without a checkpoint for this long is considered dead, and an interrupted run is
+    # resumed from its checkpoint while it is younger than INGESTION_RESUME_HOURS and resumed at most INGESTION_MAX_RESUMES times
+    INGESTION_RUN_STALE_MINUTES = int(os.getenv('INGESTION_RUN_STALE_MINUTES', 10))
+    INGESTION_RESUME_HOURS = int(os.getenv('INGESTION_RESUME_HOURS', 12))
+    INGESTION_MAX_RESUMES = int(os.getenv('INGESTION_MAX_RESUMES', 3))
+    # the scheduler lease (leases collection): only its holder runs the ingestion/translation/indexing jobs, and it
+    # moves to another worker once the holder stops renewing it for this long
+    SCHEDULER_LEASE_TTL_SECONDS = int(os.getenv('SCHEDULER_LEASE_TTL_SECONDS', 30))
@@ -0,0 +1,147 @@
+import time
+import random
+import threading
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Optional
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from app.core.config import Config
+
+
+class UpstreamClient:
+    """
+    Pooled HTTP client shared by every ClinicalTrials.gov call of the process.
+    Connections are kept alive between calls, 429/5xx answers and connection errors are retried with jittered
+    exponential backoff (honouring Retry-After), and each host gets a cap on concurrent requests.
+    """
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(
+        self,
+        pool_size: int = None,
+        max_retries: int = None,
+        connect_timeout: float = None,
+        read_timeout: float = None,
+        max_concurrency_per_host: int = None,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30
+    ):
+        self.pool_size = pool_size or Config.UPSTREAM_POOL_SIZE
+        self.max_retries = Config.UPSTREAM_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = (
+            connect_timeout or Config.UPSTREAM_CONNECT_TIMEOUT,
+            read_timeout or Config.UPSTREAM_READ_TIMEOUT
+        )
+        self.max_concurrency_per_host = max_concurrency_per_host or Config.UPSTREAM_MAX_CONCURRENCY_PER_HOST
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._host_limits = {}
+        self._host_limits_lock = threading.Lock()
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        host = urlparse(url).netloc
+        with self._host_limits_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.max_concurrency_per_host)
+            return self._host_limits[host]
+
+    def _backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """
+        Seconds to wait before the next attempt: full jitter over an exponential ceiling,
+        but never less than what the server asked for in Retry-After.
+        """
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        retry_after = self._retry_after(response) if response is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    @staticmethod
+    def _retry_after(response: requests.Response) -> Optional[float]:
+        value = response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(float(value), 0)
+        except ValueError:
+            pass
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0)
+
+    def get(self, url: str, params: Optional[dict] = None, deadline: Optional[float] = None, **kwargs) -> requests.Response:
+        """
+        GET with retries. Once the retries are exhausted the last response is returned as is, so callers
+        keep handling non-200 statuses themselves; connection errors are raised.
+
+        A deadline (a time.monotonic() value, e.g. the budget of a search branch) caps the wait for the host slot and
+        the timeouts of each attempt at the time left, and no retry starts past it: the last response is returned,
+        or requests' Timeout raised.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        host_limit = self._host_limit(url)
+
+        for attempt in range(self.max_retries + 1):
+            response = None
+            last_attempt = attempt == self.max_retries
+            try:
+                response = self._attempt(url, params, host_limit, deadline, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                delay = self._backoff(attempt)
+                if last_attempt or not self._can_retry(deadline, delay):
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES or last_attempt:
+                    return response
+                delay = self._backoff(attempt, response)
+                if not self._can_retry(deadline, delay):
+                    return response
+                response.close()
+
+            time.sleep(delay)
+
+    def _attempt(self, url: str, params: Optional[dict], host_limit: threading.BoundedSemaphore, deadline: Optional[float], **kwargs):
+        if deadline is None:
+            with host_limit:
+                return self.session.get(url, params=params, **kwargs)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0 or not host_limit.acquire(timeout=remaining):
+            raise requests.exceptions.Timeout(f"Deadline exceeded before requesting {url}")
+        try:
+            remaining = max(deadline - time.monotonic(), 0.001)
+            timeout = kwargs.pop("timeout") or remaining
+            connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            timeout = (min(connect_timeout or remaining, remaining), min(read_timeout or remaining, remaining))
+            return self.session.get(url, params=params, timeout=timeout, **kwargs)
+        finally:
+            host_limit.release()
+
+    @staticmethod
+    def _can_retry(deadline: Optional[float], delay: float) -> bool:
+        return deadline is None or time.monotonic() + delay < deadline
+
+
+_upstream_client = None
+_upstream_client_lock = threading.Lock()
+
+def get_upstream_client() -> UpstreamClient:
+    """
+    Returns the UpstreamClient shared by the whole process, so every caller reuses the same connection pool.
+    """
+    global _upstream_client
+    if _upstream_client is None:
+        with _upstream_client_lock:
+            if _upstream_client is None:
+                _upstream_client = UpstreamClient()
+    return _upstream_client
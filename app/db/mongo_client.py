@@ -11,6 +11,36 @@ def init_db(app):
         IndexModel("protocolSection.designModule.studyType"),
         IndexModel("protocolSection.conditionsModule.conditions"),
         IndexModel("protocolSection.armsInterventionsModule.interventions.name"),
-        IndexModel("protocolSection.designModule.phases")
+        IndexModel("protocolSection.designModule.phases"),
+        IndexModel("protocolSection.contactsLocationsModule.locations.city"),
+        IndexModel("protocolSection.statusModule.overallStatus"),
+        IndexModel("protocolSection.identificationModule.nctId"),
+        IndexModel("protocolSection.identificationModule.organization.fullName"),
+        IndexModel("protocolSection.sponsorCollaboratorsModule.leadSponsor.name"),
+        IndexModel("protocolSection.eligibilityModule.stdAges"),
+        IndexModel("protocolSection.eligibilityModule.sex"),
+        IndexModel("protocolSection.eligibilityModule.healthyVolunteers"),
+        IndexModel("hasResults"),
+        IndexModel("last_updated"),
+        IndexModel([("geo", "2dsphere")]),
+        IndexModel([("min_age_months", 1), ("max_age_months", 1)]),
+        IndexModel("search_keys.cities"),
+        IndexModel("search_keys.interventions"),
+        IndexModel("search_keys.sponsor"),
+        IndexModel("search_keys.organization"),
+        IndexModel(
+            [
+                ("protocolSection.conditionsModule.conditions", "text"),
+                ("protocolSection.conditionsModule.keywords", "text"),
+                ("protocolSection.identificationModule.briefTitle", "text"),
+                ("protocolSection.identificationModule.officialTitle", "text")
+            ],
+            name="local_studies_text"
+        )
     ])
+    # also serves the embedding_version-only lookups of the indexer
+    db.studies.create_index([("embedding_version", 1), ("embedding_store", 1), ("metadata_version", 1)])
+    db.studies.create_index([("min_age_months", 1), ("max_age_months", 1)])
+    db.ingestion_runs.create_index("started_at")
+    db.search_snapshots.create_index("expires_at", expireAfterSeconds=0)
     app.mongo = db
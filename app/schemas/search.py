@@ -7,13 +7,19 @@ class PacienteSearch(BaseModel):
     condition: Optional[str] = Field(None, alias="query.cond")
     status: Optional[List[str]] = Field(None, alias="filter.overallStatus")
     location: Optional[str] = Field(None, alias="query.locn")
+    # only studies with a site within this distance of the location (a brazilian city)
+    radius_km: Optional[float] = Field(None, gt=0, le=1000)
     intervention: Optional[str] = Field(None, alias="query.intr")
     sponsor: Optional[str] = Field(None, alias="query.lead")
     age: Optional[str] = Field(None, alias="filter.advanced")
+    # the exact age of the patient, used instead of the child/adult/senior bucket
+    ageYears: Optional[float] = Field(None, ge=0, le=150)
     sex: Optional[str] = Field(None, alias="eligibilityModule.sex")
 
     pageToken: Optional[str] = None
     page: Optional[str] = Field(None, alias="page")
+    # snapshot id returned with the first page, sent back to page through the same merged results
+    cursor: Optional[str] = None
 
     @model_validator(mode="before")
     def convert_empty_to_none(cls, values):
@@ -41,9 +47,13 @@ class MedicoSearch(BaseModel):
     condition: Optional[str] = Field(None, alias="query.cond")
     status: Optional[List[str]] = Field(None, alias="filter.overallStatus")
     location: Optional[str] = Field(None, alias="query.locn")
+    # only studies with a site within this distance of the location (a brazilian city)
+    radius_km: Optional[float] = Field(None, gt=0, le=1000)
     intervention: Optional[str] = Field(None, alias="query.intr")
     sponsor: Optional[str] = Field(None, alias="query.lead")
     age: Optional[str] = Field(None, alias="filter.advanced")
+    # the exact age of the patient, used instead of the child/adult/senior bucket
+    ageYears: Optional[float] = Field(None, ge=0, le=150)
     sex: Optional[str] = Field(None, alias="query.aggFilters")
     acceptsHealthyVolunteers: Optional[bool] = Field(None, alias="query.aggFilters")
     studyPhase: Optional[str] = Field(None, alias="query.phase")
@@ -54,6 +64,8 @@ class MedicoSearch(BaseModel):
 
     pageToken: Optional[str] = None
     page: Optional[str] = Field(None, alias="page")
+    # snapshot id returned with the first page, sent back to page through the same merged results
+    cursor: Optional[str] = None
 
     @model_validator(mode="before")
     def convert_empty_to_none(cls, values):
@@ -1,23 +1,42 @@
-import requests
+import json
+import hashlib
 import atexit
-from datetime import datetime
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional
 from pymongo import UpdateOne, DESCENDING
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from app.core.config import Config
+from app.core.upstream import get_upstream_client
 from app.services.search import SearchService
+from app.services.lexical import get_lexical_index
+from app.services.geo import get_gazetteer
+from app.services.eligibility import age_fields, study_age_fields
+from app.services.local_search import search_keys
+from app.services.ingestion import IngestionPipeline
+from app.services.study_translation import StudyTranslationStore, display_fields, source_hash
 from app.schemas.search import PacienteSearch
 
+logger = logging.getLogger(__name__)
+
 
 class DataService:
+    # counters of an ingestion run, kept in its ingestion_runs document
+    RUN_COUNTERS = ("pages", "studies", "inserted", "changed", "unchanged")
+
     def __init__(self, search_service: SearchService, db):
         self.BASE_URL = "https://clinicaltrials.gov/api/v2/studies"
+        self.http = get_upstream_client()
         self.search_service = search_service
         self.db = db
         self.collection = self.db["local_studies"]
+        self.study_translations = StudyTranslationStore(self.db)
+        self.gazetteer = get_gazetteer()
     
 
     def _get_data_timestamp(self):
-        response = requests.get('https://clinicaltrials.gov/api/v2/version')
+        response = self.http.get('https://clinicaltrials.gov/api/v2/version')
         response.raise_for_status()
         data = response.json()
 
@@ -30,71 +49,361 @@ class DataService:
             "countTotal": "true",
         }
 
-        response = requests.get(self.BASE_URL, params=params)
+        response = self.http.get(self.BASE_URL, params=params)
         response.raise_for_status()
         data = response.json()
         
         return data.get("totalCount", 0)
 
-    def fetch_and_store_studies(self):
-        last_update = self.db["metadata"].find_one({"_id": "data_timestamp"})
-        if last_update:
-            last_updated = last_update.get("last_updated")
-            time_diff = datetime.utcnow() - last_updated
-            if time_diff.days < 8:
-                return  
-
-        data_timestamp = self._get_data_timestamp()
-        self.db["metadata"].update_one(
-            {"_id": "data_timestamp"},
-            {"$set": {"timestamp": data_timestamp, "last_updated": datetime.utcnow()}},
-            upsert=True
-        )
-
-        page_token = None 
-        page_size = 1000 
+    def fetch_and_store_studies(self, full_resync: bool = False):
+        """
+        Mirrors the brazilian studies of ClinicalTrials.gov into local_studies.
+        Runs are incremental: nothing is fetched while the upstream dataTimestamp hasn't moved, and otherwise only the
+        studies posted as updated since the last run's high-water mark (LastUpdatePostDate) are, through an advanced
+        range filter.
+
+        Every run is an ingestion_runs document (status, last committed pageToken, counters, start/end/heartbeat times)
+        checkpointed after each written page. A run that crashed or failed resumes from its checkpoint on the next call,
+        and the freshness state (timestamp and mark) is only committed once a run succeeded.
+
+        Args:
+            full_resync (bool): Re-fetches every brazilian study, ignoring the mark and any interrupted run (the first run is always full).
+        Returns:
+            dict: The mode of the run ("skipped", "incremental" or "full"), its id, whether it was resumed, how many pages and
+                studies were fetched, how many of the studies were inserted, changed and unchanged, and the throughput of the
+                fetch and write stages in this process (see IngestionPipeline).
+        """
+        runs = self.db["ingestion_runs"]
+        latest = runs.find_one({}, sort=[("started_at", DESCENDING)])
+        if latest and latest["status"] == "running" and not self._is_stale(latest):
+            logger.info(f"Ingestion skipped, run {latest['_id']} is in progress")
+            return {"mode": "skipped", "pages": 0, "studies": 0}
+
+        run = None if full_resync else self._resumable(latest)
+        if run is None:
+            state = self.db["metadata"].find_one({"_id": "data_timestamp"}) or {}
+            data_timestamp = self._get_data_timestamp()
+            if not full_resync and state and state.get("timestamp") == data_timestamp:
+                logger.info(f"Ingestion skipped, upstream data unchanged since {data_timestamp}")
+                return {"mode": "skipped", "pages": 0, "studies": 0}
+
+            total_global_studies = self._get_total_study_count()
+            self.db["metadata"].update_one(
+                {"_id": "total_global_studies"},
+                {"$set": {"count": total_global_studies, "last_updated": datetime.utcnow()}},
+                upsert=True
+            )
+            since = None if full_resync else state.get("last_update_post_date")
+            run = self._start_run("incremental" if since else "full", since, data_timestamp)
+            resumed = False
+        else:
+            logger.info(f"Resuming ingestion run {run['_id']} from its checkpoint ({run['counters'].get('pages', 0)} pages written)")
+            runs.update_one({"_id": run["_id"]}, {"$set": {"status": "running", "heartbeat_at": datetime.now()}, "$inc": {"attempts": 1}})
+            resumed = True
 
-        total_global_studies = self._get_total_study_count()
-        self.db["metadata"].update_one(
-            {"_id": "total_global_studies"},
-            {"$set": {"count": total_global_studies, "last_updated": datetime.utcnow()}},
-            upsert=True
-        )
+        since = run["since"]
+        mark = {"value": run.get("high_water_mark") or since}
+        base_counters = dict(run.get("counters") or {})
 
-        while True:
+        def fetch_page(page_token):
             params = {
                 "query.locn": "Brazil",
-                "pageSize": page_size,
+                "pageSize": 1000,
                 "format": "json",
-            }        
+            }
+            if since:
+                # inclusive, the studies of the mark's day are fetched again (upserts are idempotent)
+                params["filter.advanced"] = f"AREA[LastUpdatePostDate]RANGE[{since}, MAX]"
             if page_token:
                 params["pageToken"] = page_token
 
-            response = requests.get(self.BASE_URL, params=params)
+            response = self.http.get(self.BASE_URL, params=params)
             response.raise_for_status()
             data = response.json()
 
             studies_on_page = data.get("studies", [])
-
-            operations = []
+            # only the fetcher thread moves the mark
             for study in studies_on_page:
-                nct_id = study.get("protocolSection", {}).get("identificationModule", {}).get("nctId")
-                if nct_id:
-                    study["last_updated"] = datetime.now()
-                    operations.append(
-                        UpdateOne(
-                            {"protocolSection.identificationModule.nctId": nct_id},
-                            {"$set": study},
-                            upsert=True
-                        )
-                    )
+                posted = self._last_update_post_date(study)
+                if posted and (mark["value"] is None or posted > mark["value"]):
+                    mark["value"] = posted
+            return studies_on_page, data.get("nextPageToken"), len(response.content or b"")
+
+        def checkpoint(page_token, committed):
+            # the mark may already cover fetched pages that aren't written yet, it is only used once the run succeeded
+            counters = {name: base_counters.get(name, 0) + committed.get(name, 0) for name in self.RUN_COUNTERS}
+            runs.update_one({"_id": run["_id"]}, {"$set": {
+                "page_token": page_token,
+                "high_water_mark": mark["value"],
+                "counters": counters,
+                "heartbeat_at": datetime.now(),
+            }})
+
+        try:
+            metrics = IngestionPipeline(
+                fetch_page=fetch_page,
+                write_page=self._store_page,
+                writers=Config.INGESTION_WRITERS,
+                queue_size=Config.INGESTION_QUEUE_PAGES
+            ).run(start_token=run.get("page_token"), on_checkpoint=checkpoint)
+        except Exception as e:
+            runs.update_one({"_id": run["_id"]}, {"$set": {"status": "failed", "error": repr(e), "finished_at": datetime.now()}})
+            raise
+
+        summary = {"mode": run["mode"], "run_id": str(run["_id"]), "resumed": resumed}
+        summary.update({name: base_counters.get(name, 0) for name in self.RUN_COUNTERS})
+        summary["studies"] += metrics.pop("documents")
+        for name in ("pages", "inserted", "changed", "unchanged"):
+            summary[name] += metrics.pop(name, 0)
+        summary.update(metrics)
 
-            if operations:
-                self.collection.bulk_write(operations)
+        self.db["metadata"].update_one(
+            {"_id": "data_timestamp"},
+            {"$set": {
+                "timestamp": run["data_timestamp"],
+                "last_updated": datetime.utcnow(),
+                "last_update_post_date": mark["value"],
+            }},
+            upsert=True
+        )
+        runs.update_one({"_id": run["_id"]}, {"$set": {
+            "status": "succeeded",
+            "page_token": None,
+            "high_water_mark": mark["value"],
+            "counters": {name: summary[name] for name in self.RUN_COUNTERS},
+            "finished_at": datetime.now(),
+        }})
+        logger.info(
+            f"Ingestion ({summary['mode']}) went through {summary['studies']} studies from {summary['pages']} pages in {summary['seconds']}s, "
+            f"{summary['inserted']} inserted, {summary['changed']} changed, {summary['unchanged']} unchanged "
+            f"({summary['pages_per_second']} pages/s, {summary['documents_per_second']} docs/s, {summary['bytes_per_second']} bytes/s)"
+        )
 
-            page_token = data.get("nextPageToken")
-            if not page_token:
-                break
+        self.precompute_age_fields()
+        self.precompute_search_keys()
+        self.translate_local_studies(updated_since=None if summary["mode"] == "full" else run["started_at"])
+        get_lexical_index().sync(self.db)
+        return summary
+
+    def _start_run(self, mode: str, since: Optional[str], data_timestamp: Optional[str]) -> Dict[str, Any]:
+        now = datetime.now()
+        run = {
+            "status": "running",
+            "mode": mode,
+            "since": since,
+            "data_timestamp": data_timestamp,
+            "page_token": None,
+            "high_water_mark": since,
+            "counters": {name: 0 for name in self.RUN_COUNTERS},
+            "attempts": 1,
+            "started_at": now,
+            "heartbeat_at": now,
+            "finished_at": None,
+        }
+        run["_id"] = self.db["ingestion_runs"].insert_one(run).inserted_id
+        return run
+
+    @staticmethod
+    def _is_stale(run: Dict[str, Any]) -> bool:
+        """
+        A "running" run without a checkpoint for a while belongs to a process that died (killed worker, deploy).
+        """
+        heartbeat = run.get("heartbeat_at") or run["started_at"]
+        return datetime.now() - heartbeat > timedelta(minutes=Config.INGESTION_RUN_STALE_MINUTES)
+
+    @staticmethod
+    def _resumable(run: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        The latest run, if it was interrupted after a checkpoint and can still go on from there: it is recent (CT page
+        tokens are not kept forever) and hasn't already failed to resume too many times.
+        """
+        if not run or run["status"] not in ("running", "failed") or not run.get("page_token"):
+            return None
+        if datetime.now() - run["started_at"] > timedelta(hours=Config.INGESTION_RESUME_HOURS):
+            return None
+        if run.get("attempts", 1) - 1 >= Config.INGESTION_MAX_RESUMES:
+            return None
+        return run
+
+    @staticmethod
+    def content_hash(study: Dict[str, Any]) -> str:
+        """
+        Stable hash of the canonical protocolSection of a CT study (key order and whitespace don't matter).
+        """
+        canonical = json.dumps(study.get("protocolSection", {}), sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _store_page(self, studies_on_page: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Writer stage of the ingestion: upserts the new and changed studies of a page with their derived fields, unordered.
+        The stored content hashes of the page are read with one $in query first, unchanged studies are not written at all.
+
+        Returns:
+            dict: How many studies the page had, and how many were inserted, changed and unchanged.
+        """
+        studies = {}
+        for study in studies_on_page:
+            nct_id = study.get("protocolSection", {}).get("identificationModule", {}).get("nctId")
+            if nct_id:
+                studies[nct_id] = study
+
+        stored = {}
+        if studies:
+            docs = self.collection.find(
+                {"protocolSection.identificationModule.nctId": {"$in": list(studies)}},
+                {"_id": 0, "protocolSection.identificationModule.nctId": 1, "content_hash": 1}
+            )
+            stored = {doc["protocolSection"]["identificationModule"]["nctId"]: doc.get("content_hash") for doc in docs}
+
+        counts = {"documents": len(studies), "inserted": 0, "changed": 0, "unchanged": 0}
+        operations = []
+        for nct_id, study in studies.items():
+            content_hash = self.content_hash(study)
+            if nct_id not in stored:
+                counts["inserted"] += 1
+            elif stored[nct_id] == content_hash:
+                counts["unchanged"] += 1
+                continue
+            else:
+                counts["changed"] += 1
+
+            study["content_hash"] = content_hash
+            study["last_updated"] = datetime.now()
+            study.update(study_age_fields(study))
+            study.update(search_keys(study))
+            update = {"$set": study}
+            # geocoded sites for the radius searches (2dsphere index), from the geoPoints or the gazetteer
+            geo_points = self.gazetteer.study_points(study)
+            if geo_points:
+                study["geo"] = geo_points
+            else:
+                update["$unset"] = {"geo": ""}
+            operations.append(
+                UpdateOne(
+                    {"protocolSection.identificationModule.nctId": nct_id},
+                    update,
+                    upsert=True
+                )
+            )
+
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+        return counts
+
+    @staticmethod
+    def _last_update_post_date(study: Dict[str, Any]) -> Optional[str]:
+        # ISO dates ("2024-11-20", or "2024-11" for older records) compare correctly as strings
+        return study.get("protocolSection", {}).get("statusModule", {}).get("lastUpdatePostDateStruct", {}).get("date")
+
+    def precompute_age_fields(self, batch_size=1000):
+        """
+        Backfills the numeric age fields (see app.services.eligibility) on the mirrored and platform studies stored
+        before they were computed at write time.
+
+        Returns:
+            dict: How many studies were updated in each collection.
+        """
+        stats = {}
+        sources = (
+            (self.collection, study_age_fields, {"protocolSection.eligibilityModule": 1}),
+            (self.db["studies"], lambda doc: age_fields(doc.get("MinimumAge"), doc.get("MaximumAge")), {"MinimumAge": 1, "MaximumAge": 1}),
+        )
+        for collection, fields, projection in sources:
+            stats[collection.name] = 0
+            operations = []
+            for doc in collection.find({"min_age_months": {"$exists": False}}, projection):
+                operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": fields(doc)}))
+                if len(operations) == batch_size:
+                    collection.bulk_write(operations, ordered=False)
+                    stats[collection.name] += len(operations)
+                    operations = []
+            if operations:
+                collection.bulk_write(operations, ordered=False)
+                stats[collection.name] += len(operations)
+        return stats
+
+    def precompute_search_keys(self, batch_size=1000) -> int:
+        """
+        Backfills the normalized search keys (see app.services.local_search.search_keys) on the mirrored studies
+        stored before they were computed at write time.
+
+        Returns:
+            int: How many studies were updated.
+        """
+        projection = {
+            "protocolSection.contactsLocationsModule.locations.city": 1,
+            "protocolSection.armsInterventionsModule.interventions.name": 1,
+            "protocolSection.sponsorCollaboratorsModule.leadSponsor.name": 1,
+            "protocolSection.identificationModule.organization.fullName": 1,
+        }
+        updated = 0
+        operations = []
+        for doc in self.collection.find({"search_keys": {"$exists": False}}, projection):
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": search_keys(doc)}))
+            if len(operations) == batch_size:
+                self.collection.bulk_write(operations, ordered=False)
+                updated += len(operations)
+                operations = []
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+            updated += len(operations)
+        return updated
+
+    def translate_local_studies(self, target_language='pt', batch_size=100, updated_since: Optional[datetime] = None):
+        """
+        Ingestion stage that stores the translated display fields of every mirrored study, so searches don't
+        have to translate them live. Studies whose stored translation was made from the current english text are skipped.
+
+        Args:
+            target_language (str): The target language.
+            batch_size (int): How many studies are translated (and written) together.
+            updated_since (datetime): Only checks the studies written since then (an incremental ingestion).
+        Returns:
+            dict: How many studies were checked, translated, and failed to translate.
+        """
+        projection = {
+            "protocolSection.identificationModule": 1,
+            "protocolSection.descriptionModule": 1,
+            "protocolSection.conditionsModule": 1,
+            "protocolSection.eligibilityModule": 1,
+            f"translations.{target_language}.source_hash": 1,
+        }
+        stats = {"checked": 0, "translated": 0, "failed": 0}
+
+        batch = []
+        query = {"last_updated": {"$gte": updated_since}} if updated_since else {}
+        for doc in self.collection.find(query, projection):
+            stats["checked"] += 1
+            fields = display_fields(self.search_service.filter_studies({"studies": [doc]}, None)[0])
+            entry = doc.get("translations", {}).get(target_language) or {}
+            if entry.get("source_hash") == source_hash(fields):
+                continue
+
+            batch.append((doc["_id"], fields))
+            if len(batch) >= batch_size:
+                self._translate_batch(batch, target_language, stats)
+                batch = []
+
+        if batch:
+            self._translate_batch(batch, target_language, stats)
+
+        return stats
+
+    def _translate_batch(self, batch, target_language, stats):
+        strings = [text for _, fields in batch for text in self.study_translations.strings_to_translate(fields)]
+        translations = self.search_service.translate_service.translate_texts(strings, target_language=target_language)
+
+        operations = []
+        for _id, fields in batch:
+            entry = self.study_translations.build_entry(fields, translations)
+            if entry is None:
+                stats["failed"] += 1
+                continue
+            operations.append(UpdateOne({"_id": _id}, {"$set": {f"translations.{target_language}": entry}}))
+
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+            stats["translated"] += len(operations)
 
     def get_representatividade(self):
         total_brazil_studies = self.collection.count_documents({})
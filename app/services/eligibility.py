@@ -0,0 +1,77 @@
+import re
+from typing import Dict, Optional
+
+# open-ended age bounds are stored as these, so every study answers the same indexed range query
+MIN_AGE_MONTHS = 0.0
+MAX_AGE_MONTHS = 200 * 12.0
+
+_MONTHS_PER_UNIT = {
+    "year": 12.0, "years": 12.0, "ano": 12.0, "anos": 12.0,
+    "month": 1.0, "months": 1.0, "mes": 1.0, "meses": 1.0, "mês": 1.0,
+    "week": 12 / 52.1775, "weeks": 12 / 52.1775, "semana": 12 / 52.1775, "semanas": 12 / 52.1775,
+    "day": 12 / 365.25, "days": 12 / 365.25, "dia": 12 / 365.25, "dias": 12 / 365.25,
+    "hour": 12 / 8766.0, "hours": 12 / 8766.0, "hora": 12 / 8766.0, "horas": 12 / 8766.0,
+    "minute": 12 / 525960.0, "minutes": 12 / 525960.0,
+}
+_AGE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*([^\d\s]*)\s*$")
+
+
+def parse_age_months(text: Optional[str]) -> Optional[float]:
+    """
+    Parses a CT (or platform) age string into months: "18 Years" -> 216, "6 Months" -> 6, "2 Weeks" -> 0.46.
+    A bare number is taken as years.
+
+    Returns:
+        float: The age in months, or None if there is no age ("N/A", empty) or it can't be read.
+    """
+    if not isinstance(text, str):
+        return None
+    match = _AGE.match(text.lower())
+    if not match:
+        return None
+    value = float(match.group(1).replace(",", "."))
+    unit = match.group(2) or "years"
+    if unit not in _MONTHS_PER_UNIT:
+        return None
+    return round(value * _MONTHS_PER_UNIT[unit], 2)
+
+def age_fields(minimum_age: Optional[str], maximum_age: Optional[str]) -> Dict[str, float]:
+    """
+    The numeric eligibility fields stored next to a study (local_studies mirror and platform studies),
+    with the missing bounds open-ended.
+    """
+    minimum = parse_age_months(minimum_age)
+    maximum = parse_age_months(maximum_age)
+    return {
+        "min_age_months": MIN_AGE_MONTHS if minimum is None else minimum,
+        "max_age_months": MAX_AGE_MONTHS if maximum is None else maximum,
+    }
+
+def study_age_fields(study: Dict) -> Dict[str, float]:
+    """
+    age_fields of a raw CT study.
+    """
+    eligibility = study.get("protocolSection", {}).get("eligibilityModule", {})
+    return age_fields(eligibility.get("minimumAge"), eligibility.get("maximumAge"))
+
+def age_query(age_years: float) -> Dict[str, Dict[str, float]]:
+    """
+    Mongo query for the studies a patient of this exact age is eligible for (compound index on the age fields).
+    """
+    months = age_years * 12
+    return {"min_age_months": {"$lte": months}, "max_age_months": {"$gte": months}}
+
+def matches_age(record: Dict, age_years: float) -> bool:
+    """
+    age_query on a record already in memory (e.g. a cached study). Like in Mongo, a record without the fields doesn't match.
+    """
+    months = age_years * 12
+    minimum, maximum = record.get("min_age_months"), record.get("max_age_months")
+    return minimum is not None and maximum is not None and minimum <= months <= maximum
+
+def age_expression(age_years: float) -> str:
+    """
+    The same range as age_query, in the CT api search syntax.
+    """
+    age = f"{age_years:g} years" if float(age_years).is_integer() else f"{round(age_years * 12)} months"
+    return f"AREA[MinimumAge]RANGE[MIN, {age}] AND AREA[MaximumAge]RANGE[{age}, MAX]"
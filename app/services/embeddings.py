@@ -0,0 +1,106 @@
+import re
+import logging
+import hashlib
+import threading
+from array import array
+from datetime import datetime
+from typing import List, Optional
+from bson import Binary
+from langchain_core.embeddings import Embeddings
+from app.core.cache import TTLCache
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embeddings model so repeated search queries are only embedded once.
+    Query vectors are kept in an in-process LRU and, if a db is given, in the query_embeddings collection as
+    float32 blobs, so a restarted worker doesn't pay for them again. Documents (the indexer) go straight to the model.
+    """
+    def __init__(self, model: Embeddings, model_name: str, db=None, maxsize: int = None):
+        self.model = model
+        self.model_name = model_name
+        self.collection = db["query_embeddings"] if db is not None else None
+        self.cache = TTLCache(maxsize=maxsize or Config.QUERY_EMBEDDING_CACHE_SIZE)
+        self._stats_lock = threading.Lock()
+        self.stats = {"memory_hits": 0, "mongo_hits": 0, "model_calls": 0}
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return re.sub(r"\s+", " ", text).strip().lower()
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{self.normalize(text)}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def to_blob(vector: List[float]) -> Binary:
+        return Binary(array("f", vector).tobytes())
+
+    @staticmethod
+    def from_blob(blob: bytes) -> List[float]:
+        vector = array("f")
+        vector.frombytes(bytes(blob))
+        return vector.tolist()
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self.stats[name] += 1
+
+    def cache_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update(self.cache.stats())
+        return stats
+
+    def _load(self, key: str) -> Optional[List[float]]:
+        if self.collection is None:
+            return None
+        try:
+            doc = self.collection.find_one({"_id": key}, {"vector": 1})
+        except Exception as e:
+            logger.error(f"Error reading the query embedding cache: {e}")
+            return None
+        return self.from_blob(doc["vector"]) if doc else None
+
+    def _store(self, key: str, vector: List[float]):
+        if self.collection is None:
+            return
+        try:
+            self.collection.update_one(
+                {"_id": key},
+                {"$set": {"vector": self.to_blob(vector), "model": self.model_name, "created_at": datetime.utcnow()}},
+                upsert=True
+            )
+        except Exception as e:
+            logger.error(f"Error writing the query embedding cache: {e}")
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a search query, going through the in-process cache and then the collection before calling the model.
+
+        Args:
+            text (str): The query text.
+        Returns:
+            list: The query vector.
+        """
+        key = self.cache_key(text)
+        vector = self.cache.get(key)
+        if vector is not None:
+            self._count("memory_hits")
+            return vector
+
+        vector = self._load(key)
+        if vector is not None:
+            self._count("mongo_hits")
+        else:
+            self._count("model_calls")
+            vector = self.model.embed_query(self.normalize(text))
+            self._store(key, vector)
+
+        self.cache.set(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
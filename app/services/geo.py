@@ -0,0 +1,225 @@
+import csv
+import math
+import logging
+import threading
+import unicodedata
+from typing import List, Dict, Any, Optional, Tuple
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6378.1
+
+COUNTRY_ALIASES = {"brasil": "brazil"}
+
+STATE_NAMES = {
+    "acre": "AC", "alagoas": "AL", "amapa": "AP", "amazonas": "AM", "bahia": "BA", "ceara": "CE",
+    "distrito federal": "DF", "espirito santo": "ES", "goias": "GO", "maranhao": "MA", "mato grosso": "MT",
+    "mato grosso do sul": "MS", "minas gerais": "MG", "para": "PA", "paraiba": "PB", "parana": "PR",
+    "pernambuco": "PE", "piaui": "PI", "rio de janeiro": "RJ", "rio grande do norte": "RN",
+    "rio grande do sul": "RS", "rondonia": "RO", "roraima": "RR", "santa catarina": "SC", "sao paulo": "SP",
+    "sergipe": "SE", "tocantins": "TO",
+}
+
+# (city, state, latitude, longitude): the state capitals and the cities with the most trial sites.
+# GAZETTEER_PATH can point to a csv with the same columns (e.g. the full IBGE list) to extend it.
+BRAZILIAN_CITIES = (
+    ("Rio Branco", "AC", -9.9747, -67.8243),
+    ("Maceio", "AL", -9.6658, -35.7353),
+    ("Macapa", "AP", 0.0349, -51.0694),
+    ("Manaus", "AM", -3.1190, -60.0217),
+    ("Salvador", "BA", -12.9777, -38.5016),
+    ("Feira de Santana", "BA", -12.2664, -38.9663),
+    ("Fortaleza", "CE", -3.7319, -38.5267),
+    ("Brasilia", "DF", -15.7939, -47.8828),
+    ("Vitoria", "ES", -20.3155, -40.3128),
+    ("Vila Velha", "ES", -20.3297, -40.2925),
+    ("Goiania", "GO", -16.6869, -49.2648),
+    ("Anapolis", "GO", -16.3281, -48.9530),
+    ("Sao Luis", "MA", -2.5307, -44.3068),
+    ("Cuiaba", "MT", -15.6014, -56.0979),
+    ("Campo Grande", "MS", -20.4697, -54.6201),
+    ("Belo Horizonte", "MG", -19.9167, -43.9345),
+    ("Juiz de Fora", "MG", -21.7642, -43.3503),
+    ("Uberlandia", "MG", -18.9186, -48.2772),
+    ("Belem", "PA", -1.4558, -48.4902),
+    ("Joao Pessoa", "PB", -7.1195, -34.8450),
+    ("Campina Grande", "PB", -7.2307, -35.8817),
+    ("Curitiba", "PR", -25.4284, -49.2733),
+    ("Londrina", "PR", -23.3045, -51.1696),
+    ("Maringa", "PR", -23.4210, -51.9331),
+    ("Cascavel", "PR", -24.9555, -53.4552),
+    ("Recife", "PE", -8.0476, -34.8770),
+    ("Teresina", "PI", -5.0920, -42.8038),
+    ("Rio de Janeiro", "RJ", -22.9068, -43.1729),
+    ("Niteroi", "RJ", -22.8832, -43.1034),
+    ("Natal", "RN", -5.7945, -35.2110),
+    ("Porto Alegre", "RS", -30.0346, -51.2177),
+    ("Caxias do Sul", "RS", -29.1678, -51.1794),
+    ("Passo Fundo", "RS", -28.2620, -52.4064),
+    ("Pelotas", "RS", -31.7654, -52.3376),
+    ("Santa Maria", "RS", -29.6842, -53.8069),
+    ("Ijui", "RS", -28.3880, -53.9199),
+    ("Porto Velho", "RO", -8.7612, -63.9004),
+    ("Boa Vista", "RR", 2.8235, -60.6758),
+    ("Florianopolis", "SC", -27.5954, -48.5480),
+    ("Joinville", "SC", -26.3045, -48.8487),
+    ("Blumenau", "SC", -26.9194, -49.0661),
+    ("Itajai", "SC", -26.9078, -48.6619),
+    ("Sao Paulo", "SP", -23.5505, -46.6333),
+    ("Campinas", "SP", -22.9099, -47.0626),
+    ("Ribeirao Preto", "SP", -21.1775, -47.8103),
+    ("Santo Andre", "SP", -23.6639, -46.5383),
+    ("Sao Bernardo do Campo", "SP", -23.6914, -46.5646),
+    ("Guarulhos", "SP", -23.4543, -46.5337),
+    ("Santos", "SP", -23.9608, -46.3336),
+    ("Sorocaba", "SP", -23.5015, -47.4526),
+    ("Sao Jose do Rio Preto", "SP", -20.8113, -49.3758),
+    ("Botucatu", "SP", -22.8837, -48.4437),
+    ("Barretos", "SP", -20.5531, -48.5698),
+    ("Jau", "SP", -22.2936, -48.5592),
+    ("Aracaju", "SE", -10.9472, -37.0731),
+    ("Palmas", "TO", -10.2491, -48.3243),
+)
+
+
+def normalize_place(name: str) -> str:
+    """
+    Lowercased, accent-free place name, used both in the vector metadata and in the query filters ("São Paulo" -> "sao paulo").
+    """
+    name = unicodedata.normalize("NFKD", name or "")
+    name = "".join(char for char in name if not unicodedata.combining(char)).strip().lower()
+    return COUNTRY_ALIASES.get(name, name)
+
+def state_code(state: Optional[str]) -> Optional[str]:
+    """
+    The two letter code of a brazilian state, given either the code or the name ("Pernambuco" -> "PE").
+    """
+    name = normalize_place(state)
+    if not name:
+        return None
+    if name.upper() in STATE_NAMES.values():
+        return name.upper()
+    return STATE_NAMES.get(name)
+
+def haversine_km(a: Tuple[float, float], b: Tuple[float, float]) -> float:
+    """
+    Great-circle distance between two (latitude, longitude) points.
+    """
+    lat1, lon1, lat2, lon2 = map(math.radians, (a[0], a[1], b[0], b[1]))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+class Gazetteer:
+    """
+    Offline lookup of brazilian city coordinates, used to geocode the facility locations that come without a geoPoint
+    and the center of the "within N km of city" searches.
+    """
+    def __init__(self, entries=BRAZILIAN_CITIES):
+        self.places = {}
+        for city, state, latitude, longitude in entries:
+            self.add(city, state, latitude, longitude)
+
+    def add(self, city: str, state: str, latitude: float, longitude: float):
+        entries = self.places.setdefault(normalize_place(city), {})
+        entries[state_code(state)] = (float(latitude), float(longitude))
+
+    def load_csv(self, path: str) -> int:
+        count = 0
+        with open(path, newline="", encoding="utf-8") as file:
+            for row in csv.reader(file):
+                if len(row) < 4 or row[0].strip().lower() == "city":
+                    continue
+                self.add(row[0], row[1], row[2], row[3])
+                count += 1
+        return count
+
+    def lookup(self, city: Optional[str], state: Optional[str] = None) -> Optional[Tuple[float, float]]:
+        """
+        Coordinates of a city. A city name shared by several states is only resolved when the state is given.
+
+        Returns:
+            tuple: (latitude, longitude), or None if the city is unknown or ambiguous.
+        """
+        entries = self.places.get(normalize_place(city))
+        if not entries:
+            return None
+        code = state_code(state)
+        if code:
+            return entries.get(code)
+        if len(entries) == 1:
+            return next(iter(entries.values()))
+        return None
+
+    def resolve(self, location: Optional[str]) -> Optional[Tuple[float, float]]:
+        """
+        Coordinates of a location typed by the user: "Recife", "Recife, PE" or "Recife, Pernambuco, Brazil".
+        """
+        if not location:
+            return None
+        parts = [part.strip() for part in location.split(",") if part.strip()]
+        parts = [part for part in parts if normalize_place(part) != "brazil"]
+        if not parts:
+            return None
+        return self.lookup(parts[0], parts[1] if len(parts) > 1 else None)
+
+    def cities_within(self, center: Tuple[float, float], radius_km: float) -> List[str]:
+        """
+        The (normalized) names of the known cities within radius_km of the center, nearest first.
+        """
+        distances = {}
+        for city, entries in self.places.items():
+            for point in entries.values():
+                distance = haversine_km(center, point)
+                if distance <= radius_km:
+                    distances[city] = min(distance, distances.get(city, distance))
+        return sorted(distances, key=distances.get)
+
+    def location_point(self, location: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+        """
+        Coordinates of a CT location record: its geoPoint, or the gazetteer entry of its city.
+        """
+        geo_point = location.get("geoPoint") or {}
+        if geo_point.get("lat") is not None and geo_point.get("lon") is not None:
+            return float(geo_point["lat"]), float(geo_point["lon"])
+        if normalize_place(location.get("country")) not in ("", "brazil"):
+            return None
+        return self.lookup(location.get("city"), location.get("state"))
+
+    def study_points(self, study: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        GeoJSON points of every geocoded site of a raw CT study, for the 2dsphere index on local_studies.geo.
+        """
+        locations = study.get("protocolSection", {}).get("contactsLocationsModule", {}).get("locations", [])
+        points = []
+        seen = set()
+        for location in locations:
+            point = self.location_point(location) if isinstance(location, dict) else None
+            if point is None or point in seen:
+                continue
+            seen.add(point)
+            points.append({"type": "Point", "coordinates": [point[1], point[0]]})
+        return points
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+def get_gazetteer() -> Gazetteer:
+    """
+    Returns the Gazetteer shared by the whole process, with the entries of GAZETTEER_PATH if it is set.
+    """
+    global _gazetteer
+    if _gazetteer is None:
+        with _gazetteer_lock:
+            if _gazetteer is None:
+                gazetteer = Gazetteer()
+                if Config.GAZETTEER_PATH:
+                    try:
+                        count = gazetteer.load_csv(Config.GAZETTEER_PATH)
+                        logger.info(f"Loaded {count} gazetteer entries from {Config.GAZETTEER_PATH}")
+                    except OSError as e:
+                        logger.error(f"Error loading the gazetteer: {e}")
+                _gazetteer = gazetteer
+    return _gazetteer
@@ -0,0 +1,194 @@
+import time
+import logging
+from typing import List, Dict, Any, Iterator
+from pymongo import UpdateOne
+from bson import ObjectId
+from langchain_core.documents import Document
+from app.core.config import Config
+from app.services.geo import normalize_place
+from app.services.vector_store import embedding_store_id, update_vector_metadata
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingIndexer:
+    """
+    Background job that embeds the platform studies that are not in the vector store yet.
+    It runs from the scheduler, so search requests never wait on indexing.
+    """
+    # bumped when the embedded vectors change, so every study gets re-embedded by the next run
+    # (2: slim metadata, the records are hydrated from mongo after a query; 3: location metadata; 4: no text in the metadata)
+    VERSION = 4
+    # bumped when only build_metadata changes: the embedded studies get their metadata rewritten in place, no embeddings call
+    METADATA_VERSION = 1
+    # metadata kept next to each vector, besides the _id: only what queries filter on
+    METADATA_FIELDS = ("sub_status",)
+
+    def __init__(self, search_service, db, token_budget: int = None, max_batch_size: int = 100, max_retries: int = 3):
+        self.search_service = search_service
+        self.db = db
+        self.collection = self.db.studies
+        self.token_budget = token_budget or Config.EMBEDDING_BATCH_TOKEN_BUDGET
+        self.max_batch_size = max_batch_size
+        self.max_retries = max_retries
+
+        # a study counts as embedded for the store that holds its vector (embedding_store), so switching
+        # VECTOR_BACKEND or VECTOR_STORE_PATH backfills the new store instead of finding nothing pending
+        self.store_id = embedding_store_id()
+        # studies flagged before embedding_store existed were embedded into the default, remote, index
+        in_store = [self.store_id, None] if self.store_id.startswith("pinecone:") else [self.store_id]
+        self.pending_query = {"$or": [{"embedding_version": {"$ne": self.VERSION}}, {"embedding_store": {"$nin": in_store}}]}
+        # equality on null keeps the studies embedded before metadata_version existed on the index
+        self.metadata_pending_query = {
+            "embedding_version": self.VERSION,
+            "embedding_store": {"$in": in_store},
+            "$or": [{"metadata_version": {"$lt": self.METADATA_VERSION}}, {"metadata_version": None}]
+        }
+
+    @classmethod
+    def build_metadata(cls, doc: dict) -> dict:
+        """
+        The vector metadata of a study: its id plus the filterable fields. The full record is read
+        from the studies collection after a query (SearchService.hydrate_studies).
+        """
+        metadata = {"_id": str(doc["_id"])}
+        for field in cls.METADATA_FIELDS:
+            if doc.get(field) is not None:
+                metadata[field] = doc[field]
+
+        # every place the study runs in, so vector queries can pre-filter by location
+        locations = [loc for loc in doc.get("Location") or [] if isinstance(loc, dict)]
+        for key, field in (("cities", "City"), ("states", "State"), ("countries", "Country")):
+            places = sorted({normalize_place(loc.get(field)) for loc in locations if loc.get(field)})
+            if places:
+                metadata[key] = places
+        return metadata
+
+    @staticmethod
+    def estimate_tokens(text: str) -> int:
+        # ~4 characters per token for english text, close enough to size a batch
+        return len(text) // 4 + 1
+
+    def build_document(self, doc: dict) -> Document:
+        conditions = doc.get("Conditions") or []
+        page_content = f"{doc.get('Title', '')} {doc.get('Description', '')} {' '.join(conditions)}".strip()
+
+        return Document(page_content=page_content, metadata=self.build_metadata(doc))
+
+    def _batches(self, documents: Iterator[dict]) -> Iterator[List[Document]]:
+        """
+        Groups the pending studies into batches that stay under the token budget of one embeddings call.
+        """
+        batch = []
+        batch_tokens = 0
+        for doc in documents:
+            document = self.build_document(doc)
+            tokens = self.estimate_tokens(document.page_content)
+            if batch and (batch_tokens + tokens > self.token_budget or len(batch) >= self.max_batch_size):
+                yield batch
+                batch = []
+                batch_tokens = 0
+            batch.append(document)
+            batch_tokens += tokens
+
+        if batch:
+            yield batch
+
+    def _index_batch(self, batch: List[Document]):
+        ids = [document.metadata["_id"] for document in batch]
+        self.search_service.vector_store.add_documents(batch, ids=ids)
+        self.collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": ObjectId(_id)},
+                    {"$set": {
+                        "embedding": True,
+                        "embedding_version": self.VERSION,
+                        "embedding_store": self.store_id,
+                        "metadata_version": self.METADATA_VERSION,
+                    }}
+                )
+                for _id in ids
+            ],
+            ordered=False
+        )
+
+    def index_studies(self, docs: List[dict]):
+        """
+        Embeds the given studies right away (e.g. one just created), outside of the scheduled run.
+        """
+        for batch in self._batches(iter(docs)):
+            self._index_batch(batch)
+
+    def refresh_metadata(self) -> int:
+        """
+        Rewrites the vector metadata of the embedded studies whose metadata_version is behind, without
+        embedding them again.
+
+        Returns:
+            int: How many studies got their metadata rewritten.
+        """
+        pending = self.collection.count_documents(self.metadata_pending_query)
+        if not pending:
+            return 0
+
+        logger.info(f"Vector metadata refresh started, {pending} studies pending")
+        projection = {"Location": 1, **{field: 1 for field in self.METADATA_FIELDS}}
+        refreshed, total = [], 0
+        for doc in self.collection.find(self.metadata_pending_query, projection):
+            try:
+                update_vector_metadata(self.search_service.vector_store, str(doc["_id"]), self.build_metadata(doc))
+                refreshed.append(doc["_id"])
+                total += 1
+            except Exception as e:
+                # left behind, the next run retries it
+                logger.error(f"Vector metadata refresh of {doc['_id']} failed: {e}")
+
+            if len(refreshed) >= self.max_batch_size:
+                self._flag_metadata(refreshed)
+                refreshed = []
+        if refreshed:
+            self._flag_metadata(refreshed)
+
+        return total
+
+    def _flag_metadata(self, ids: list):
+        self.collection.bulk_write(
+            [UpdateOne({"_id": _id}, {"$set": {"metadata_version": self.METADATA_VERSION}}) for _id in ids],
+            ordered=False
+        )
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Embeds every pending study in token-budgeted batches, upserting each batch with a single
+        vector store call and flagging it with a single bulk_write, then refreshes the metadata of
+        the studies embedded under an older METADATA_VERSION.
+
+        Returns:
+            dict: Counters of the run (pending, indexed, failed, batches and metadata_refreshed).
+        """
+        pending = self.collection.count_documents(self.pending_query)
+        summary = {"pending": pending, "indexed": 0, "failed": 0, "batches": 0, "metadata_refreshed": 0}
+        if pending:
+            self._embed_pending(pending, summary)
+        summary["metadata_refreshed"] = self.refresh_metadata()
+        return summary
+
+    def _embed_pending(self, pending: int, summary: Dict[str, Any]):
+        logger.info(f"Embedding indexer started, {pending} studies pending")
+        for batch in self._batches(self.collection.find(self.pending_query)):
+            summary["batches"] += 1
+            for attempt in range(1, self.max_retries + 1):
+                try:
+                    self._index_batch(batch)
+                    summary["indexed"] += len(batch)
+                    break
+                except Exception as e:
+                    if attempt == self.max_retries:
+                        # left unflagged, the next run picks these studies up again
+                        logger.error(f"Embedding batch of {len(batch)} studies failed after {attempt} attempts: {e}")
+                        summary["failed"] += len(batch)
+                    else:
+                        time.sleep(2 ** attempt)
+
+            logger.info(f"Embedding indexer progress: {summary['indexed'] + summary['failed']}/{pending}")
@@ -0,0 +1,183 @@
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class IngestionPipeline:
+    """
+    Producer/consumer pipeline for the local_studies ingestion: one fetcher thread follows the CT api nextPageToken
+    (download + json decode) while a pool of writers runs the bulk writes, so the network and Mongo work at the same time.
+    The queue between them is bounded, so a slow Mongo holds the fetcher back instead of piling pages up in memory.
+
+    With writers=0 the pages are fetched and written one after another in the calling thread, like before.
+
+    Writers finish pages out of order, so checkpoints only move over the contiguous prefix of written pages: the token
+    handed to on_checkpoint is always one from which nothing was skipped.
+    """
+    def __init__(
+        self,
+        fetch_page: Callable[[Optional[str]], Tuple[List[Dict[str, Any]], Optional[str], int]],
+        write_page: Callable[[List[Dict[str, Any]]], Dict[str, int]],
+        writers: int = 2,
+        queue_size: int = 4
+    ):
+        """
+        Args:
+            fetch_page (callable): Fetches the page of a token (None for the first one) and returns its studies,
+                the next token and the size of the response in bytes.
+            write_page (callable): Stores the studies of a page and returns counters to add up over the run, with at least
+                "documents" (how many studies it handled).
+            writers (int): The number of writer threads.
+            queue_size (int): How many fetched pages can wait for a writer.
+        """
+        self.fetch_page = fetch_page
+        self.write_page = write_page
+        self.writers = writers
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._checkpoint_lock = threading.Lock()
+
+    def _new_metrics(self) -> Dict[str, float]:
+        return {
+            "pages": 0, "documents": 0, "bytes": 0,
+            "fetch_seconds": 0.0, "write_seconds": 0.0, "fetcher_blocked_seconds": 0.0, "max_queue_depth": 0,
+        }
+
+    def _add(self, metrics: Dict[str, float], **values):
+        with self._lock:
+            for name, value in values.items():
+                metrics[name] = metrics.get(name, 0) + value
+
+    @staticmethod
+    def _rates(metrics: Dict[str, float], elapsed: float) -> Dict[str, float]:
+        metrics["seconds"] = round(elapsed, 3)
+        for name in ("fetch_seconds", "write_seconds", "fetcher_blocked_seconds"):
+            metrics[name] = round(metrics[name], 3)
+        elapsed = elapsed or 1e-9
+        metrics["pages_per_second"] = round(metrics["pages"] / elapsed, 2)
+        metrics["documents_per_second"] = round(metrics["documents"] / elapsed, 2)
+        metrics["bytes_per_second"] = round(metrics["bytes"] / elapsed, 2)
+        return metrics
+
+    def _fetch(self, page_token: Optional[str], metrics: Dict[str, float]):
+        started = time.perf_counter()
+        studies, next_token, size = self.fetch_page(page_token)
+        self._add(metrics, pages=1, bytes=size, fetch_seconds=time.perf_counter() - started)
+        return studies, next_token
+
+    def _write(self, studies: List[Dict[str, Any]], metrics: Dict[str, float]) -> Dict[str, int]:
+        started = time.perf_counter()
+        counts = self.write_page(studies)
+        self._add(metrics, write_seconds=time.perf_counter() - started, **counts)
+        return counts
+
+    def _commit(self, sequence: int, next_token: Optional[str], counts: Dict[str, int], progress: Dict[str, Any], on_checkpoint):
+        """
+        Records a written page and, when it extends the contiguous run of written pages, checkpoints after it.
+        """
+        with self._checkpoint_lock:
+            progress["done"][sequence] = (next_token, counts)
+            advanced = False
+            while progress["next"] in progress["done"]:
+                token, page_counts = progress["done"].pop(progress["next"])
+                progress["token"] = token
+                progress["committed"]["pages"] = progress["committed"].get("pages", 0) + 1
+                for name, value in page_counts.items():
+                    progress["committed"][name] = progress["committed"].get(name, 0) + value
+                progress["next"] += 1
+                advanced = True
+            if advanced and on_checkpoint:
+                on_checkpoint(progress["token"], dict(progress["committed"]))
+
+    def run(self, start_token: Optional[str] = None, on_checkpoint: Optional[Callable[[Optional[str], Dict[str, int]], None]] = None) -> Dict[str, float]:
+        """
+        Fetches and writes every page.
+
+        Args:
+            start_token (str): The page to start from (a checkpoint of an interrupted run), None for the first page.
+            on_checkpoint (callable): Called with the token of the next page to fetch (None once the last one is written)
+                and the counters of the pages written so far, every time the written prefix grows.
+        Returns:
+            dict: Pages, documents and bytes, the busy time of each stage, and pages/s, documents/s and bytes/s over the run.
+        Raises:
+            Exception: The first error of the fetcher or of a writer, once every thread stopped.
+        """
+        metrics = self._new_metrics()
+        started = time.perf_counter()
+        progress = {"next": 0, "done": {}, "token": start_token, "committed": {}}
+
+        if self.writers < 1:
+            page_token = start_token
+            sequence = 0
+            while True:
+                studies, page_token = self._fetch(page_token, metrics)
+                self._commit(sequence, page_token, self._write(studies, metrics), progress, on_checkpoint)
+                sequence += 1
+                if not page_token:
+                    break
+            return self._rates(metrics, time.perf_counter() - started)
+
+        pages = queue.Queue(maxsize=self.queue_size)
+        stop = threading.Event()
+        errors = []
+
+        def put(item) -> bool:
+            waited = time.perf_counter()
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                except queue.Full:
+                    continue
+                self._add(metrics, fetcher_blocked_seconds=time.perf_counter() - waited)
+                with self._lock:
+                    metrics["max_queue_depth"] = max(metrics["max_queue_depth"], pages.qsize())
+                return True
+            return False
+
+        def fetcher():
+            page_token = start_token
+            sequence = 0
+            try:
+                while not stop.is_set():
+                    studies, page_token = self._fetch(page_token, metrics)
+                    if not put((sequence, studies, page_token)) or not page_token:
+                        break
+                    sequence += 1
+            except Exception as e:
+                errors.append(e)
+                stop.set()
+            finally:
+                for _ in range(self.writers):
+                    put(_DONE)
+
+        def writer():
+            while not stop.is_set():
+                try:
+                    item = pages.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    return
+                sequence, studies, next_token = item
+                try:
+                    self._commit(sequence, next_token, self._write(studies, metrics), progress, on_checkpoint)
+                except Exception as e:
+                    errors.append(e)
+                    stop.set()
+
+        threads = [threading.Thread(target=fetcher, name="ingestion-fetcher", daemon=True)]
+        threads += [threading.Thread(target=writer, name=f"ingestion-writer-{i}", daemon=True) for i in range(self.writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+        return self._rates(metrics, time.perf_counter() - started)
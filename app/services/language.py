@@ -0,0 +1,57 @@
+import re
+from typing import Optional
+
+# offline detector for the two languages the platform translates between. it only answers when the evidence is clear,
+# anything ambiguous (short queries like "Breast cancer", drug names, codes) returns None and is sent to the api as before
+
+STOPWORDS = {
+    "pt": {
+        "a", "ao", "aos", "as", "com", "como", "da", "das", "de", "do", "dos", "e", "ela", "ele", "em", "entre",
+        "essa", "esse", "esta", "este", "foi", "há", "isso", "já", "mais", "mas", "na", "nas", "no", "nos", "não",
+        "o", "os", "ou", "para", "pela", "pelo", "por", "que", "se", "sem", "ser", "seu", "sua", "são", "também",
+        "um", "uma", "à", "é", "estudo", "pacientes", "tratamento", "doença", "anos",
+    },
+    "en": {
+        "a", "an", "and", "are", "as", "at", "be", "been", "by", "for", "from", "has", "have", "in", "into", "is",
+        "it", "its", "not", "of", "on", "or", "that", "the", "their", "this", "to", "was", "were", "which", "will",
+        "with", "who", "study", "patients", "treatment", "disease", "years",
+    },
+}
+# letters that don't occur in english text
+PT_CHARACTERS = set("ãõçâêôáíóúà")
+
+MIN_EVIDENCE = 2
+
+_WORD = re.compile(r"[^\W\d_]+", re.UNICODE)
+
+
+def language_scores(text: str) -> dict:
+    """
+    How many pieces of evidence the text has for each language: stopwords, plus words with portuguese-only letters.
+    """
+    scores = {language: 0 for language in STOPWORDS}
+    for word in _WORD.findall(text.lower()):
+        for language, stopwords in STOPWORDS.items():
+            if word in stopwords:
+                scores[language] += 1
+        if PT_CHARACTERS.intersection(word):
+            scores["pt"] += 1
+    return scores
+
+def detect_language(text: str) -> Optional[str]:
+    """
+    Detects whether a text is in portuguese or english.
+
+    Args:
+        text (str): The text to classify.
+    Returns:
+        str: 'pt' or 'en', or None when the text doesn't have enough evidence for either.
+    """
+    if not text or not text.strip():
+        return None
+
+    scores = language_scores(text)
+    (best, best_score), (_, runner_up) = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    if best_score < MIN_EVIDENCE or best_score < 2 * runner_up:
+        return None
+    return best
@@ -0,0 +1,124 @@
+import os
+import uuid
+import socket
+import logging
+import threading
+from typing import Callable, Optional
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """
+    A named lease in the leases collection, held by one process of the fleet at a time until it stops renewing it.
+    Expiry is computed and compared with the Mongo server clock ($$NOW), so clock skew between hosts doesn't matter.
+    """
+    def __init__(self, db, name: str, ttl_seconds: int = None, holder: str = None):
+        self.collection = db["leases"]
+        self.name = name
+        self.ttl_seconds = ttl_seconds or Config.SCHEDULER_LEASE_TTL_SECONDS
+        self.holder = holder or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+    def acquire(self) -> bool:
+        """
+        Takes the lease if it is free or expired, or renews it if this process already holds it.
+
+        Returns:
+            bool: Whether this process holds the lease now.
+        """
+        try:
+            lease = self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"holder": self.holder}, {"$expr": {"$lt": ["$expires_at", "$$NOW"]}}]},
+                [{"$set": {
+                    "holder": self.holder,
+                    "renewed_at": "$$NOW",
+                    "expires_at": {"$add": ["$$NOW", self.ttl_seconds * 1000]},
+                }}],
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # the lease exists and someone else holds it, so the upsert collided with it
+            return False
+        return lease is not None and lease.get("holder") == self.holder
+
+    def current_holder(self) -> Optional[str]:
+        """
+        The holder of the lease while it is live, None when it is free or expired.
+        """
+        lease = self.collection.find_one({"_id": self.name, "$expr": {"$gte": ["$expires_at", "$$NOW"]}})
+        return lease.get("holder") if lease else None
+
+    def held_by_another_host(self) -> bool:
+        holder = self.current_holder()
+        # holders are "<hostname>:<pid>:<nonce>", the processes of one host share its files
+        return holder is not None and holder.split(":", 1)[0] != socket.gethostname()
+
+    def release(self):
+        self.collection.delete_one({"_id": self.name, "holder": self.holder})
+
+
+class LeaderElector:
+    """
+    Keeps trying to take (and then renews) a LeaderLease from a background thread, and calls on_elected / on_demoted
+    when this process gains or loses it. A process that can't reach Mongo steps down, since its lease will expire anyway.
+    """
+    def __init__(self, lease: LeaderLease, on_elected: Callable[[], None], on_demoted: Callable[[], None], interval: float = None):
+        self.lease = lease
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        # renewing a few times per ttl, so one slow renewal doesn't lose the lease
+        self.interval = interval or max(self.lease.ttl_seconds / 3, 1)
+        self.is_leader = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def step(self):
+        try:
+            acquired = self.lease.acquire()
+        except Exception as e:
+            logger.error(f"Error renewing the {self.lease.name} lease: {e}")
+            acquired = False
+
+        if acquired and not self.is_leader:
+            try:
+                self.on_elected()
+            except Exception as e:
+                # a leader that can't run the jobs gives the lease back, so this or another process retries
+                logger.error(f"Error taking over as the {self.lease.name} leader: {e}")
+                self.on_demoted()
+                self.lease.release()
+                return
+            self.is_leader = True
+            logger.info(f"{self.lease.holder} is now the {self.lease.name} leader")
+        elif not acquired and self.is_leader:
+            self.is_leader = False
+            logger.info(f"{self.lease.holder} lost the {self.lease.name} lease")
+            self.on_demoted()
+
+    def _run(self):
+        while True:
+            try:
+                self.step()
+            except Exception as e:
+                logger.error(f"Error in the {self.lease.name} leader election: {e}")
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"{self.lease.name}-leader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        if self.is_leader:
+            self.is_leader = False
+            try:
+                self.lease.release()
+            except Exception as e:
+                logger.error(f"Error releasing the {self.lease.name} lease: {e}")
@@ -0,0 +1,273 @@
+import re
+import math
+import hashlib
+import logging
+import threading
+import unicodedata
+from array import array
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from app.services.geo import normalize_place
+from app.services.language import STOPWORDS
+from app.services.vector_store import matches_filter
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = STOPWORDS["en"] | STOPWORDS["pt"]
+
+LOCAL_PROJECTION = {
+    "_id": 0,
+    "protocolSection.identificationModule.nctId": 1,
+    "protocolSection.identificationModule.briefTitle": 1,
+    "protocolSection.identificationModule.officialTitle": 1,
+    "protocolSection.conditionsModule.conditions": 1,
+    "protocolSection.conditionsModule.keywords": 1,
+    "protocolSection.descriptionModule.briefSummary": 1,
+    "protocolSection.contactsLocationsModule.locations.city": 1,
+    "protocolSection.contactsLocationsModule.locations.state": 1,
+    "protocolSection.contactsLocationsModule.locations.country": 1,
+}
+PLATFORM_PROJECTION = {
+    "Title": 1, "Conditions": 1, "Keywords": 1, "Description": 1, "Location": 1, "sub_status": 1,
+}
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return [token for token in _TOKEN.findall(text) if len(token) > 1 and token not in _STOPWORDS]
+
+def _places(locations: List[Dict[str, Any]], city: str, state: str, country: str) -> Dict[str, List[str]]:
+    places = {}
+    for key, field in (("cities", city), ("states", state), ("countries", country)):
+        values = sorted({normalize_place(loc.get(field)) for loc in locations if isinstance(loc, dict) and loc.get(field)})
+        if values:
+            places[key] = values
+    return places
+
+
+class LexicalIndex:
+    """
+    In-process BM25 index over the local corpus: the local_studies mirror (keyed by NCT id) and the accepted
+    platform studies (keyed by their mongo id). It feeds the lexical half of the hybrid search.
+
+    Postings are compact typed arrays per term (uint32 doc numbers, uint16 term frequencies), appended to as documents
+    come in. A changed or removed document is tombstoned instead of rewriting the postings, and the arrays are
+    compacted once tombstones pile up. sync() is incremental, so it can run after every ingestion.
+    """
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+        self.synced_until = None
+
+    def _reset(self):
+        self.terms = {}
+        self.postings_docs = []
+        self.postings_tfs = []
+        self.keys = []
+        self.doc_lengths = array("I")
+        self.live = bytearray()
+        self.metadata = []
+        self.fingerprints = {}
+        self.total_length = 0
+        self.live_count = 0
+
+    def __len__(self) -> int:
+        return self.live_count
+
+    def add(self, key: str, text: str, metadata: Optional[Dict[str, Any]] = None) -> bool:
+        """
+        Indexes (or re-indexes) a document. Returns False when the document was already indexed with the same content.
+        """
+        metadata = metadata or {}
+        fingerprint = hashlib.sha1(f"{text}\0{sorted(metadata.items())}".encode("utf-8")).hexdigest()
+        with self._lock:
+            current = self.fingerprints.get(key)
+            if current and current[1] == fingerprint:
+                return False
+            if current:
+                self._tombstone(current[0])
+
+            tokens = tokenize(text)
+            doc = len(self.keys)
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, frequency in frequencies.items():
+                term = self.terms.get(token)
+                if term is None:
+                    term = self.terms[token] = len(self.postings_docs)
+                    self.postings_docs.append(array("I"))
+                    self.postings_tfs.append(array("H"))
+                self.postings_docs[term].append(doc)
+                self.postings_tfs[term].append(min(frequency, 65535))
+
+            self.keys.append(key)
+            self.doc_lengths.append(len(tokens))
+            self.live.append(1)
+            self.metadata.append(metadata)
+            self.fingerprints[key] = (doc, fingerprint)
+            self.total_length += len(tokens)
+            self.live_count += 1
+            return True
+
+    def remove(self, key: str):
+        with self._lock:
+            current = self.fingerprints.pop(key, None)
+            if current:
+                self._tombstone(current[0])
+
+    def _tombstone(self, doc: int):
+        self.live[doc] = 0
+        self.total_length -= self.doc_lengths[doc]
+        self.live_count -= 1
+        dead = len(self.keys) - self.live_count
+        if dead > max(1000, len(self.keys) // 5):
+            self._compact()
+
+    def _compact(self):
+        """
+        Drops the tombstoned documents from every postings array and renumbers the live ones.
+        """
+        live = np.frombuffer(bytes(self.live), dtype=np.uint8).astype(bool)
+        renumber = np.cumsum(live) - 1
+        for term in range(len(self.postings_docs)):
+            docs = np.array(self.postings_docs[term], dtype=np.uint32)
+            keep = live[docs]
+            self.postings_docs[term] = array("I", renumber[docs[keep]].astype(np.uint32).tobytes())
+            self.postings_tfs[term] = array("H", np.array(self.postings_tfs[term], dtype=np.uint16)[keep].tobytes())
+
+        self.keys = [key for key, alive in zip(self.keys, live) if alive]
+        self.metadata = [metadata for metadata, alive in zip(self.metadata, live) if alive]
+        self.doc_lengths = array("I", np.array(self.doc_lengths, dtype=np.uint32)[live].tobytes())
+        self.live = bytearray(b"\x01" * len(self.keys))
+        self.fingerprints = {key: (doc, self.fingerprints[key][1]) for doc, key in enumerate(self.keys)}
+
+    def search(self, query: str, k: int = 10, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """
+        Ranks the documents against the query with BM25.
+
+        Args:
+            query (str): The query text (english, like the indexed corpus).
+            k (int): The number of results to return.
+            filter (dict): A metadata filter in the vector store syntax, e.g. SearchService._location_filter.
+        Returns:
+            list: (key, score) pairs, best first.
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            if not terms or not self.live_count:
+                return []
+            n = len(self.keys)
+            average_length = self.total_length / self.live_count
+            doc_lengths = np.array(self.doc_lengths, dtype=np.float32)
+            scores = np.zeros(n, dtype=np.float32)
+            for token in terms:
+                term = self.terms.get(token)
+                if term is None:
+                    continue
+                docs = np.array(self.postings_docs[term], dtype=np.int64)
+                tfs = np.array(self.postings_tfs[term], dtype=np.float32)
+                idf = math.log(1 + (self.live_count - len(docs) + 0.5) / (len(docs) + 0.5))
+                norm = self.k1 * (1 - self.b + self.b * doc_lengths[docs] / average_length)
+                scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+            scores *= np.frombuffer(bytes(self.live), dtype=np.uint8)
+
+            candidates = np.nonzero(scores)[0]
+            if not filter and len(candidates) > k:
+                candidates = candidates[np.argpartition(-scores[candidates], k - 1)[:k]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            results = []
+            for doc in candidates:
+                if filter and not matches_filter(self.metadata[doc], filter):
+                    continue
+                results.append((self.keys[doc], float(scores[doc])))
+                if len(results) == k:
+                    break
+            return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": self.live_count,
+                "tombstones": len(self.keys) - self.live_count,
+                "terms": len(self.terms),
+                "postings": sum(len(postings) for postings in self.postings_docs),
+                "synced_until": self.synced_until.isoformat() if self.synced_until else None,
+            }
+
+    @staticmethod
+    def local_entry(doc: Dict[str, Any]) -> Tuple[Optional[str], str, Dict[str, Any]]:
+        protocol = doc.get("protocolSection", {})
+        identification = protocol.get("identificationModule", {})
+        conditions = protocol.get("conditionsModule", {})
+        text = " ".join(filter(None, [
+            identification.get("briefTitle") or identification.get("officialTitle"),
+            " ".join(conditions.get("conditions", [])),
+            " ".join(conditions.get("keywords", [])),
+            protocol.get("descriptionModule", {}).get("briefSummary"),
+        ]))
+        locations = protocol.get("contactsLocationsModule", {}).get("locations", [])
+        return identification.get("nctId"), text, _places(locations, "city", "state", "country")
+
+    @staticmethod
+    def platform_entry(doc: Dict[str, Any]) -> Tuple[str, str, Dict[str, Any]]:
+        text = " ".join(filter(None, [
+            doc.get("Title"),
+            " ".join(doc.get("Conditions") or []),
+            " ".join(doc.get("Keywords") or []),
+            doc.get("Description"),
+        ]))
+        return str(doc["_id"]), text, _places(doc.get("Location") or [], "City", "State", "Country")
+
+    def sync(self, db) -> Dict[str, int]:
+        """
+        Brings the index up to date: local_studies written since the last sync (by their last_updated stamp) and
+        every platform study, which are few, so that approvals and rejections are picked up too.
+
+        Returns:
+            dict: How many documents were added or changed, and removed.
+        """
+        started = datetime.now()
+        summary = {"indexed": 0, "removed": 0}
+
+        query = {}
+        if self.synced_until is not None:
+            # overlaps the previous sync, re-adding an unchanged study is a no-op
+            query = {"last_updated": {"$gt": self.synced_until - timedelta(minutes=5)}}
+        for doc in db["local_studies"].find(query, LOCAL_PROJECTION):
+            key, text, metadata = self.local_entry(doc)
+            if key and self.add(key, text, metadata):
+                summary["indexed"] += 1
+
+        for doc in db["studies"].find({}, PLATFORM_PROJECTION):
+            key, text, metadata = self.platform_entry(doc)
+            if doc.get("sub_status") == "accepted":
+                if self.add(key, text, metadata):
+                    summary["indexed"] += 1
+            elif key in self.fingerprints:
+                self.remove(key)
+                summary["removed"] += 1
+
+        self.synced_until = started
+        logger.info(f"Lexical index synced: {summary['indexed']} indexed, {summary['removed']} removed, {self.live_count} documents")
+        return summary
+
+
+_lexical_index = None
+_lexical_index_lock = threading.Lock()
+
+def get_lexical_index() -> LexicalIndex:
+    """
+    Returns the LexicalIndex shared by the whole process (the search service and the scheduler jobs).
+    """
+    global _lexical_index
+    if _lexical_index is None:
+        with _lexical_index_lock:
+            if _lexical_index is None:
+                _lexical_index = LexicalIndex()
+    return _lexical_index
@@ -0,0 +1,248 @@
+import re
+from typing import Optional, List, Dict, Any, Tuple
+from app.core.cache import TTLCache
+from app.core.config import Config
+from app.services.eligibility import age_query
+from app.services.geo import EARTH_RADIUS_KM, get_gazetteer, haversine_km, normalize_place
+
+
+BRAZILIAN_STATES = {
+    "AC", "AL", "AP", "AM", "BA", "CE", "DF", "ES", "GO", "MA", "MT", "MS", "MG", "PA",
+    "PB", "PR", "PE", "PI", "RJ", "RN", "RS", "RO", "RR", "SC", "SP", "SE", "TO"
+}
+# abbreviations that are also US states ("Boston, MA"), these alone don't make a location brazilian
+AMBIGUOUS_STATES = {"AL", "MA", "MS", "MT", "PA", "SC"}
+
+_WORD = re.compile(r"\w+")
+
+
+def _terms(text: Optional[str]) -> List[str]:
+    return _WORD.findall(normalize_place(text))
+
+def search_keys(study: Dict[str, Any]) -> Dict[str, Dict[str, List[str]]]:
+    """
+    Normalized (lowercased, accent-free) copies of the fields searched by name, stored with each mirrored study at
+    ingestion: the city names whole, the intervention, sponsor and organization names as words. build_query matches
+    them with equality on multikey indexes instead of case-insensitive regexes, which can't use an index.
+    """
+    protocol = study.get("protocolSection", {})
+    locations = protocol.get("contactsLocationsModule", {}).get("locations", [])
+    interventions = protocol.get("armsInterventionsModule", {}).get("interventions", [])
+    sponsor = protocol.get("sponsorCollaboratorsModule", {}).get("leadSponsor", {}).get("name")
+    organization = protocol.get("identificationModule", {}).get("organization", {}).get("fullName")
+    return {"search_keys": {
+        "cities": sorted({normalize_place(location.get("city")) for location in locations if location.get("city")}),
+        "interventions": sorted({term for intervention in interventions for term in _terms(intervention.get("name"))}),
+        "sponsor": sorted(set(_terms(sponsor))),
+        "organization": sorted(set(_terms(organization))),
+    }}
+
+
+class LocalSearchService:
+    """
+    Query engine over the local_studies mirror kept by DataService.fetch_and_store_studies.
+    It turns the PacienteSearch/MedicoSearch fields into indexed Mongo queries, so Brazil-scoped
+    searches don't need to go to clinicaltrials.gov at all.
+    """
+    STD_AGES = {
+        "child": "CHILD",
+        "adult": "ADULT",
+        "senior": "OLDER_ADULT"
+    }
+    PHASES = {"NA", "EARLY_PHASE1", "PHASE1", "PHASE2", "PHASE3", "PHASE4"}
+    STUDY_TYPES = {"EXPANDED_ACCESS", "INTERVENTIONAL", "OBSERVATIONAL"}
+    # the fields matched by text or by place, everything else in the search fields is a structured filter
+    TEXT_AND_PLACE_FIELDS = {"condition", "title", "keywords", "location", "radius_km"}
+
+    def __init__(self, db, gazetteer=None):
+        self.db = db
+        self.collection = self.db["local_studies"]
+        self.gazetteer = gazetteer or get_gazetteer()
+        self._availability = TTLCache(maxsize=1, ttl=Config.LOCAL_SEARCH_AVAILABILITY_TTL)
+
+    @staticmethod
+    def is_brazil_scoped(location: Optional[str]) -> bool:
+        """
+        Whether a location typed by the user is inside Brazil: it names the country, or ends with a state abbreviation ("Recife, PE").
+        """
+        if not location:
+            return False
+        parts = [part.strip() for part in location.split(",") if part.strip()]
+        if any(part.lower() in ("brazil", "brasil") for part in parts):
+            return True
+        return len(parts) > 1 and parts[-1].upper() in BRAZILIAN_STATES - AMBIGUOUS_STATES
+
+    @staticmethod
+    def location_city(location: Optional[str]) -> Optional[str]:
+        """
+        The city part of the location, or None when the user only typed the country.
+        """
+        if not location:
+            return None
+        city = location.split(",")[0].strip()
+        if city.lower() in ("brazil", "brasil"):
+            return None
+        return city
+
+    def geo_center(self, data_dict: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+        """
+        The (latitude, longitude) of a radius search, or None when there is no radius or the city is not in the gazetteer
+        (the location is then matched by its city name, as without a radius).
+        """
+        if not data_dict.get("radius_km"):
+            return None
+        return self.gazetteer.resolve(data_dict.get("location"))
+
+    def is_available(self) -> bool:
+        """
+        The mirror is only trusted once a full ingestion has been recorded. The answer is cached for a short while,
+        so searches don't pay a round trip for it.
+        """
+        available = self._availability.get("available")
+        if available is None:
+            available = self.db["metadata"].find_one({"_id": "data_timestamp"}, {"_id": 1}) is not None
+            self._availability.set("available", available)
+        return available
+
+    def should_serve(self, data_dict: Dict[str, Any]) -> bool:
+        if not Config.LOCAL_SEARCH_ENABLED:
+            return False
+        # the gazetteer only has brazilian cities, so a geocoded radius search is brazil scoped too
+        scoped = self.is_brazil_scoped(data_dict.get("location")) or self.geo_center(data_dict) is not None
+        return scoped and self.is_available()
+
+    @staticmethod
+    def _text_search(data_dict: Dict[str, Any]) -> Optional[str]:
+        # a quoted condition is matched as a phrase, the other terms only add to the score
+        terms = []
+        if data_dict.get("condition"):
+            terms.append(f'"{data_dict["condition"]}"')
+        for field in ("title", "keywords"):
+            if data_dict.get(field):
+                terms.append(data_dict[field])
+        return " ".join(terms) or None
+
+    @staticmethod
+    def _all_terms(query: Dict[str, Any], field: str, value: str):
+        # every word of the value, in any order (e.g. "pfizer" matches "Pfizer Inc.")
+        terms = sorted(set(_terms(value)))
+        if terms:
+            query[f"search_keys.{field}"] = {"$all": terms}
+
+    def build_query(self, data_dict: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Translates the search fields into a Mongo query over the raw CT records.
+
+        Args:
+            data_dict (dict): The search fields (already translated to english), as dumped from PacienteSearch or MedicoSearch.
+        Returns:
+            dict: The Mongo query.
+        """
+        query = {}
+
+        text_search = self._text_search(data_dict)
+        if text_search:
+            query["$text"] = {"$search": text_search}
+
+        if data_dict.get("status"):
+            query["protocolSection.statusModule.overallStatus"] = {"$in": list(data_dict["status"])}
+
+        center = self.geo_center(data_dict)
+        city = self.location_city(data_dict.get("location"))
+        if center:
+            # answered by the 2dsphere index on the geocoded sites
+            query["geo"] = {"$geoWithin": {"$centerSphere": [[center[1], center[0]], data_dict["radius_km"] / EARTH_RADIUS_KM]}}
+        elif city:
+            query["search_keys.cities"] = normalize_place(city)
+
+        if data_dict.get("intervention"):
+            self._all_terms(query, "interventions", data_dict["intervention"])
+
+        if data_dict.get("sponsor"):
+            self._all_terms(query, "sponsor", data_dict["sponsor"])
+
+        sex = data_dict.get("sex")
+        if sex and sex.lower() != "all":
+            query["protocolSection.eligibilityModule.sex"] = {"$in": [sex.upper(), "ALL"]}
+
+        if data_dict.get("ageYears") is not None:
+            query.update(age_query(data_dict["ageYears"]))
+        elif data_dict.get("age") in self.STD_AGES:
+            query["protocolSection.eligibilityModule.stdAges"] = self.STD_AGES[data_dict["age"]]
+
+        if data_dict.get("studyPhase") in self.PHASES:
+            query["protocolSection.designModule.phases"] = data_dict["studyPhase"]
+
+        if data_dict.get("studyType") in self.STUDY_TYPES:
+            query["protocolSection.designModule.studyType"] = data_dict["studyType"]
+
+        if data_dict.get("acceptsHealthyVolunteers") is not None:
+            query["protocolSection.eligibilityModule.healthyVolunteers"] = data_dict["acceptsHealthyVolunteers"]
+
+        if data_dict.get("hasResults") is not None:
+            query["hasResults"] = data_dict["hasResults"]
+
+        if data_dict.get("organization"):
+            self._all_terms(query, "organization", data_dict["organization"])
+
+        if data_dict.get("studyId"):
+            query["protocolSection.identificationModule.nctId"] = data_dict["studyId"].strip().upper()
+
+        return query
+
+    def filter_query(self, data_dict: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        build_query with only the structured filters (status, sex, age, phase, type...), for studies that were already
+        matched by text and place somewhere else, like the lexical index hits.
+        """
+        return self.build_query({key: value for key, value in data_dict.items() if key not in self.TEXT_AND_PLACE_FIELDS})
+
+    def search(self, data_dict: Dict[str, Any], target_page: int, page_size: int) -> Tuple[Optional[List[Dict[str, Any]]], int]:
+        """
+        Runs the search against the mirror.
+
+        Args:
+            data_dict (dict): The search fields (already translated to english).
+            target_page (int): The page number to retrieve.
+            page_size (int): The number of results per page.
+        Returns:
+            tuple: The raw CT records of the page (None if the page is out of range) and the total number of matching studies.
+        """
+        query = self.build_query(data_dict)
+        total_studies = self.collection.count_documents(query)
+        if total_studies == 0 or (target_page - 1) * page_size >= total_studies:
+            return None, total_studies
+
+        projection = {"_id": 0}
+        if "$text" in query:
+            projection["score"] = {"$meta": "textScore"}
+            sort = [("score", {"$meta": "textScore"})]
+        else:
+            sort = [("protocolSection.identificationModule.nctId", 1)]
+
+        cursor = (
+            self.collection.find(query, projection)
+            .sort(sort)
+            .skip((target_page - 1) * page_size)
+            .limit(page_size)
+        )
+        studies = list(cursor)
+
+        center = self.geo_center(data_dict)
+        if center:
+            for study in studies:
+                self._keep_nearby_locations(study, center, data_dict["radius_km"])
+        return studies, total_studies
+
+    def _keep_nearby_locations(self, study: Dict[str, Any], center: Tuple[float, float], radius_km: float):
+        """
+        Narrows the locations of a matched study to its sites within the radius, like filter_by_location does for a city.
+        """
+        contacts_locations = study.get("protocolSection", {}).get("contactsLocationsModule", {})
+        nearby = []
+        for location in contacts_locations.get("locations", []):
+            point = self.gazetteer.location_point(location)
+            if point is not None and haversine_km(center, point) <= radius_km:
+                nearby.append(location)
+        if nearby:
+            contacts_locations["locations"] = nearby
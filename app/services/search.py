@@ -1,40 +1,126 @@
 import os
-import json
+import copy
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from typing import Optional, List, Dict, Any
 import pymongo
 import requests
 from pinecone import Pinecone
-from flask import current_app
+from flask import current_app, g, has_app_context
 from bson import ObjectId
 from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
-from langchain_core.documents import Document
 from app.schemas.search import PacienteSearch
 from app.schemas.search import MedicoSearch
 from app.services.translate import TranslateService
+from app.services.local_search import LocalSearchService
+from app.services.study_translation import StudyTranslationStore
+from app.services.embeddings import CachedEmbeddings
+from app.services.vector_store import PINECONE_INDEX_NAME, create_vector_store
+from app.services.lexical import get_lexical_index
+from app.services.snapshots import SearchSnapshotStore
+from app.services.geo import get_gazetteer, normalize_place
+from app.services.eligibility import age_expression, age_query, matches_age
+from app.core.cache import TTLCache, SingleFlight
+from app.core.config import Config
+from app.core.upstream import get_upstream_client
 
 load_dotenv()
 
+# the parts of a CT api study read by filter_studies. _paginate_results asks the api for these fields only,
+# so the two are generated from the same definition and can't drift apart
+STUDY_MODULES = (
+    "identificationModule",
+    "descriptionModule",
+    "armsInterventionsModule",
+    "sponsorCollaboratorsModule",
+    "contactsLocationsModule",
+    "conditionsModule",
+    "eligibilityModule",
+    "statusModule",
+    "designModule",
+)
+STUDY_TOP_LEVEL_FIELDS = ("hasResults",)
+STUDY_FIELDS = ",".join([f"protocolSection.{module}" for module in STUDY_MODULES] + list(STUDY_TOP_LEVEL_FIELDS))
+
 class SearchService:
     def __init__(self, translate_service = None):
-        self.translate_service = translate_service or TranslateService()
+        self._lock = threading.RLock()
+        self._translate_service = translate_service
+        self._embeddings_model = None
+        self._pinecone_index = None
+        self._vector_store = None
         self.BASE_URL = "https://clinicaltrials.gov/api/v2/studies"
+        self.VERSION_URL = "https://clinicaltrials.gov/api/v2/version"
+        self.EMBEDDING_MODEL = "text-embedding-3-large"
+        self._last_data_timestamp = None
         self.AGE_MAPPING = {
         "child": ("0 years", "17 years"),
         "adult": ("18 years", "64 years"),
         "senior": ("65 years", "200 years")
         }
-        self.embeddings_model = OpenAIEmbeddings(model="text-embedding-3-large")
+        self.http = get_upstream_client()
         self.db = current_app.mongo 
         self.collection = self.db.studies
+        self.local_search = LocalSearchService(self.db)
+        self.study_translations = StudyTranslationStore(self.db)
+        self.lexical_index = get_lexical_index()
+        self.snapshots = SearchSnapshotStore(self.db)
+        self.cursor_cache = TTLCache(maxsize=Config.SEARCH_CURSOR_CACHE_SIZE, ttl=Config.SEARCH_CURSOR_CACHE_TTL)
+        self.block_cache = TTLCache(maxsize=Config.UPSTREAM_BLOCK_CACHE_SIZE, ttl=Config.SEARCH_CURSOR_CACHE_TTL)
+        self.response_cache = TTLCache(
+            maxsize=Config.UPSTREAM_RESPONSE_CACHE_SIZE,
+            ttl=Config.UPSTREAM_RESPONSE_CACHE_TTL,
+            maxweight=Config.UPSTREAM_RESPONSE_CACHE_MB * 1024 * 1024,
+            weigher=lambda entry: entry["size"]
+        )
+        self.version_cache = TTLCache(maxsize=1, ttl=Config.UPSTREAM_VERSION_CHECK_INTERVAL)
+        self.study_cache = TTLCache(maxsize=Config.STUDY_CACHE_SIZE, ttl=Config.STUDY_CACHE_TTL)
+        self.upstream_calls = SingleFlight()
+
+    def _get_or_create(self, attr: str, factory):
+        """
+        Returns the client stored in attr, creating it with factory on first use.
+        The double check keeps concurrent requests from building the same client twice.
+        """
+        value = getattr(self, attr)
+        if value is None:
+            with self._lock:
+                value = getattr(self, attr)
+                if value is None:
+                    value = factory()
+                    setattr(self, attr, value)
+        return value
+
+    @property
+    def translate_service(self) -> TranslateService:
+        return self._get_or_create("_translate_service", TranslateService)
+
+    @property
+    def embeddings_model(self) -> CachedEmbeddings:
+        return self._get_or_create(
+            "_embeddings_model",
+            lambda: CachedEmbeddings(
+                OpenAIEmbeddings(model=self.EMBEDDING_MODEL),
+                model_name=self.EMBEDDING_MODEL,
+                db=self.db if Config.QUERY_EMBEDDING_CACHE_PERSIST else None
+            )
+        )
 
-        pc = Pinecone()
-        index_name = "sprint-hsl"
-        index = pc.Index(name = index_name)
-        self.vector_store = PineconeVectorStore(index, embedding=self.embeddings_model)
+    @property
+    def pinecone_index(self):
+        return self._get_or_create("_pinecone_index", lambda: Pinecone().Index(name = PINECONE_INDEX_NAME))
 
-        self.generate_embeddings_for_existing_documents()
+    @property
+    def vector_store(self):
+        """
+        The backend selected by VECTOR_BACKEND, a SlimPineconeVectorStore or a LocalVectorStore.
+        """
+        return self._get_or_create(
+            "_vector_store",
+            lambda: create_vector_store(self.embeddings_model, pinecone_index=lambda: self.pinecone_index)
+        )
 
     @staticmethod
     def filter_studies(api_response: Dict[str, Any], search_data) -> List[Dict[str, Any]]:
@@ -45,6 +131,7 @@ class SearchService:
         Returns:
             list: The filtered studies.
         """
+        data_dict = {}
         if hasattr(search_data, 'model_dump'):
             data_dict = search_data.model_dump(exclude_none=True, exclude_unset=True)
         elif isinstance(search_data, dict):
@@ -62,15 +149,19 @@ class SearchService:
         for study in api_response.get("studies", []):
             filtered_study = {}
             protocol_section = study.get("protocolSection", {})
-            identification_module = protocol_section.get("identificationModule", {})
-            description_module = protocol_section.get("descriptionModule", {})
-            arms_interventions_module = protocol_section.get("armsInterventionsModule", {})
-            sponsors_collaborators_module = protocol_section.get("sponsorCollaboratorsModule", {})
-            contacts_locations_module = protocol_section.get("contactsLocationsModule", {})
-            conditions_module = protocol_section.get("conditionsModule", {})
-            eligibility_module = protocol_section.get("eligibilityModule", {})
-            status_module = protocol_section.get("statusModule", {})
-            design_module = protocol_section.get("designModule", {})
+            # only modules declared in STUDY_MODULES can be read here, they are also the only ones requested upstream
+            modules = {name: protocol_section.get(name, {}) for name in STUDY_MODULES}
+            identification_module = modules["identificationModule"]
+            description_module = modules["descriptionModule"]
+            arms_interventions_module = modules["armsInterventionsModule"]
+            sponsors_collaborators_module = modules["sponsorCollaboratorsModule"]
+            contacts_locations_module = modules["contactsLocationsModule"]
+            conditions_module = modules["conditionsModule"]
+            eligibility_module = modules["eligibilityModule"]
+            status_module = modules["statusModule"]
+            design_module = modules["designModule"]
+
+            filtered_study["NCTId"] = identification_module.get("nctId", "N/A")
 
             title = identification_module.get("briefTitle") or identification_module.get("officialTitle") or "N/A"
             filtered_study["Title"] = title
@@ -203,53 +294,7 @@ class SearchService:
 
         return filtered_studies
 
-    def flatten_metadata(self, doc: dict) -> dict:
-        """Flatten nested objects and convert to Pinecone-compatible format"""
-        flattened = {}
-        
-        for key, value in doc.items():
-            if isinstance(value, (str, int, float, bool)):
-                flattened[key] = value
-            elif isinstance(value, list):
-                flattened[key] = json.dumps(value)
-            elif isinstance(value, dict):
-                flattened[key] = json.dumps(value)
-            else:
-                flattened[key] = str(value)
-                
-        return flattened
-
-    def generate_embeddings_for_existing_documents(self):
-        documents = list(self.collection.find({'embedding': {'$exists': False}}))
-        if not documents:
-            documents = list(self.collection.find({'embedding': False}))
-            if not documents:
-                return 
-            
-        for doc in documents:
-            doc['_id'] = str(doc['_id'])
-            metadata = self.flatten_metadata(doc)
-            
-            doc = Document(
-                page_content=(
-                    f"{metadata['Title']} {metadata['Description']} "
-                    f"{' '.join(metadata['Conditions'])}"
-                ).strip(),
-                metadata=metadata
-            )
-
-            _id = [str(doc.metadata["_id"])]
-
-            self.vector_store.add_documents([doc], ids=_id)
-            
-            self.collection.update_one(
-                {"_id": ObjectId(doc.metadata["_id"])},
-                {"$set": {"embedding": True}}
-            )
-
-        return "Generated embeddings for existing documents."
-
-    def search_by_similarity(self, query_text, location=None, top_k=4, similarity_threshold=0.2):
+    def search_by_similarity(self, query_text, location=None, top_k=4, similarity_threshold=0.2, radius_km=None, age_years=None):
         """ 
         Performs a similarity search on the existing studies embeddings 
 
@@ -258,23 +303,81 @@ class SearchService:
             location (str): The location to filter the results.
             top_k (int): The number of results to return.
             similarity_threshold (float): The minimum similarity score to consider a result. (it is still a bit arbitrary, there is room for experimentation here)
+            radius_km (float): Widens the location to the cities within this distance of it.
+            age_years (float): Only the studies a patient of this age is eligible for.
 
         Returns:
             list: The top k results from the similarity search.
         """
+        vector_filter = {"sub_status": "accepted"}
+        location_filter = self._location_filter(location, radius_km)
+        if location_filter:
+            vector_filter = {"$and": [vector_filter, location_filter]}
+
+        # the location is a pre-filter, the extra hits only cover studies dropped by hydrate_studies
         results = self.vector_store.similarity_search_with_score(
             query_text,
-            k = top_k,
-            filter={"sub_status": "accepted"}
+            k = top_k * Config.VECTOR_QUERY_OVERSAMPLE,
+            filter=vector_filter
         )
 
-        filtered_results = []
-        for result, score in results:
-            if score > similarity_threshold:
-                result.metadata["Location"] = json.dumps(result.metadata["Location"])
-                filtered_results.append(result.metadata)
+        study_ids = [result.metadata["_id"] for result, score in results if score > similarity_threshold]
+        return self.hydrate_studies(study_ids, age_years)[:top_k]
+
+    @staticmethod
+    def _location_filter(location: Optional[str], radius_km: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Vector metadata filter for a location typed by the user. "City, State" narrows by the city, like filter_by_location does
+        on the api results; a single name can be a city, a state or a country.
+        With a radius, a city known to the gazetteer matches every known city within the radius (the metadata has no coordinates).
+        """
+        if not location:
+            return None
+        center = get_gazetteer().resolve(location) if radius_km else None
+        if center:
+            return {"cities": {"$in": get_gazetteer().cities_within(center, radius_km)}}
+        parts = [normalize_place(part) for part in location.split(",") if part.strip()]
+        if not parts:
+            return None
+        if len(parts) > 1:
+            return {"cities": {"$in": [parts[0]]}}
+        return {"$or": [{"cities": {"$in": parts}}, {"states": {"$in": parts}}, {"countries": {"$in": parts}}]}
+
+    def hydrate_studies(self, study_ids: List[str], age_years: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Reads the full records of the studies returned by a vector query (the index only keeps their ids),
+        with one $in lookup for the ones that aren't in the hot study cache.
 
-        return filtered_results
+        Args:
+            study_ids (list): The study ids, best match first.
+            age_years (float): Only keeps the studies a patient of this age is eligible for (indexed age fields).
+        Returns:
+            list: The accepted studies, in the same order.
+        """
+        studies = {}
+        missing = []
+        for study_id in study_ids:
+            cached = self.study_cache.get(study_id)
+            if cached is not None:
+                studies[study_id] = cached
+            elif ObjectId.is_valid(study_id):
+                missing.append(ObjectId(study_id))
+
+        if missing:
+            query = {"_id": {"$in": missing}}
+            if age_years is not None:
+                query.update(age_query(age_years))
+            for study in self.collection.find(query, {"embedding": 0, "embedding_version": 0}):
+                study["_id"] = str(study["_id"])
+                studies[study["_id"]] = study
+                self.study_cache.set(study["_id"], study)
+
+        # the vector metadata may lag behind an approval or rejection, the collection is the source of truth
+        return [
+            copy.deepcopy(studies[study_id]) for study_id in study_ids
+            if study_id in studies and studies[study_id].get("sub_status") == "accepted"
+            and (age_years is None or matches_age(studies[study_id], age_years))
+        ]
 
     def search_paciente(
         self,
@@ -284,6 +387,7 @@ class SearchService:
     ) -> List[Dict[str, Any]]:
         """ 
         Searches for studies based on the provided search fields and embeddings.
+        The semantic search and the api search run concurrently, see _fan_out.
 
         Args:
             search_data (PacienteSearch): The search fields to filter the studies.
@@ -293,30 +397,39 @@ class SearchService:
         Returns:
             list: The combined results from embedding search and API search.
         """
-        query_text = ''
-        if search_data.condition:
-            query_text = ' '.join(search_data.condition)
-        elif search_data.keywords:
-            query_text = search_data.keywords
-        elif search_data.condition and search_data.keywords:
-            query_text = f"{search_data.condition} {search_data.keywords}"
-
-        embedding_results = self.search_by_similarity(
-            query_text=query_text,
-            location=search_data.location,
-            top_k=page_size
+        return self._snapshot_search(
+            search_data=search_data,
+            api_results=self._paciente_api_results,
+            page_size=page_size,
+            page=search_data.page or page
         )
 
+    def _paciente_api_results(self, search_data: PacienteSearch, page_size: int, page: str, translate: bool = True) -> Dict[str, Any]:
         search_url = self.BASE_URL
         params = {
             "format": "json",
             "pageSize": page_size
         }
 
-        data_dict = search_data.model_dump(exclude_none=True, exclude_unset=True)
+        data_dict = search_data.model_dump(exclude_none=True, exclude_unset=True, exclude={"cursor"})
 
         data_dict = self.translate_service.translate_fields(data_dict, target_language='en', desired_fields=["condition", "keywords"])
 
+        if self.local_search.should_serve(data_dict):
+            return self._search_local(
+                data_dict=data_dict,
+                target_page=data_dict.get("page") or page,
+                page_size=page_size,
+                page_translator=self.translate_service if translate else None
+            )
+
+        params.update(self._radius_params(data_dict))
+
+        age_years = data_dict.pop("ageYears", None)
+        if age_years is not None:
+            data_dict.pop("age", None)
+            params['filter.advanced'] = age_expression(age_years)
+
         if 'age' in data_dict:
             if data_dict["age"] in self.AGE_MAPPING:
                 age_value = data_dict.pop('age')
@@ -338,54 +451,293 @@ class SearchService:
         if "page" in params:
             target_page = params.pop("page")
 
-        api_results = self._paginate_results(
+        return self._paginate_results(
             search_url=search_url,
             params=params,
             target_page=target_page,
-            page_translator=self.translate_service,
+            page_translator=self.translate_service if translate else None,
             search_data=data_dict,
             page_size=page_size
         )
 
-        api_studies = api_results.get("studies", [])
+    @staticmethod
+    def _radius_params(data_dict: Dict[str, Any]) -> Dict[str, str]:
+        """
+        Turns a radius search into the CT api geo filter, in place of the city name, when the city is in the gazetteer.
+        Otherwise the radius is dropped and the location is matched by name.
+        """
+        radius_km = data_dict.pop("radius_km", None)
+        center = get_gazetteer().resolve(data_dict.get("location")) if radius_km else None
+        if not center:
+            return {}
+        data_dict.pop("location")
+        return {"filter.geo": f"distance({center[0]},{center[1]},{radius_km:g}km)"}
+
+    @staticmethod
+    def _query_text(search_data) -> str:
+        return " ".join(filter(None, [search_data.condition, search_data.keywords]))
+
+    def _fan_out(self, api_branch, semantic_branch=None, page: str = '1', merge=None) -> Dict[str, Any]:
+        """
+        Runs the api branch (query translation, upstream or local search and page translation) and the semantic branch
+        (embedding + vector search) at the same time, each with its own timeout.
+        A branch that fails or times out is left out of the response, which is then flagged with the "degraded" branches,
+        instead of failing the whole search. Invalid input (ValueError) is still raised.
+
+        Args:
+            merge (callable): Builds the response out of (embedding_results, api_results, degraded), _merge_results by default.
+        Returns:
+            dict: The merged results, or only the api results when there is no semantic branch.
+        """
+        app = current_app._get_current_object()
+
+        def in_app_context(branch, deadline):
+            with app.app_context():
+                # the upstream calls of the branch give up at its deadline (see _upstream_deadline), so a hung
+                # branch frees its worker when its result is no longer waited for
+                g.search_deadline = deadline
+                return branch()
+
+        started_at = time.monotonic()
+        api_future = _branch_executor.submit(in_app_context, api_branch, started_at + Config.SEARCH_API_TIMEOUT)
+        semantic_future = (
+            _branch_executor.submit(in_app_context, semantic_branch, started_at + Config.SEARCH_SEMANTIC_TIMEOUT)
+            if semantic_branch else None
+        )
+
+        degraded = []
+        try:
+            api_results = api_future.result(timeout=Config.SEARCH_API_TIMEOUT)
+        except ValueError:
+            raise
+        except Exception as e:
+            current_app.logger.error(f"Api search branch failed: {e!r}")
+            degraded.append("api")
+            api_results = {"studies": [], "totalPages": 1, "currentPage": self._parse_target_page(page)}
+
+        if semantic_future is None:
+            response_dict = api_results
+        else:
+            try:
+                remaining = Config.SEARCH_SEMANTIC_TIMEOUT - (time.monotonic() - started_at)
+                embedding_results = semantic_future.result(timeout=max(remaining, 0))
+            except Exception as e:
+                current_app.logger.error(f"Semantic search branch failed: {e!r}")
+                degraded.append("semantic")
+                embedding_results = []
+            response_dict = (merge or self._merge_results)(embedding_results, api_results, degraded)
+
+        if degraded:
+            response_dict["degraded"] = degraded
+        return response_dict
 
-        combined_results = self.combine_results(embedding_results, api_studies)
+    def _merge_results(self, embedding_results: List[Dict[str, Any]], api_results: Dict[str, Any], degraded: List[str] = None) -> Dict[str, Any]:
+        combined_results = self.combine_results(embedding_results, api_results.get("studies", []))
 
-        response_dict = {
+        return {
             "studies": combined_results,
             "totalPages": api_results.get("totalPages"),
             "currentPage": api_results.get("currentPage")
         }
 
-        return response_dict
+    def _snapshot_search(self, search_data, api_results, page_size: int, page: str) -> Dict[str, Any]:
+        """
+        Paged search over a snapshot of the merged results. The first request runs the semantic and api branches once,
+        deep enough for several pages, fuses them and stores the ranked list server-side under a cursor id (returned
+        with the page). Requests that send the cursor back get plain slices of it, with the same totals, without
+        running the vector query again. Past the snapshot the pages come from the api (search fields + page).
+
+        Args:
+            search_data (PacienteSearch | MedicoSearch): The search fields, with the optional cursor.
+            api_results (callable): _paciente_api_results or _medico_api_results.
+            page_size (int): The number of results per page.
+            page (str): The page number to retrieve.
+        Returns:
+            dict: The page, with totalPages, currentPage and the cursor.
+        """
+        target_page = self._parse_target_page(page)
+        # the snapshot always starts at the top of both lists, whatever the page asked for
+        first_page = search_data.model_copy(update={"page": None, "cursor": None})
+        tail = lambda api_page: api_results(first_page, page_size, str(api_page))
+
+        if search_data.cursor:
+            snapshot = self.snapshots.get(search_data.cursor)
+            if snapshot is not None and snapshot["page_size"] == page_size:
+                return self._snapshot_page(snapshot, target_page, tail)
+
+        api_depth = -(-Config.SEARCH_SNAPSHOT_DEPTH // page_size) * page_size
+
+        def build(embedding_results, api_page, degraded):
+            studies = self.fuse_results([embedding_results, api_page.get("studies", [])])
+            tail_studies = max(api_page.get("totalStudies", 0) - api_depth, 0)
+            snapshot = {
+                "_id": None,
+                "studies": studies,
+                "keys": [self.study_key(study) for study in studies],
+                "page_size": page_size,
+                "api_depth": api_depth,
+                "tail_pages": -(-tail_studies // page_size),
+            }
+            # a degraded result is served but not frozen into a cursor
+            if not degraded:
+                snapshot["_id"] = self.snapshots.create(
+                    studies, snapshot["keys"], page_size, api_depth, snapshot["tail_pages"]
+                )
+            return self._snapshot_page(snapshot, target_page, tail)
+
+        return self._fan_out(
+            api_branch=lambda: api_results(first_page, api_depth, '1', translate=False),
+            semantic_branch=lambda: self.search_hybrid(
+                query_text=self._query_text(search_data),
+                location=search_data.location,
+                top_k=Config.SEARCH_SNAPSHOT_SEMANTIC_DEPTH,
+                radius_km=search_data.radius_km,
+                filters=search_data.model_dump(exclude_none=True, exclude={"page", "pageToken", "cursor"})
+            ),
+            page=target_page,
+            merge=build
+        )
+
+    def _snapshot_page(self, snapshot: Dict[str, Any], target_page: int, tail) -> Dict[str, Any]:
+        """
+        A page of a snapshot: a slice of the stored list, translated now, or an api page once past it.
+        """
+        page_size = snapshot["page_size"]
+        studies = snapshot["studies"]
+        head_pages = -(-len(studies) // page_size)
+        total_pages = max(head_pages + snapshot["tail_pages"], 1)
+
+        if target_page <= head_pages:
+            page_studies = copy.deepcopy(studies[(target_page - 1) * page_size:target_page * page_size])
+            pending = self.study_translations.apply(page_studies)
+            if pending:
+                self.translate_service.translate_fields(pending)
+        elif target_page <= total_pages:
+            api_page = snapshot["api_depth"] // page_size + target_page - head_pages
+            keys = set(snapshot["keys"])
+            page_studies = [study for study in tail(api_page).get("studies", []) if self.study_key(study) not in keys]
+        else:
+            page_studies = []
+            target_page = 1
+
+        return {
+            "studies": page_studies,
+            "totalPages": total_pages,
+            "currentPage": target_page,
+            "cursor": snapshot["_id"]
+        }
 
     def combine_results(self, embedding_results, api_results):
         """
         Combine the results from embedding search and API search.
 
         Args:
-            embedding_results (list): The results from embedding search.
+            embedding_results (list): The results from the hybrid (vector + lexical) search.
             api_results (list): The results from API search.
 
         Returns:
-            list: The combined results without duplicates.
+            list: The combined results without duplicates, ranked by reciprocal-rank fusion.
+        """
+        return self.fuse_results([embedding_results, api_results])
+
+    @staticmethod
+    def study_key(study: Dict[str, Any]) -> Optional[str]:
+        """
+        The identity of a study across result lists: its NCT id, or its mongo id for platform studies.
+        """
+        nct_id = study.get("NCTId")
+        if nct_id and nct_id != "N/A":
+            return nct_id
+        if study.get("_id"):
+            return str(study["_id"])
+        return study.get("Title")
+
+    @classmethod
+    def fuse_results(cls, rankings: List[List[Dict[str, Any]]], k: int = 60) -> List[Dict[str, Any]]:
+        """
+        Reciprocal-rank fusion: each study scores sum(1 / (k + rank)) over the lists it appears in, duplicates are merged
+        by study_key and the first record seen is kept. Ties keep the order of the lists.
+
+        Args:
+            rankings (list): The result lists, each best first.
+            k (int): The RRF constant, it damps the weight of the top ranks.
+        Returns:
+            list: The fused results, best first.
+        """
+        scores = {}
+        records = {}
+        for ranking in rankings:
+            for rank, study in enumerate(ranking, start=1):
+                key = cls.study_key(study)
+                if not key:
+                    continue
+                scores[key] = scores.get(key, 0) + 1 / (k + rank)
+                records.setdefault(key, study)
+
+        order = {key: position for position, key in enumerate(records)}
+        return [records[key] for key in sorted(records, key=lambda key: (-scores[key], order[key]))]
+
+    def search_hybrid(self, query_text, location=None, top_k=4, radius_km=None, filters=None):
         """
-        seen_titles = set()
-        combined_results = []
+        The semantic branch of the searches: vector hits over the platform studies fused (RRF) with BM25 hits over
+        the local corpus (platform studies and the local_studies mirror), both pre-filtered by location.
 
-        for study in embedding_results:
-            title = study.get("Title")
-            if title and title not in seen_titles:
-                combined_results.append(study)
-                seen_titles.add(title)
+        Args:
+            query_text (str): The text to search for.
+            location (str): The location to filter the results.
+            top_k (int): The number of results to return.
+            radius_km (float): Widens the location to the cities within this distance of it.
+            filters (dict): The search fields, their structured filters (status, sex, age...) also apply to the mirrored CT hits.
 
-        for study in api_results:
-            title = study.get("Title")
-            if title and title not in seen_titles:
-                combined_results.append(study)
-                seen_titles.add(title)
+        Returns:
+            list: The top k studies, none without a query text.
+        """
+        if not query_text or not query_text.strip():
+            return []
 
-        return combined_results
+        age_years = (filters or {}).get("ageYears")
+        vector_results = self.search_by_similarity(
+            query_text=query_text, location=location, top_k=top_k, radius_km=radius_km, age_years=age_years
+        )
+        if not len(self.lexical_index):
+            return vector_results
+
+        # the corpus is english, portuguese queries are translated like the api branch does (cached)
+        english_query = self.translate_service.translate_texts([query_text], target_language='en').get(query_text, query_text)
+        lexical_hits = self.lexical_index.search(
+            english_query,
+            k=top_k * Config.VECTOR_QUERY_OVERSAMPLE,
+            filter=self._location_filter(location, radius_km)
+        )
+        lexical_results = self._hydrate_lexical([key for key, _ in lexical_hits], filters)
+
+        return self.fuse_results([vector_results, lexical_results])[:top_k]
+
+    def _hydrate_lexical(self, keys: List[str], filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Full records of the lexical hits, in the same order: platform studies through hydrate_studies, mirrored CT studies
+        with one $in lookup on local_studies (narrowed by the structured filters of the search, the index only knows
+        the places), shaped by filter_studies and translated like the api pages.
+        """
+        nct_ids = [key for key in keys if key.startswith("NCT")]
+        platform_ids = [key for key in keys if not key.startswith("NCT")]
+        records = {study["_id"]: study for study in self.hydrate_studies(platform_ids, (filters or {}).get("ageYears"))}
+
+        if nct_ids:
+            projection = {"_id": 0, **{f"protocolSection.{module}": 1 for module in STUDY_MODULES}}
+            projection.update({field: 1 for field in STUDY_TOP_LEVEL_FIELDS})
+            query = {"protocolSection.identificationModule.nctId": {"$in": nct_ids}}
+            structured = self.local_search.filter_query(filters or {})
+            if structured:
+                query = {"$and": [query, structured]}
+            docs = list(self.local_search.collection.find(query, projection))
+            studies = self.filter_studies(api_response={"studies": docs}, search_data=None)
+            pending = self.study_translations.apply(studies)
+            if pending:
+                self.translate_service.translate_fields(pending)
+            records.update({study["NCTId"]: study for study in studies})
+
+        return [records[key] for key in keys if key in records]
 
     def search_medico(
         self, 
@@ -395,6 +747,7 @@ class SearchService:
     ):
         """ 
         Searches for studies based on the provided search fields. (more detailed fields in the Medico search)
+        The semantic search and the api search run concurrently, see _fan_out.
 
         Args:
             search_data (MedicoSearch): The search fields to filter the studies.
@@ -403,20 +756,21 @@ class SearchService:
         Returns:
             list: The filtered results from the target page, or an empty list if there are no results for the query.
         """
-        query_text = ''
-        if search_data.condition:
-            query_text = ' '.join(search_data.condition)
-        elif search_data.keywords:
-            query_text = search_data.keywords
-        elif search_data.condition and search_data.keywords:
-            query_text = f"{search_data.condition} {search_data.keywords}"
-
-        embedding_results = self.search_by_similarity(
-            query_text=query_text,
-            location=search_data.location,
-            top_k=page_size
+        # an explicit page in the search fields without a cursor only gets the api results, as it always did
+        if search_data.page and not search_data.cursor:
+            return self._fan_out(
+                api_branch=lambda: self._medico_api_results(search_data, page_size, page),
+                page=search_data.page
+            )
+
+        return self._snapshot_search(
+            search_data=search_data,
+            api_results=self._medico_api_results,
+            page_size=page_size,
+            page=search_data.page or page
         )
 
+    def _medico_api_results(self, search_data: MedicoSearch, page_size: int, page: str, translate: bool = True) -> Dict[str, Any]:
         search_url = self.BASE_URL
 
         params = {
@@ -424,12 +778,20 @@ class SearchService:
             "pageSize": page_size
         }
 
-       
-        data_dict = search_data.model_dump(exclude_none=True, exclude_unset=True)
+        data_dict = search_data.model_dump(exclude_none=True, exclude_unset=True, exclude={"cursor"})
 
         data_dict = self.translate_service.translate_fields(data_dict, target_language='en', desired_fields=["condition", "keywords"])
 
-    
+        if self.local_search.should_serve(data_dict):
+            return self._search_local(
+                data_dict=data_dict,
+                target_page=data_dict.get("page") or page,
+                page_size=page_size,
+                page_translator=self.translate_service if translate else None
+            )
+
+        params.update(self._radius_params(data_dict))
+
         agg_filters = self._construct_agg_filters(data_dict)
         if agg_filters:
             params["aggFilters"] = agg_filters
@@ -447,37 +809,20 @@ class SearchService:
 
         if "query.locn" in params:
             params["query.locn"] = params["query.locn"].split(",")[0].strip()
+
+        target_page = page
         if "page" in params:
             target_page = params.pop("page")
 
-            return self._paginate_results(
-                search_url=search_url,
-                params=params,
-                target_page=target_page,
-                page_translator = self.translate_service,
-                search_data = data_dict,
-                page_size = page_size
-            )
-
-        paginated_results = self._paginate_results(
+        return self._paginate_results(
             search_url=search_url,
             params=params,
-            target_page=page,
-            page_translator = self.translate_service,
+            target_page=target_page,
+            page_translator = self.translate_service if translate else None,
             search_data = data_dict,
+            page_size = page_size
         )
 
-        api_studies = paginated_results.get("studies", [])
-        combined_results = self.combine_results(embedding_results, api_studies)
-
-        response_dict = {
-            "studies": combined_results,
-            "totalPages": paginated_results.get("totalPages"),
-            "currentPage": paginated_results.get("currentPage")
-        }
-
-        return response_dict
-
     def advanced_search(
         self,
         search_query: str,
@@ -553,87 +898,277 @@ class SearchService:
             page_translator (None): An optional translator to apply to the results.
             search_data (dict): The search data to filter the results.
         Returns:
-            list: The filtered results from the target page, or an empty list if the target page is not reached.
+            dict: The filtered results from the target page, with the total pages and the current page.
         Raises:
             Exception: If the API request fails or returns a non-200 status code.
 
-        notes: it will make a request to the CT api target_page times, even though the data from these 'on the way' requests are not processed or filtered, it might be a point to be cautious about in the case of a high target page number
+        notes: when block mode is on (UPSTREAM_BLOCK_SIZE), the CT api is asked for big blocks of studies and the ui pages are
+        sliced out of the cached block, so most pages cost no upstream call at all. otherwise every ui page is one upstream page.
+        """
+        target_page = self._parse_target_page(target_page)
+        params.setdefault("fields", STUDY_FIELDS)
+
+        block_size = self._block_size(page_size)
+        if block_size:
+            page_studies, total_studies = self._fetch_from_block(params, target_page, page_size, block_size, search_data)
+        else:
+            response_data, total_studies = self._fetch_page(params, target_page, page_size)
+            page_studies = None
+            if response_data is not None:
+                page_studies = self.filter_studies(api_response = response_data, search_data=search_data)
+
+        return self._finalize_page(page_studies, total_studies, target_page, page_size, params.get("query.locn", ""), page_translator)
+
+    def _search_local(
+        self,
+        data_dict: dict,
+        target_page: str,
+        page_size: int,
+        page_translator: Optional[TranslateService] = None
+    ):
+        """
+        Same contract as _paginate_results, but answered by the local_studies mirror instead of the CT api.
+        """
+        target_page = self._parse_target_page(target_page)
+        studies, total_studies = self.local_search.search(data_dict, target_page, page_size)
+        page_studies = None
+        if studies is not None:
+            page_studies = self.filter_studies(api_response = {"studies": studies}, search_data=data_dict)
+
+        # a radius search already narrowed the locations to the nearby sites
+        location = ""
+        if not self.local_search.geo_center(data_dict):
+            location = self.local_search.location_city(data_dict.get("location")) or ""
+        return self._finalize_page(page_studies, total_studies, target_page, page_size, location, page_translator)
+
+    def _finalize_page(
+        self,
+        page_studies: Optional[List[Dict[str, Any]]],
+        total_studies: int,
+        target_page: int,
+        page_size: int,
+        location: str = "",
+        page_translator: Optional[TranslateService] = None
+    ):
+        """
+        Narrows the page to the searched location, translates it and wraps it with the pagination info.
+        Studies mirrored in local_studies use the translation stored at ingestion, only the rest goes to page_translator.
         """
+        total_pages = self._total_pages(total_studies, page_size)
+        if page_studies is None:
+            return {
+                "studies": [],
+                "totalPages": total_pages,
+                "currentPage": 1,
+                "totalStudies": total_studies
+            }
+
+        if location:
+            page_studies = self.filter_by_location(studies=page_studies, location=location)
+        if page_translator:
+            pending = self.study_translations.apply(page_studies)
+            if pending:
+                page_translator.translate_fields(pending)
+
+        return {
+            "studies": page_studies,
+            "totalPages": total_pages,
+            "currentPage": target_page,
+            "totalStudies": total_studies
+        }
+
+    @staticmethod
+    def _parse_target_page(target_page) -> int:
         try:
             target_page = int(target_page)
             if target_page < 1:
                 raise ValueError("the target page must be a positive integer")
-        except ValueError:
+        except (TypeError, ValueError):
             raise ValueError("invalid target page. the target page must be a positive integer")
-        current_page = 1
-        next_page_token = None 
-        response_dict = {}
-        # only the first request will count the total studies, so im doing this to only store the total studies number at the first request
-        first_time = False
-        total_studies = 0
+        return target_page
 
+    @staticmethod
+    def _total_pages(total_studies: int, page_size: int) -> int:
+        if total_studies <= page_size:
+            return 1
+        return (total_studies + page_size - 1) // page_size
 
-        while current_page <= target_page:
+    @staticmethod
+    def _block_size(page_size: int) -> Optional[int]:
+        """
+        Size of the upstream blocks for this page size, rounded down so a ui page never straddles two blocks.
+        Returns None when block mode is off or would not save any request.
+        """
+        block_size = min(Config.UPSTREAM_BLOCK_SIZE, 1000) // page_size * page_size
+        if block_size <= page_size:
+            return None
+        return block_size
+
+    def _fetch_from_block(self, params: dict, target_page: int, page_size: int, block_size: int, search_data: dict = None):
+        """
+        Serves a ui page out of the cached upstream block that contains it, fetching the block on a miss.
+
+        Returns:
+            tuple: The filtered studies of the ui page (None if the page is out of range) and the total number of studies.
+        """
+        block_params = {**params, "pageSize": block_size}
+        first_index = (target_page - 1) * page_size
+        block_page = first_index // block_size + 1
+        offset = first_index % block_size
+
+        block_key = (self._query_key(block_params), block_page)
+        block = self.block_cache.get(block_key)
+        if block is None:
+            response_data, total_studies = self._fetch_page(block_params, block_page, block_size)
+            if response_data is None:
+                return None, total_studies
+            block = {
+                "studies": self.filter_studies(api_response = response_data, search_data=search_data),
+                "total": total_studies
+            }
+            self.block_cache.set(block_key, block)
+
+        if target_page > self._total_pages(block["total"], page_size):
+            return None, block["total"]
+
+        # the location filter and the translation change the studies in place, so the cached block is never handed out
+        return copy.deepcopy(block["studies"][offset:offset + page_size]), block["total"]
+
+    def _fetch_page(self, params: dict, target_page: int, page_size: int):
+        """
+        Walks the CT api cursor until the target page and returns its raw response.
+        Every nextPageToken seen on the way is stored in the cursor cache, so a later request for the same query
+        resumes from the closest cached page instead of walking from page 1 again, and the total count is only requested once per query.
+
+        Returns:
+            tuple: The api response of the target page (None if the page is out of range) and the total number of studies.
+        """
+        query_key = self._query_key(params)
+        cursor = self.cursor_cache.get(query_key)
+        if cursor is None:
+            # the API only returns totalCount along with the first page, so a query without a cached total starts from page 1
+            cursor = {"total": None, "tokens": {}}
+            self.cursor_cache.set(query_key, cursor)
+
+        current_page = 1
+        next_page_token = None 
+        total_studies = cursor["total"]
+        if total_studies is not None:
+            if total_studies == 0 or target_page > self._total_pages(total_studies, page_size):
+                return None, total_studies
+            cached_pages = [p for p in cursor["tokens"] if p <= target_page]
+            if cached_pages:
+                current_page = max(cached_pages)
+                next_page_token = cursor["tokens"][current_page]
+
+        while True:
             if next_page_token:
-                first_time = False
                 params["pageToken"] = next_page_token
             else:
-                first_time = True
                 params.pop("pageToken", None)
-            params["countTotal"] = "true"
-
-            response = requests.get(self.BASE_URL, params=params)
-            if response.status_code != 200:
-                self.handle_api_error(response)
+            # page 1 always asks for the count, so a repeated first page hits the response cache with the same key
+            if total_studies is None or not next_page_token:
+                params["countTotal"] = "true"
+            else:
+                params.pop("countTotal", None)
 
-            response_data = response.json()
-            if first_time:
+            response_data = self._get_upstream(params)
+            if total_studies is None:
                 total_studies = response_data.get("totalCount", page_size)
-            total_pages = (total_studies + page_size - 1) // page_size
-            if total_studies <= page_size:
-                total_pages = 1
-            if total_studies == 0:
-                return {
-                    "studies": [],
-                    "totalPages": total_pages,
-                    "currentPage": current_page
-                }
+                cursor["total"] = total_studies
 
-            if target_page > total_pages:
-                return {
-                    "studies": [],
-                    "totalPages": total_pages,
-                    "currentPage": current_page
-                }
+            if total_studies == 0 or target_page > self._total_pages(total_studies, page_size):
+                return None, total_studies
+
+            next_page_token = response_data.get("nextPageToken")
+            if next_page_token:
+                cursor["tokens"][current_page + 1] = next_page_token
 
             if current_page == target_page:
-                filtered_response = self.filter_studies(api_response = response_data, search_data=search_data)
-                location = params.get("query.locn", "")
-                if location:
-                    filtered_response = self.filter_by_location(studies=filtered_response, location=location)
-                if page_translator:
-                    filtered_response = page_translator.translate_fields(filtered_response)
-
-                response_dict["studies"] = filtered_response
-                response_dict["totalPages"] = total_pages
-                response_dict["currentPage"] = current_page
-                return response_dict
+                return response_data, total_studies
 
-            next_page_token = response_data.get("nextPageToken")
             if not next_page_token:
-                return []
-
-            if current_page > target_page:
-                break 
+                return None, total_studies
 
             current_page += 1
 
+    def _get_upstream(self, params: dict) -> Dict[str, Any]:
+        """
+        Read-through cache in front of the CT api. Entries are keyed by the canonical params and the dataTimestamp
+        of the upstream data, so they stop being served as soon as the data is refreshed upstream, and identical
+        concurrent misses are coalesced into a single request.
+
+        notes: the returned dict is shared with the cache, callers must not change it.
+        """
+        key = (self._data_timestamp(), tuple(sorted((k, str(v)) for k, v in params.items())))
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            return cached["data"]
+
+        def fetch():
+            response = self.http.get(self.BASE_URL, params=params, deadline=self._upstream_deadline())
+            if response.status_code != 200:
+                self.handle_api_error(response)
+            response_data = response.json()
+            self.response_cache.set(key, {"data": response_data, "size": len(response.content)})
+            return response_data
+
+        return self.upstream_calls.do(key, fetch)
+
+    @staticmethod
+    def _upstream_deadline() -> Optional[float]:
+        """
+        The time.monotonic() deadline of the search branch running the call (set by _fan_out), None outside of one.
+        """
+        return g.get("search_deadline") if has_app_context() else None
+
+    def _data_timestamp(self) -> Optional[str]:
+        """
+        The dataTimestamp of the CT api /version endpoint, checked at most once per UPSTREAM_VERSION_CHECK_INTERVAL.
+        If the check fails the last known timestamp is kept, so a flaky /version never empties the response cache.
+        """
+        data_timestamp = self.version_cache.get("dataTimestamp")
+        if data_timestamp is not None:
+            return data_timestamp
+
+        def fetch():
+            try:
+                response = self.http.get(self.VERSION_URL, deadline=self._upstream_deadline())
+                response.raise_for_status()
+                timestamp = response.json().get("dataTimestamp")
+            except (requests.exceptions.RequestException, ValueError):
+                timestamp = None
+            timestamp = timestamp or self._last_data_timestamp
+            self._last_data_timestamp = timestamp
+            self.version_cache.set("dataTimestamp", timestamp or "")
+            return timestamp or ""
+
+        return self.upstream_calls.do("dataTimestamp", fetch)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Counters of the upstream caches, exposed by the /search/cache/stats endpoint.
+        """
         return {
-            "studies": [],
-            "totalPages": total_pages,
-            "currentPage": current_page
+            "responses": {**self.response_cache.stats(), "coalesced": self.upstream_calls.coalesced},
+            "blocks": self.block_cache.stats(),
+            "cursors": self.cursor_cache.stats(),
+            "studies": self.study_cache.stats(),
+            "lexical_index": self.lexical_index.stats(),
+            "translations": self._translate_service.cache_stats() if self._translate_service is not None else None,
+            "query_embeddings": self._embeddings_model.cache_stats() if self._embeddings_model is not None else None,
         }
 
+    def _query_key(self, params: dict) -> tuple:
+        """
+        Normalizes the CT api params into a hashable key, ignoring the ones that only move the cursor around.
+        Like the response cache, the key carries the dataTimestamp, so cached blocks, page tokens and totals
+        stop being served once the data is refreshed upstream.
+        """
+        return (self._data_timestamp(), tuple(sorted(
+            (key, str(value)) for key, value in params.items()
+            if key not in ("pageToken", "countTotal")
+        )))
 
     def _construct_agg_filters(self, data_dict: Dict[str, Any]) -> Optional[str]:
         accepts_healthy_volunteers = data_dict.pop("acceptsHealthyVolunteers", None)
@@ -656,6 +1191,7 @@ class SearchService:
     def _construct_advanced_filters(self, data_dict: Dict[str, Any]) -> Optional[str]:
         search_expr_parts = []
         age_value = data_dict.pop('age', None)
+        age_years = data_dict.pop('ageYears', None)
         org_value = data_dict.pop('organization', None)
         phase_value = data_dict.pop('studyPhase', None)
         type_value = data_dict.pop('studyType', None)
@@ -664,7 +1200,9 @@ class SearchService:
         if org_value:
             search_expr_parts.append(f"AREA[ResponsiblePartyOldOrganization]{org_value}")
 
-        if age_value in self.AGE_MAPPING:
+        if age_years is not None:
+            search_expr_parts.append(age_expression(age_years))
+        elif age_value in self.AGE_MAPPING:
             age_range = self.AGE_MAPPING[age_value]
             search_expr_parts.append(f"AREA[MaximumAge]RANGE[{age_range[0]}, {age_range[1]}]")
 
@@ -700,3 +1238,20 @@ class SearchService:
             f"{response.status_code} Client Error: {response.reason} for url: {response.url}\nDetails: {error_details}",
             response=response
         )
+
+
+_search_service = None
+_search_service_lock = threading.Lock()
+_branch_executor = ThreadPoolExecutor(max_workers=Config.SEARCH_BRANCH_WORKERS, thread_name_prefix="search-branch")
+
+def get_search_service() -> SearchService:
+    """
+    Returns the SearchService shared by every request of this worker, creating it on first use.
+    Must be called inside an app context, since the service keeps a handle to current_app.mongo.
+    """
+    global _search_service
+    if _search_service is None:
+        with _search_service_lock:
+            if _search_service is None:
+                _search_service = SearchService()
+    return _search_service
@@ -0,0 +1,66 @@
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional
+from app.core.cache import TTLCache
+from app.core.config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class SearchSnapshotStore:
+    """
+    Server-side snapshots of merged (semantic + api) result lists, so a search can be paged through with a cursor
+    id instead of re-running the vector query and re-ranking on every page. Snapshots live in the search_snapshots
+    collection (shared by every worker, expired by a TTL index on expires_at) and hot ones in an in-process cache.
+    """
+    def __init__(self, db, ttl: int = None):
+        self.db = db
+        self.collection = self.db["search_snapshots"]
+        self.ttl = ttl or Config.SEARCH_SNAPSHOT_TTL
+        self.cache = TTLCache(maxsize=Config.SEARCH_SNAPSHOT_CACHE_SIZE, ttl=self.ttl)
+
+    def create(self, studies: List[Dict[str, Any]], keys: List[str], page_size: int, api_depth: int, tail_pages: int) -> Optional[str]:
+        """
+        Stores a ranked result list.
+
+        Args:
+            studies (list): The merged studies, best first, untranslated.
+            keys (list): Their study keys, so api pages past the snapshot can skip what it already shows.
+            page_size (int): The page size the snapshot was built for.
+            api_depth (int): How many api results went into the snapshot, the following ones are paged from the api.
+            tail_pages (int): How many api pages come after the snapshot.
+        Returns:
+            str: The cursor id, or None if the snapshot could not be stored (the search still works, without a cursor).
+        """
+        now = datetime.utcnow()
+        snapshot = {
+            "_id": uuid.uuid4().hex,
+            "studies": studies,
+            "keys": keys,
+            "page_size": page_size,
+            "api_depth": api_depth,
+            "tail_pages": tail_pages,
+            "created_at": now,
+            # the expiry is stored with the snapshot, so SEARCH_SNAPSHOT_TTL can change without touching the index
+            "expires_at": now + timedelta(seconds=self.ttl),
+        }
+        try:
+            self.collection.insert_one(snapshot)
+        except Exception as e:
+            logger.error(f"Error storing search snapshot: {e}")
+            return None
+        self.cache.set(snapshot["_id"], snapshot)
+        return snapshot["_id"]
+
+    def get(self, cursor: str) -> Optional[Dict[str, Any]]:
+        snapshot = self.cache.get(cursor)
+        if snapshot is not None:
+            return snapshot
+
+        snapshot = self.collection.find_one({"_id": cursor})
+        # the TTL monitor only runs once a minute (and snapshots from before expires_at have none)
+        if snapshot is None or snapshot.get("expires_at") is None or snapshot["expires_at"] < datetime.utcnow():
+            return None
+        self.cache.set(cursor, snapshot)
+        return snapshot
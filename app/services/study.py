@@ -1,11 +1,12 @@
 import os 
 from dotenv import load_dotenv
-from pinecone import Pinecone
 from app.models.study import StudyModel 
 from app.schemas.study import CreateStudySchema
+from app.services.search import get_search_service
+from app.services.indexer import EmbeddingIndexer
+from app.services.vector_store import update_vector_metadata
+from app.services.eligibility import age_fields
 from flask import current_app
-from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
 from bson import ObjectId
 from typing import Optional
 
@@ -14,11 +15,9 @@ load_dotenv()
 class StudyService:
     def __init__(self):
         self.db = current_app.mongo
-        pc = Pinecone()
-        index_name = "sprint-hsl"
-        self.embeddings_model = OpenAIEmbeddings()
-        self.index = pc.Index(name = index_name)
-        self.vector_store = PineconeVectorStore(index_name, embedding=self.embeddings_model)
+        # same backend (VECTOR_BACKEND) and embeddings model the searches use
+        self.search_service = get_search_service()
+        self.indexer = EmbeddingIndexer(self.search_service, self.db)
 
     def create_study(self, study: CreateStudySchema, status: Optional[str] = None) -> str:
         """
@@ -37,11 +36,11 @@ class StudyService:
         )
 
         study_data = study.model_dump()
+        study_data.update(age_fields(study_data.get("MinimumAge"), study_data.get("MaximumAge")))
         created_study = self.db.studies.insert_one(study_data)
-        inserted_id = str(created_study.inserted_id)
 
-        #add study to pinecone
-        self.vector_store.add_documents([study_data], ids=[inserted_id])
+        #add study to the vector store
+        self.indexer.index_studies([study_data])
 
         return f"Study created successfully with id {created_study.inserted_id}"
 
@@ -66,10 +65,7 @@ class StudyService:
             {"$set": {"sub_status": "accepted"}}
         )
 
-        self.index.update(
-            id=study_id,
-            set_metadata={"sub_status": "accepted"}
-        )
+        update_vector_metadata(self.search_service.vector_store, study_id, {"sub_status": "accepted"})
        
         return "Study successfully accepted"
         
@@ -94,10 +90,7 @@ class StudyService:
             {"$set": {"sub_status": "rejected"}}
         )
 
-        self.index.update(
-            id = study_id,
-            set_metadata={"sub_status": "rejected"}
-        )
+        update_vector_metadata(self.search_service.vector_store, study_id, {"sub_status": "rejected"})
 
         return "Study successfully rejected"
 
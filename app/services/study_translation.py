@@ -0,0 +1,115 @@
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import List, Dict, Any
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+# the filter_studies fields shown translated to the user, same as TranslateService.translate_fields defaults
+TRANSLATED_FIELDS = ("Title", "Description", "Keywords", "Restrictions")
+
+
+def _logger():
+    return current_app.logger if has_app_context() else logger
+
+def display_fields(study: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The english fields of a filter_studies entry that get translated.
+    """
+    return {field: study[field] for field in TRANSLATED_FIELDS if field in study}
+
+def source_hash(fields: Dict[str, Any]) -> str:
+    """
+    Fingerprint of the english text a stored translation was made from, so it is only redone when the text changes.
+    """
+    return hashlib.sha256(json.dumps(fields, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+
+def _strings(value) -> List[str]:
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    if isinstance(value, list):
+        return [item for item in value if isinstance(item, str) and item.strip()]
+    return []
+
+def _replace(value, translations: Dict[str, str]):
+    if isinstance(value, str):
+        return translations.get(value, value)
+    if isinstance(value, list):
+        return [_replace(item, translations) for item in value]
+    return value
+
+
+class StudyTranslationStore:
+    """
+    Translated display fields of the studies in the local_studies mirror, kept under translations.<language>
+    next to the english record. They are computed in bulk at ingestion time (DataService.translate_local_studies),
+    so search pages only need the live translator for studies that are not in the mirror.
+    """
+    def __init__(self, db):
+        self.db = db
+        self.collection = self.db["local_studies"]
+
+    @staticmethod
+    def build_entry(fields: Dict[str, Any], translations: Dict[str, str]) -> Dict[str, Any]:
+        """
+        Builds the stored translation of a study, or returns None if some of its strings are missing from translations
+        (e.g. the api failed for them), so a half translated study is never stored.
+
+        Args:
+            fields (dict): The english fields, as returned by display_fields.
+            translations (dict): Maps english strings to their translation, as returned by TranslateService.translate_texts.
+        Returns:
+            dict: The entry to store under translations.<language>.
+        """
+        for value in fields.values():
+            if any(text not in translations for text in _strings(value)):
+                return None
+
+        return {
+            "source_hash": source_hash(fields),
+            "fields": {field: _replace(value, translations) for field, value in fields.items()},
+            "translated_at": datetime.utcnow()
+        }
+
+    @staticmethod
+    def strings_to_translate(fields: Dict[str, Any]) -> List[str]:
+        return [text for value in fields.values() for text in _strings(value)]
+
+    def apply(self, studies: List[Dict[str, Any]], target_language: str = 'pt') -> List[Dict[str, Any]]:
+        """
+        Replaces the display fields of the studies with their stored translation, in place.
+        A stored translation is only used if it was made from the same english text the study has now.
+
+        Args:
+            studies (list): The studies as returned by filter_studies.
+            target_language (str): The target language.
+        Returns:
+            list: The studies that had no usable stored translation and still need the live translator.
+        """
+        nct_ids = [study["NCTId"] for study in studies if study.get("NCTId")]
+        if not nct_ids:
+            return studies
+
+        try:
+            docs = self.collection.find(
+                {"protocolSection.identificationModule.nctId": {"$in": nct_ids}},
+                {"_id": 0, "protocolSection.identificationModule.nctId": 1, f"translations.{target_language}": 1}
+            )
+            stored = {
+                doc["protocolSection"]["identificationModule"]["nctId"]: doc.get("translations", {}).get(target_language)
+                for doc in docs
+            }
+        except Exception as e:
+            _logger().error(f"Error reading stored translations: {e}")
+            return studies
+
+        pending = []
+        for study in studies:
+            entry = stored.get(study.get("NCTId"))
+            if entry and entry.get("source_hash") == source_hash(display_fields(study)):
+                study.update(entry["fields"])
+            else:
+                pending.append(study)
+        return pending
@@ -1,16 +1,35 @@
 import os
 import json
-from operator import itemgetter 
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from operator import itemgetter
 from dotenv import load_dotenv
-from google.cloud import translate_v2 as translate 
+from google.cloud import translate_v2 as translate
 from google.oauth2 import service_account
-from flask import current_app
+from flask import current_app, has_app_context
+from pymongo import UpdateOne
+from app.core.cache import TTLCache
+from app.core.config import Config
+from app.services.language import detect_language
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+def _logger():
+    # translations also run from scheduler jobs, outside of any app context
+    return current_app.logger if has_app_context() else logger
+
 
 class TranslateService:
-    def __init__(self):
+    # per-request limits of the google translate v2 api
+    MAX_SEGMENTS_PER_REQUEST = 128
+    MAX_CHARS_PER_REQUEST = 30000
+
+    def __init__(self, db=None):
         if os.getenv("GOOGLE_CREDENTIALS"):
             credentials_info = json.loads(os.getenv("GOOGLE_CREDENTIALS"))
             credentials = service_account.Credentials.from_service_account_info(credentials_info)
@@ -18,8 +37,156 @@ class TranslateService:
         else:
             self.translator = translate.Client()
 
+        self._db = db
+        # translated summaries and descriptions are often several KB, so the entries are also bounded by their total length
+        self.memory_cache = TTLCache(
+            maxsize=Config.TRANSLATION_CACHE_SIZE,
+            maxweight=Config.TRANSLATION_CACHE_MB * 1024 * 1024,
+            weigher=len
+        )
+        self._stats_lock = threading.Lock()
+        self.stats = {
+            "strings": 0,
+            "duplicates": 0,
+            "already_in_target": 0,
+            "memory_hits": 0,
+            "mongo_hits": 0,
+            "api_strings": 0,
+            "api_requests": 0,
+            "chars_saved": 0,
+            "chars_sent": 0,
+        }
+
+    @property
+    def collection(self):
+        """
+        Second cache tier, shared by every worker. Without a db (e.g. outside an app context) only the in-process tier is used.
+        """
+        db = self._db
+        if db is None and has_app_context():
+            db = getattr(current_app, "mongo", None)
+        return db["translations"] if db is not None else None
+
+    @staticmethod
+    def cache_key(text: str, target_language: str) -> str:
+        return hashlib.sha256(f"{target_language}\0{text}".encode("utf-8")).hexdigest()
+
+    def _count(self, **counters):
+        with self._stats_lock:
+            for name, value in counters.items():
+                self.stats[name] += value
+
+    def cache_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        hits = stats["already_in_target"] + stats["memory_hits"] + stats["mongo_hits"]
+        stats["hit_rate"] = hits / stats["strings"] if stats["strings"] else 0
+        return stats
+
+    def _chunks(self, texts):
+        """
+        Splits the texts into api requests within the segment and character limits.
+        """
+        chunk = []
+        chunk_chars = 0
+        for text in texts:
+            if chunk and (len(chunk) >= self.MAX_SEGMENTS_PER_REQUEST or chunk_chars + len(text) > self.MAX_CHARS_PER_REQUEST):
+                yield chunk
+                chunk = []
+                chunk_chars = 0
+            chunk.append(text)
+            chunk_chars += len(text)
+        if chunk:
+            yield chunk
+
+    def translate_texts(self, texts, target_language='pt') -> dict:
+        """
+        Translates a list of strings, sending to the api only what is left after dropping duplicates, strings
+        detected as already being in the target language, and the ones found in the in-process cache or the translations collection.
+
+        Args:
+            texts (list): The strings to translate.
+            target_language (str): The target language to translate to.
+
+        Returns:
+            dict: Maps each source string to its translation. Strings the api failed to translate are left out.
+        """
+        unique_texts = list(dict.fromkeys(texts))
+        translations = {}
+
+        # e.g. portuguese queries, or studies registered on the platform in portuguese, headed to 'pt'
+        for text in unique_texts:
+            if detect_language(text) == target_language:
+                translations[text] = text
+        already_in_target = len(translations)
+
+        keys = {text: self.cache_key(text, target_language) for text in unique_texts if text not in translations}
+        for text, key in keys.items():
+            cached = self.memory_cache.get(key)
+            if cached is not None:
+                translations[text] = cached
+        self._count(
+            duplicates=len(texts) - len(unique_texts),
+            already_in_target=already_in_target,
+            memory_hits=len(translations) - already_in_target
+        )
+
+        collection = self.collection
+        misses = [text for text in unique_texts if text not in translations]
+        if misses and collection is not None:
+            try:
+                by_key = {keys[text]: text for text in misses}
+                for doc in collection.find({"_id": {"$in": list(by_key)}}, {"translated": 1}):
+                    text = by_key[doc["_id"]]
+                    translations[text] = doc["translated"]
+                    self.memory_cache.set(doc["_id"], doc["translated"])
+                    self._count(mongo_hits=1)
+            except Exception as e:
+                _logger().error(f"Error reading the translation cache: {e}")
+
+        misses = [text for text in unique_texts if text not in translations]
+        chars_sent = 0
+        for chunk in self._chunks(misses):
+            try:
+                result = self.translator.translate(chunk, target_language=target_language)
+                translated_texts = [item['translatedText'] for item in result]
+            except Exception as e:
+                _logger().error(f"Error translating text: {e}")
+                continue
+
+            chunk_chars = sum(len(text) for text in chunk)
+            chars_sent += chunk_chars
+            self._count(api_requests=1, api_strings=len(chunk), chars_sent=chunk_chars)
+            operations = []
+            for text, translated_text in zip(chunk, translated_texts):
+                translations[text] = translated_text
+                self.memory_cache.set(keys[text], translated_text)
+                operations.append(UpdateOne(
+                    {"_id": keys[text]},
+                    {"$set": {"translated": translated_text, "target": target_language, "created_at": datetime.utcnow()}},
+                    upsert=True
+                ))
+
+            if collection is not None:
+                try:
+                    collection.bulk_write(operations, ordered=False)
+                except Exception as e:
+                    _logger().error(f"Error writing the translation cache: {e}")
+
+        chars_requested = sum(len(text) for text in texts)
+        # what was answered without being sent (detector, caches, repeats of a translated string), a string the api failed on
+        # wasn't translated at all so it saved nothing
+        chars_saved = sum(len(text) for text in texts if text in translations) - chars_sent
+        self._count(strings=len(unique_texts), chars_saved=chars_saved)
+        if chars_requested:
+            _logger().info(
+                f"Translated {len(texts)} strings to {target_language}: {chars_sent} of {chars_requested} chars sent to the api "
+                f"({len(texts) - len(unique_texts)} duplicates, {already_in_target} already in {target_language})"
+            )
+        return translations
+
     def translate_fields(self, data, target_language='pt', desired_fields=["Title", "Description", "Keywords", "Restrictions"]):
-        """ 
+        """
         Recursively Translate the desired fields of a JSON object to the target language.
 
         Args:
@@ -42,7 +209,7 @@ class TranslateService:
                 for idx, item in enumerate(d):
                     collect_strings(item, path + [idx])
             elif isinstance(d, str):
-                if d.strip():  
+                if d.strip():
                     strings_to_translate.append(d)
                     paths.append(path)
 
@@ -51,23 +218,15 @@ class TranslateService:
         if not strings_to_translate:
             return data
 
-        try:
-            result = self.translator.translate(strings_to_translate, target_language=target_language)
-            translated_texts = [item['translatedText'] for item in result]
-        except Exception as e:
-            current_app.logger.error(f"Error translating text: {e}")
-            return data
-            
+        translations = self.translate_texts(strings_to_translate, target_language=target_language)
 
         #keeps going through the depth of the nested structure and replace the deepest value(str, the base case of the recursive function) with the translated text
-        for translated_text, path in zip(translated_texts, paths):
+        for text, path in zip(strings_to_translate, paths):
+            if text not in translations:
+                continue
             d = data
             for p in path[:-1]:
                 d = d[p]
-            d[path[-1]] = translated_text
+            d[path[-1]] = translations[text]
 
         return data
-        
-
-
-
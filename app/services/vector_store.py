@@ -0,0 +1,417 @@
+import os
+import json
+import fcntl
+import logging
+import threading
+from contextlib import contextmanager
+from typing import List, Dict, Any, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from langchain_pinecone import PineconeVectorStore
+from app.core.config import Config
+
+PINECONE_INDEX_NAME = "sprint-hsl"
+
+logger = logging.getLogger(__name__)
+
+
+def _matches_condition(value, op: str, operand) -> bool:
+    # list metadata (e.g. the cities of a study) matches when any of its elements does, like in Pinecone
+    values = value if isinstance(value, list) else [value]
+    if op == "$eq":
+        return operand in values
+    if op == "$ne":
+        return operand not in values
+    if op == "$in":
+        return any(item in operand for item in values)
+    if op == "$nin":
+        return not any(item in operand for item in values)
+    raise ValueError(f"Unsupported filter operator {op}")
+
+def matches_filter(metadata: Dict[str, Any], filter: Dict[str, Any]) -> bool:
+    """
+    Evaluates the subset of the Pinecone metadata filter syntax we use ($eq, $ne, $in, $nin, $and, $or) against one record.
+    """
+    for key, condition in filter.items():
+        if key == "$and":
+            if not all(matches_filter(metadata, part) for part in condition):
+                return False
+        elif key == "$or":
+            if not any(matches_filter(metadata, part) for part in condition):
+                return False
+        elif isinstance(condition, dict):
+            if not all(_matches_condition(metadata.get(key), op, operand) for op, operand in condition.items()):
+                return False
+        elif not _matches_condition(metadata.get(key), "$eq", condition):
+            return False
+    return True
+
+
+class LocalVectorStore:
+    """
+    In-process alternative to the Pinecone index, selected with VECTOR_BACKEND=local.
+    Vectors live L2-normalized in a memory-mapped matrix under VECTOR_STORE_PATH (float32, or int8 with a per-row scale),
+    next to an index.json holding the id map and the metadata. Scores are cosine similarities like the Pinecone index,
+    so the similarity thresholds keep their meaning.
+
+    Search is an exact matrix product while the corpus is small; from VECTOR_ANN_THRESHOLD vectors on an IVF index
+    (k-means lists, the closest VECTOR_ANN_NPROBE lists are scanned) is built lazily and used instead.
+    Gunicorn workers share the files: writes take a file lock and readers reload when index.json changes.
+    """
+    def __init__(
+        self,
+        embedding,
+        path: str = None,
+        quantization: str = None,
+        ann_threshold: int = None,
+        nprobe: int = None
+    ):
+        self.embedding = embedding
+        self.path = path or Config.VECTOR_STORE_PATH
+        self.quantization = quantization or Config.VECTOR_STORE_QUANTIZATION
+        if self.quantization not in ("float32", "int8"):
+            raise ValueError(f"Unknown vector quantization {self.quantization}")
+        self.ann_threshold = ann_threshold or Config.VECTOR_ANN_THRESHOLD
+        self.nprobe = nprobe or Config.VECTOR_ANN_NPROBE
+
+        self._lock = threading.RLock()
+        self._ivf = None
+        self._mask_cache = {}
+        os.makedirs(self.path, exist_ok=True)
+        self._load()
+
+    @property
+    def _index_file(self) -> str:
+        return os.path.join(self.path, "index.json")
+
+    @property
+    def _vectors_file(self) -> str:
+        return os.path.join(self.path, f"vectors.{self.quantization}")
+
+    @property
+    def _scales_file(self) -> str:
+        return os.path.join(self.path, "scales.float32")
+
+    def _load(self):
+        with self._lock:
+            self.dim = None
+            self.count = 0
+            self.capacity = 0
+            self.ids = []
+            self.metadata = []
+            self.vectors = None
+            self.scales = None
+            self._mtime = None
+            if os.path.exists(self._index_file):
+                with open(self._index_file) as f:
+                    index = json.load(f)
+                self._mtime = os.stat(self._index_file).st_mtime_ns
+                if index["quantization"] != self.quantization:
+                    raise ValueError(f"{self.path} holds {index['quantization']} vectors, not {self.quantization}")
+                self.dim = index["dim"]
+                self.count = index["count"]
+                self.capacity = index["capacity"]
+                self.ids = index["ids"]
+                self.metadata = index["metadata"]
+                self._map()
+            self.positions = {vector_id: row for row, vector_id in enumerate(self.ids)}
+            self._ivf = None
+            self._mask_cache = {}
+
+    def _refresh(self):
+        # another worker may have written since we loaded
+        mtime = os.stat(self._index_file).st_mtime_ns if os.path.exists(self._index_file) else None
+        if mtime != self._mtime:
+            self._load()
+
+    def _map(self):
+        dtype = np.int8 if self.quantization == "int8" else np.float32
+        self.vectors = np.memmap(self._vectors_file, dtype=dtype, mode="r+", shape=(self.capacity, self.dim))
+        if self.quantization == "int8":
+            self.scales = np.memmap(self._scales_file, dtype=np.float32, mode="r+", shape=(self.capacity,))
+
+    def _ensure_capacity(self, rows: int):
+        if rows <= self.capacity:
+            return
+        capacity = max(rows, self.capacity * 2, 1024)
+        itemsize = 1 if self.quantization == "int8" else 4
+        with open(self._vectors_file, "ab") as f:
+            f.truncate(capacity * self.dim * itemsize)
+        if self.quantization == "int8":
+            with open(self._scales_file, "ab") as f:
+                f.truncate(capacity * 4)
+        self.capacity = capacity
+        self._map()
+
+    def _save(self):
+        self.vectors.flush()
+        if self.scales is not None:
+            self.scales.flush()
+        index = {
+            "quantization": self.quantization,
+            "dim": self.dim,
+            "count": self.count,
+            "capacity": self.capacity,
+            "ids": self.ids,
+            "metadata": self.metadata,
+        }
+        tmp_file = f"{self._index_file}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_file, self._index_file)
+        self._mtime = os.stat(self._index_file).st_mtime_ns
+        self._mask_cache = {}
+
+    @contextmanager
+    def _write_lock(self):
+        with self._lock, open(os.path.join(self.path, "lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._refresh()
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add_vectors(self, vectors: List[List[float]], ids: List[str], metadatas: List[Dict[str, Any]]) -> List[str]:
+        """
+        Upserts vectors by id: an existing id is overwritten in place, new ids are appended.
+        """
+        vectors = self._normalize(np.asarray(vectors, dtype=np.float32))
+        with self._write_lock():
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Expected vectors of dimension {self.dim}, got {vectors.shape[1]}")
+
+            rows = []
+            for vector_id, metadata in zip(ids, metadatas):
+                row = self.positions.get(vector_id)
+                if row is None:
+                    row = self.count
+                    self.count += 1
+                    self.positions[vector_id] = row
+                    self.ids.append(vector_id)
+                    self.metadata.append(metadata)
+                else:
+                    self.metadata[row] = metadata
+                rows.append(row)
+
+            self._ensure_capacity(self.count)
+            if self.quantization == "int8":
+                scales = np.abs(vectors).max(axis=1) / 127
+                scales[scales == 0] = 1
+                self.vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+                self.scales[rows] = scales
+            else:
+                self.vectors[rows] = vectors
+            self._save()
+        return list(ids)
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None) -> List[str]:
+        ids = ids or [document.metadata["_id"] for document in documents]
+        vectors = self.embedding.embed_documents([document.page_content for document in documents])
+        # the text is only embedded, the records are hydrated from mongo after a query
+        metadatas = [dict(document.metadata) for document in documents]
+        return self.add_vectors(vectors, ids, metadatas)
+
+    def update_metadata(self, vector_id: str, metadata: Dict[str, Any]) -> bool:
+        """
+        Sets metadata fields of an indexed vector. Like an update of a missing id in Pinecone, an id that was never
+        indexed is a no-op: the indexer embeds it later with the metadata of its current record.
+
+        Returns:
+            bool: Whether the vector was found.
+        """
+        with self._write_lock():
+            row = self.positions.get(vector_id)
+            if row is None:
+                logger.warning(f"Metadata update for {vector_id}, which is not in the local vector store")
+                return False
+            self.metadata[row].update(metadata)
+            self._save()
+            return True
+
+    def _filter_mask(self, filter: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not filter:
+            return None
+        key = (json.dumps(filter, sort_keys=True), self.count)
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = np.fromiter((matches_filter(metadata, filter) for metadata in self.metadata), dtype=bool, count=self.count)
+            self._mask_cache = {key: mask}
+        return mask
+
+    def _scores(self, query: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        vectors = self.vectors[:self.count] if rows is None else self.vectors[rows]
+        if self.quantization == "int8":
+            scales = self.scales[:self.count] if rows is None else self.scales[rows]
+            return (vectors.astype(np.float32) @ query) * scales
+        return vectors @ query
+
+    def _dequantized(self, rows: np.ndarray) -> np.ndarray:
+        if self.quantization == "int8":
+            return self.vectors[rows].astype(np.float32) * self.scales[rows][:, None]
+        return np.asarray(self.vectors[rows])
+
+    def _build_ivf(self, iterations: int = 10, seed: int = 0) -> Dict[str, Any]:
+        """
+        Spherical k-means over a sample of the vectors, then every vector is filed under its closest centroid.
+        Vectors added after the build are kept in a tail that is always scanned, until the tail grows enough for a rebuild.
+        """
+        n = self.count
+        nlist = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        sample = np.sort(rng.choice(n, size=min(n, nlist * 64), replace=False))
+        points = self._dequantized(sample)
+        centroids = points[rng.choice(len(points), size=nlist, replace=False)]
+
+        for _ in range(iterations):
+            assignment = np.argmax(points @ centroids.T, axis=1)
+            for cluster in range(nlist):
+                members = points[assignment == cluster]
+                if len(members):
+                    centroids[cluster] = members.mean(axis=0)
+            centroids = self._normalize(centroids)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, 8192):
+            rows = np.arange(start, min(start + 8192, n))
+            assignment[rows] = np.argmax(self._dequantized(rows) @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.searchsorted(assignment[order], np.arange(nlist + 1))
+        return {"centroids": centroids, "order": order, "offsets": offsets, "size": n}
+
+    def _candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        if self.count < self.ann_threshold:
+            return None
+        if self._ivf is None or self.count > self._ivf["size"] * 1.2:
+            self._ivf = self._build_ivf()
+        ivf = self._ivf
+        probes = np.argsort(-(ivf["centroids"] @ query))[:self.nprobe]
+        lists = [ivf["order"][ivf["offsets"][probe]:ivf["offsets"][probe + 1]] for probe in probes]
+        tail = np.arange(ivf["size"], self.count)
+        return np.sort(np.concatenate(lists + [tail]))
+
+    def similarity_search_by_vector_with_score(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        exact: bool = False
+    ) -> List[Tuple[Document, float]]:
+        """
+        Args:
+            embedding (list): The query vector.
+            k (int): The number of results to return.
+            filter (dict): A Pinecone-style metadata filter, e.g. {"sub_status": "accepted"}.
+            exact (bool): Skips the IVF index and scans every vector (used to measure recall).
+        Returns:
+            list: (Document, cosine similarity) pairs, best first.
+        """
+        query = self._normalize(np.asarray(embedding, dtype=np.float32))
+        with self._lock:
+            self._refresh()
+            if not self.count:
+                return []
+
+            mask = self._filter_mask(filter)
+            rows = None if exact else self._candidates(query)
+            if rows is not None and mask is not None:
+                rows = rows[mask[rows]]
+            if rows is not None and len(rows) < k:
+                # too few candidates in the probed lists pass the filter
+                rows = None
+
+            if rows is None:
+                scores = self._scores(query)
+                rows = np.arange(self.count)
+                if mask is not None:
+                    scores, rows = scores[mask], rows[mask]
+            else:
+                scores = self._scores(query, rows)
+
+            top = np.argpartition(-scores, k - 1)[:k] if len(scores) > k else np.arange(len(scores))
+            top = top[np.argsort(-scores[top])]
+
+            results = []
+            for i in top:
+                metadata = dict(self.metadata[rows[i]])
+                text = metadata.pop("text", "")
+                results.append((Document(page_content=text, metadata=metadata), float(scores[i])))
+            return results
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict[str, Any]] = None) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k=k, filter=filter)
+
+
+class SlimPineconeVectorStore(PineconeVectorStore):
+    """
+    PineconeVectorStore that upserts the vectors with only the metadata of their documents (the id and the filterable
+    fields). The stock add_texts also stores the embedded text under a "text" key, and the stock queries skip the hits
+    without it, so both are replaced here.
+    """
+    UPSERT_BATCH_SIZE = 100
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None, **kwargs) -> List[str]:
+        ids = ids or [document.metadata["_id"] for document in documents]
+        vectors = self.embeddings.embed_documents([document.page_content for document in documents])
+        records = [
+            {"id": vector_id, "values": vector, "metadata": dict(document.metadata)}
+            for vector_id, vector, document in zip(ids, vectors, documents)
+        ]
+        for start in range(0, len(records), self.UPSERT_BATCH_SIZE):
+            self.index.upsert(vectors=records[start:start + self.UPSERT_BATCH_SIZE], namespace=self._namespace)
+        return list(ids)
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], *, k: int = 4, **kwargs) -> List[Tuple[Document, float]]:
+        results = self.index.query(
+            vector=embedding,
+            top_k=k,
+            include_metadata=True,
+            namespace=kwargs.get("namespace") or self._namespace,
+            filter=kwargs.get("filter")
+        )
+        return [
+            (Document(id=match["id"], page_content="", metadata=dict(match.get("metadata") or {})), match["score"])
+            for match in results["matches"]
+        ]
+
+
+def create_vector_store(embedding, pinecone_index=None):
+    """
+    Builds the vector store selected by VECTOR_BACKEND ('pinecone' or 'local').
+
+    Args:
+        embedding: The embeddings model used for documents and queries.
+        pinecone_index: A callable returning the Pinecone index, only called for the pinecone backend.
+    Returns:
+        The vector store.
+    """
+    if Config.VECTOR_BACKEND == "local":
+        return LocalVectorStore(embedding)
+    if Config.VECTOR_BACKEND == "pinecone":
+        return SlimPineconeVectorStore(pinecone_index(), embedding=embedding)
+    raise ValueError(f"Unknown vector backend {Config.VECTOR_BACKEND}")
+
+def embedding_store_id() -> str:
+    """
+    Identifies where the embeddings of VECTOR_BACKEND live, so the indexer knows which studies a store is missing:
+    the remote index, or the absolute VECTOR_STORE_PATH of the local one.
+    """
+    if Config.VECTOR_BACKEND == "local":
+        return f"local:{os.path.abspath(Config.VECTOR_STORE_PATH)}"
+    return f"{Config.VECTOR_BACKEND}:{PINECONE_INDEX_NAME}"
+
+def update_vector_metadata(vector_store, vector_id: str, metadata: Dict[str, Any]):
+    """
+    Sets metadata fields of an indexed vector (e.g. the sub_status of a study) on either backend.
+    """
+    if isinstance(vector_store, LocalVectorStore):
+        vector_store.update_metadata(vector_id, metadata)
+    else:
+        vector_store.index.update(id=vector_id, set_metadata=metadata)
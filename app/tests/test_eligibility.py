@@ -0,0 +1,35 @@
+import pytest
+from app.services.eligibility import MAX_AGE_MONTHS, age_expression, age_fields, age_query, matches_age, parse_age_months
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("18 Years", 216),
+    ("1 Year", 12),
+    ("6 Months", 6),
+    ("2 Weeks", 0.46),
+    ("30 Days", 0.99),
+    ("65", 780),
+    ("18 anos", 216),
+    ("N/A", None),
+    ("", None),
+    (None, None),
+    ("18 parsecs", None),
+])
+def test_parse_age_months(text, expected):
+    assert parse_age_months(text) == expected
+
+def test_missing_bounds_are_open_ended():
+    assert age_fields("18 Years", "N/A") == {"min_age_months": 216, "max_age_months": MAX_AGE_MONTHS}
+    assert age_fields(None, "17 Years") == {"min_age_months": 0, "max_age_months": 204}
+
+def test_exact_age_is_a_range_query():
+    assert age_query(30) == {"min_age_months": {"$lte": 360}, "max_age_months": {"$gte": 360}}
+    assert age_expression(30) == "AREA[MinimumAge]RANGE[MIN, 30 years] AND AREA[MaximumAge]RANGE[30 years, MAX]"
+    assert age_expression(0.5) == "AREA[MinimumAge]RANGE[MIN, 6 months] AND AREA[MaximumAge]RANGE[6 months, MAX]"
+
+def test_matches_age_agrees_with_age_query():
+    fields = age_fields("18 Years", "65 Years")
+
+    assert matches_age(fields, 18) and matches_age(fields, 65)
+    assert not matches_age(fields, 17.5)
+    assert not matches_age({}, 30)
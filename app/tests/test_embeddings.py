@@ -0,0 +1,46 @@
+from unittest.mock import MagicMock
+from app.services.embeddings import CachedEmbeddings
+
+
+def make_embeddings(db=None):
+    model = MagicMock()
+    model.embed_query.return_value = [0.5, -0.25, 1.0]
+    return CachedEmbeddings(model, model_name="text-embedding-3-large", db=db, maxsize=8), model
+
+def test_repeated_queries_skip_the_model():
+    embeddings, model = make_embeddings()
+
+    first = embeddings.embed_query("Breast  Cancer")
+    second = embeddings.embed_query("breast cancer ")
+
+    assert first == second == [0.5, -0.25, 1.0]
+    model.embed_query.assert_called_once_with("breast cancer")
+    assert embeddings.cache_stats()["memory_hits"] == 1
+
+def test_vectors_are_persisted_as_float32_blobs():
+    db = MagicMock()
+    embeddings, model = make_embeddings(db)
+    db["query_embeddings"].find_one.return_value = None
+
+    embeddings.embed_query("asthma")
+
+    update = db["query_embeddings"].update_one.call_args.args[1]["$set"]
+    assert len(update["vector"]) == 3 * 4
+    assert update["model"] == "text-embedding-3-large"
+
+def test_warm_restart_reads_the_vector_from_mongo():
+    db = MagicMock()
+    db["query_embeddings"].find_one.return_value = {"vector": CachedEmbeddings.to_blob([0.5, -0.25, 1.0])}
+    embeddings, model = make_embeddings(db)
+
+    assert embeddings.embed_query("asthma") == [0.5, -0.25, 1.0]
+    model.embed_query.assert_not_called()
+    assert embeddings.cache_stats()["mongo_hits"] == 1
+
+def test_documents_are_not_cached():
+    embeddings, model = make_embeddings()
+
+    embeddings.embed_documents(["a", "b"])
+    embeddings.embed_documents(["a", "b"])
+
+    assert model.embed_documents.call_count == 2
@@ -0,0 +1,49 @@
+import pytest
+from app.services.geo import Gazetteer, haversine_km, state_code
+
+
+@pytest.fixture
+def gazetteer():
+    return Gazetteer([
+        ("Recife", "PE", -8.0476, -34.8770),
+        ("Olinda", "PE", -8.0089, -34.8553),
+        ("São Paulo", "SP", -23.5505, -46.6333),
+        ("Santa Maria", "RS", -29.6842, -53.8069),
+        ("Santa Maria", "DF", -16.0055, -48.0135),
+    ])
+
+@pytest.mark.parametrize("state, expected", [("PE", "PE"), ("pe", "PE"), ("Pernambuco", "PE"), ("São Paulo", "SP"), ("Texas", None)])
+def test_state_code(state, expected):
+    assert state_code(state) == expected
+
+def test_haversine_km():
+    assert haversine_km((-8.0476, -34.8770), (-23.5505, -46.6333)) == pytest.approx(2130, rel=0.01)
+
+@pytest.mark.parametrize("location, expected", [
+    ("Recife", (-8.0476, -34.8770)),
+    ("recife, PE, Brasil", (-8.0476, -34.8770)),
+    ("Sao Paulo, São Paulo", (-23.5505, -46.6333)),
+    ("Santa Maria, Rio Grande do Sul", (-29.6842, -53.8069)),
+    ("Santa Maria", None),
+    ("Boston, MA", None),
+    ("Brazil", None),
+])
+def test_resolve(gazetteer, location, expected):
+    assert gazetteer.resolve(location) == expected
+
+def test_cities_within(gazetteer):
+    assert gazetteer.cities_within((-8.0476, -34.8770), 10) == ["recife", "olinda"]
+
+def test_study_points_prefer_the_geo_point(gazetteer):
+    study = {"protocolSection": {"contactsLocationsModule": {"locations": [
+        {"city": "Recife", "state": "Pernambuco", "country": "Brazil", "geoPoint": {"lat": -8.05, "lon": -34.9}},
+        {"city": "Olinda", "state": "Pernambuco", "country": "Brazil"},
+        {"city": "Olinda", "state": "PE", "country": "Brazil"},
+        {"city": "Boston", "state": "Massachusetts", "country": "United States"},
+        {"city": "Nowhere", "country": "Brazil"},
+    ]}}}
+
+    assert gazetteer.study_points(study) == [
+        {"type": "Point", "coordinates": [-34.9, -8.05]},
+        {"type": "Point", "coordinates": [-34.8553, -8.0089]},
+    ]
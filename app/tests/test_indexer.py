@@ -0,0 +1,116 @@
+from unittest.mock import MagicMock, patch
+from bson import ObjectId
+from app.services.indexer import EmbeddingIndexer
+
+
+def make_studies(n, description="short description"):
+    return [
+        {
+            "_id": ObjectId(), "Title": f"study {i}", "Description": description, "Conditions": ["cancer"],
+            "Location": [{"City": "Recife"}], "Restrictions": "adults", "sub_status": "accepted"
+        }
+        for i in range(n)
+    ]
+
+def make_indexer(studies, **kwargs):
+    db = MagicMock()
+    db.studies.count_documents.return_value = len(studies)
+    db.studies.find.return_value = iter(studies)
+    search_service = MagicMock()
+    return EmbeddingIndexer(search_service, db, **kwargs), search_service, db
+
+def test_batches_respect_token_budget():
+    studies = make_studies(10, description="x" * 400)
+    indexer, search_service, db = make_indexer(studies, token_budget=300)
+
+    summary = indexer.run()
+
+    assert summary["indexed"] == 10
+    assert summary["batches"] == 5
+    assert search_service.vector_store.add_documents.call_count == 5
+    assert db.studies.bulk_write.call_count == 5
+    assert db.studies.find.call_args_list[0].args[0] is indexer.pending_query
+
+def test_each_batch_is_flagged_with_one_bulk_write():
+    studies = make_studies(3)
+    indexer, search_service, db = make_indexer(studies)
+
+    indexer.run()
+
+    search_service.vector_store.add_documents.assert_called_once()
+    documents = search_service.vector_store.add_documents.call_args.args[0]
+    assert documents[0].page_content == "study 0 short description cancer"
+    assert documents[0].metadata == {"_id": str(studies[0]["_id"]), "sub_status": "accepted", "cities": ["recife"]}
+    operations = db.studies.bulk_write.call_args.args[0]
+    assert [op._filter["_id"] for op in operations] == [study["_id"] for study in studies]
+
+def test_failed_batch_is_retried_then_left_pending():
+    studies = make_studies(2)
+    indexer, search_service, db = make_indexer(studies, max_retries=2)
+    search_service.vector_store.add_documents.side_effect = Exception("openai is down")
+
+    with patch("app.services.indexer.time.sleep"):
+        summary = indexer.run()
+
+    assert search_service.vector_store.add_documents.call_count == 2
+    assert summary["failed"] == 2
+    db.studies.bulk_write.assert_not_called()
+
+def test_nothing_pending_skips_the_scan():
+    indexer, search_service, db = make_indexer([])
+
+    assert indexer.run()["indexed"] == 0
+    db.studies.find.assert_not_called()
+
+def test_location_metadata_is_normalized():
+    doc = {"_id": ObjectId(), "Location": [
+        {"City": "São Paulo", "State": "SP", "Country": "Brasil"},
+        {"City": "Recife", "Country": "Brazil"},
+    ]}
+
+    metadata = EmbeddingIndexer.build_metadata(doc)
+
+    assert metadata["cities"] == ["recife", "sao paulo"]
+    assert metadata["states"] == ["sp"]
+    assert metadata["countries"] == ["brazil"]
+
+def test_metadata_only_changes_skip_the_embeddings_call():
+    studies = make_studies(3)
+    indexer, search_service, db = make_indexer([], max_batch_size=2)
+    db.studies.count_documents.side_effect = lambda query: len(studies) if query is indexer.metadata_pending_query else 0
+    db.studies.find.return_value = iter(studies)
+
+    summary = indexer.run()
+
+    assert summary["indexed"] == 0
+    assert summary["metadata_refreshed"] == 3
+    search_service.vector_store.add_documents.assert_not_called()
+    search_service.vector_store.index.update.assert_any_call(
+        id=str(studies[0]["_id"]), set_metadata={"_id": str(studies[0]["_id"]), "sub_status": "accepted", "cities": ["recife"]}
+    )
+    assert db.studies.find.call_args.args[0] is indexer.metadata_pending_query
+    # flagged in batches of max_batch_size
+    assert db.studies.bulk_write.call_count == 2
+    operations = db.studies.bulk_write.call_args.args[0]
+    assert operations[0]._doc == {"$set": {"metadata_version": EmbeddingIndexer.METADATA_VERSION}}
+
+def test_switching_the_vector_backend_backfills_the_new_store(tmp_path):
+    with patch("app.services.vector_store.Config.VECTOR_BACKEND", "local"), \
+            patch("app.services.vector_store.Config.VECTOR_STORE_PATH", str(tmp_path)):
+        indexer, _, db = make_indexer(make_studies(1))
+
+    assert indexer.store_id == f"local:{tmp_path}"
+    # studies embedded into pinecone, or flagged before embedding_store existed, are pending for the local store
+    assert indexer.pending_query["$or"][1] == {"embedding_store": {"$nin": [indexer.store_id]}}
+
+    indexer.run()
+
+    update = db.studies.bulk_write.call_args.args[0][0]._doc["$set"]
+    assert update["embedding_store"] == indexer.store_id
+
+def test_studies_flagged_before_embedding_store_count_as_pinecone():
+    with patch("app.services.vector_store.Config.VECTOR_BACKEND", "pinecone"):
+        indexer, _, _ = make_indexer([])
+
+    assert indexer.store_id == "pinecone:sprint-hsl"
+    assert indexer.pending_query["$or"][1] == {"embedding_store": {"$nin": ["pinecone:sprint-hsl", None]}}
@@ -0,0 +1,254 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+from unittest.mock import MagicMock, patch
+from app.core.config import Config
+from app.services.data_analysis import DataService
+from app.services.ingestion import IngestionPipeline
+
+
+def study(nct_id, posted):
+    return {"protocolSection": {
+        "identificationModule": {"nctId": nct_id},
+        "statusModule": {"lastUpdatePostDateStruct": {"date": posted}},
+    }}
+
+def fake_upstream(pages, data_timestamp="2024-11-20T10:00:00"):
+    def get(url, params=None):
+        response = MagicMock()
+        if url.endswith("/version"):
+            response.json.return_value = {"dataTimestamp": data_timestamp}
+        elif params.get("countTotal"):
+            response.json.return_value = {"totalCount": 500000}
+        else:
+            index = int(params.get("pageToken", 0))
+            response.json.return_value = {
+                "studies": pages[index],
+                **({"nextPageToken": str(index + 1)} if index + 1 < len(pages) else {}),
+            }
+        return response
+    http = MagicMock()
+    http.get.side_effect = get
+    return http
+
+@pytest.fixture
+def mock_db():
+    db = MagicMock()
+    collections = {name: MagicMock(name=name) for name in ("metadata", "local_studies", "studies", "ingestion_runs")}
+    collections["ingestion_runs"].find_one.return_value = None
+    db.__getitem__.side_effect = collections.__getitem__
+    return db
+
+@pytest.fixture
+def data_service(mock_db):
+    with patch("app.services.data_analysis.get_lexical_index"):
+        yield DataService(MagicMock(), mock_db)
+
+def studies_requests(http):
+    return [call.kwargs["params"] for call in http.get.call_args_list if call.args[0].endswith("/studies") and not call.kwargs["params"].get("countTotal")]
+
+def stored_state(mock_db):
+    return mock_db["metadata"].update_one.call_args_list[-1].args[1]["$set"]
+
+def test_first_run_is_full_and_records_the_mark(data_service, mock_db):
+    mock_db["metadata"].find_one.return_value = None
+    data_service.http = fake_upstream([[study("NCT1", "2024-10-01"), study("NCT2", "2024-11-19")], [study("NCT3", "2024-11-02")]])
+
+    summary = data_service.fetch_and_store_studies()
+
+    assert (summary["mode"], summary["pages"], summary["studies"]) == ("full", 2, 3)
+    assert all("filter.advanced" not in params for params in studies_requests(data_service.http))
+    assert stored_state(mock_db)["last_update_post_date"] == "2024-11-19"
+    assert stored_state(mock_db)["timestamp"] == "2024-11-20T10:00:00"
+
+def test_unchanged_upstream_data_skips_the_run(data_service, mock_db):
+    mock_db["metadata"].find_one.return_value = {"timestamp": "2024-11-20T10:00:00", "last_update_post_date": "2024-11-19"}
+    data_service.http = fake_upstream([[]])
+
+    assert data_service.fetch_and_store_studies()["mode"] == "skipped"
+    assert studies_requests(data_service.http) == []
+    mock_db["local_studies"].bulk_write.assert_not_called()
+
+def test_later_runs_only_fetch_updated_studies(data_service, mock_db):
+    mock_db["metadata"].find_one.return_value = {"timestamp": "2024-11-19T10:00:00", "last_update_post_date": "2024-11-19"}
+    data_service.http = fake_upstream([[study("NCT2", "2024-11-20")]])
+
+    summary = data_service.fetch_and_store_studies()
+
+    assert (summary["mode"], summary["pages"], summary["studies"]) == ("incremental", 1, 1)
+    assert studies_requests(data_service.http)[0]["filter.advanced"] == "AREA[LastUpdatePostDate]RANGE[2024-11-19, MAX]"
+    assert stored_state(mock_db)["last_update_post_date"] == "2024-11-20"
+
+def test_full_resync_ignores_the_mark(data_service, mock_db):
+    mock_db["metadata"].find_one.return_value = {"timestamp": "2024-11-20T10:00:00", "last_update_post_date": "2024-11-19"}
+    data_service.http = fake_upstream([[study("NCT1", "2024-01-01")]])
+
+    summary = data_service.fetch_and_store_studies(full_resync=True)
+
+    assert summary["mode"] == "full"
+    assert "filter.advanced" not in studies_requests(data_service.http)[0]
+    # a full resync starts the mark over from what it fetched
+    assert stored_state(mock_db)["last_update_post_date"] == "2024-01-01"
+
+def test_failed_run_records_nothing(data_service, mock_db):
+    mock_db["metadata"].find_one.return_value = {"timestamp": "2024-11-19T10:00:00", "last_update_post_date": "2024-11-19"}
+    data_service.http = fake_upstream([[study("NCT2", "2024-11-20")]])
+    mock_db["local_studies"].bulk_write.side_effect = Exception("mongo down")
+
+    with pytest.raises(Exception):
+        data_service.fetch_and_store_studies()
+
+    assert all(call.args[0] != {"_id": "data_timestamp"} for call in mock_db["metadata"].update_one.call_args_list)
+    assert run_updates(mock_db)[-1]["status"] == "failed"
+
+def paged_source(pages, delay=0.0):
+    def fetch_page(page_token):
+        time.sleep(delay)
+        index = int(page_token or 0)
+        return pages[index], (str(index + 1) if index + 1 < len(pages) else None), 100
+    return fetch_page
+
+@pytest.mark.parametrize("writers", [0, 3])
+def test_pipeline_writes_every_page(writers):
+    pages = [[{"n": i}, {"n": i}] for i in range(10)]
+    written = []
+
+    metrics = IngestionPipeline(paged_source(pages), lambda studies: written.append(studies) or {"documents": len(studies)}, writers=writers).run()
+
+    assert sorted(study["n"] for page in written for study in page) == sorted(study["n"] for page in pages for study in page)
+    assert (metrics["pages"], metrics["documents"], metrics["bytes"]) == (10, 20, 1000)
+    assert metrics["documents_per_second"] > 0
+
+def test_slow_writers_hold_the_fetcher_back():
+    def slow_write(studies):
+        time.sleep(0.05)
+        return {"documents": len(studies)}
+
+    metrics = IngestionPipeline(paged_source([[{}]] * 8), slow_write, writers=1, queue_size=1).run()
+
+    assert metrics["max_queue_depth"] <= 1
+    assert metrics["fetcher_blocked_seconds"] > 0.1
+
+def test_writer_errors_stop_the_pipeline():
+    fetch_page = MagicMock(side_effect=paged_source([[{}]] * 1000))
+
+    def failing_write(studies):
+        raise RuntimeError("mongo down")
+
+    with pytest.raises(RuntimeError, match="mongo down"):
+        IngestionPipeline(fetch_page, failing_write, writers=2, queue_size=2).run()
+    assert fetch_page.call_count < 1000
+
+def test_unchanged_studies_are_not_written(data_service, mock_db):
+    unchanged, changed, new = study("NCT1", "2024-11-19"), study("NCT2", "2024-11-19"), study("NCT3", "2024-11-20")
+    mock_db["local_studies"].find.return_value = [
+        {"protocolSection": {"identificationModule": {"nctId": "NCT1"}}, "content_hash": DataService.content_hash(unchanged)},
+        {"protocolSection": {"identificationModule": {"nctId": "NCT2"}}, "content_hash": "stale"},
+    ]
+
+    counts = data_service._store_page([unchanged, changed, new])
+
+    assert counts == {"documents": 3, "inserted": 1, "changed": 1, "unchanged": 1}
+    mock_db["local_studies"].find.assert_called_once_with(
+        {"protocolSection.identificationModule.nctId": {"$in": ["NCT1", "NCT2", "NCT3"]}},
+        {"_id": 0, "protocolSection.identificationModule.nctId": 1, "content_hash": 1}
+    )
+    operations = mock_db["local_studies"].bulk_write.call_args.args[0]
+    assert [op._filter["protocolSection.identificationModule.nctId"] for op in operations] == ["NCT2", "NCT3"]
+
+def test_content_hash_ignores_key_order():
+    first = {"protocolSection": {"a": 1, "b": {"c": [1, 2]}}}
+    second = {"protocolSection": {"b": {"c": [1, 2]}, "a": 1}, "last_updated": "now"}
+    assert DataService.content_hash(first) == DataService.content_hash(second)
+    assert DataService.content_hash(first) != DataService.content_hash({"protocolSection": {"a": 2, "b": {"c": [1, 2]}}})
+
+def run_updates(mock_db):
+    return [call.args[1]["$set"] for call in mock_db["ingestion_runs"].update_one.call_args_list if "$set" in call.args[1]]
+
+def test_runs_are_checkpointed_and_finished(data_service, mock_db):
+    mock_db["metadata"].find_one.return_value = None
+    data_service.http = fake_upstream([[study("NCT1", "2024-10-01")], [study("NCT2", "2024-11-19")]])
+
+    # one checkpoint per page needs the pages written in order (concurrent writers may commit both at once)
+    with patch.object(Config, "INGESTION_WRITERS", 0):
+        summary = data_service.fetch_and_store_studies()
+
+    started = mock_db["ingestion_runs"].insert_one.call_args.args[0]
+    assert (started["status"], started["mode"], started["page_token"]) == ("running", "full", None)
+    updates = run_updates(mock_db)
+    assert [update.get("page_token") for update in updates] == ["1", None, None]
+    assert updates[0]["counters"]["pages"] == 1
+    assert updates[-1]["status"] == "succeeded"
+    assert updates[-1]["counters"] == {"pages": 2, "studies": 2, "inserted": 2, "changed": 0, "unchanged": 0}
+    assert summary["resumed"] is False
+
+def test_interrupted_run_resumes_from_its_checkpoint(data_service, mock_db):
+    mock_db["ingestion_runs"].find_one.return_value = {
+        "_id": "run-1", "status": "failed", "mode": "incremental", "since": "2024-11-01", "data_timestamp": "2024-11-20T10:00:00",
+        "page_token": "1", "high_water_mark": "2024-11-10", "attempts": 1, "started_at": datetime.now() - timedelta(hours=1),
+        "counters": {"pages": 1, "studies": 1, "inserted": 0, "changed": 1, "unchanged": 0},
+    }
+    data_service.http = fake_upstream([[study("NCT1", "2024-11-10")], [study("NCT2", "2024-11-05")]])
+
+    summary = data_service.fetch_and_store_studies()
+
+    requests = studies_requests(data_service.http)
+    assert [params.get("pageToken") for params in requests] == ["1"]
+    assert requests[0]["filter.advanced"] == "AREA[LastUpdatePostDate]RANGE[2024-11-01, MAX]"
+    mock_db["ingestion_runs"].insert_one.assert_not_called()
+    assert summary["resumed"] is True
+    assert (summary["pages"], summary["studies"], summary["inserted"], summary["changed"]) == (2, 2, 1, 1)
+    assert stored_state(mock_db) == {
+        "timestamp": "2024-11-20T10:00:00", "last_updated": stored_state(mock_db)["last_updated"], "last_update_post_date": "2024-11-10",
+    }
+
+def test_run_in_progress_elsewhere_is_left_alone(data_service, mock_db):
+    mock_db["ingestion_runs"].find_one.return_value = {
+        "_id": "run-1", "status": "running", "page_token": "3", "started_at": datetime.now(), "heartbeat_at": datetime.now(),
+    }
+    data_service.http = fake_upstream([[]])
+
+    assert data_service.fetch_and_store_studies()["mode"] == "skipped"
+    data_service.http.get.assert_not_called()
+
+def test_old_interrupted_runs_start_over(data_service, mock_db):
+    mock_db["ingestion_runs"].find_one.return_value = {
+        "_id": "run-1", "status": "running", "page_token": "3", "since": None, "attempts": 1,
+        "started_at": datetime.now() - timedelta(days=2), "heartbeat_at": datetime.now() - timedelta(days=2),
+    }
+    mock_db["metadata"].find_one.return_value = None
+    data_service.http = fake_upstream([[study("NCT1", "2024-10-01")]])
+
+    data_service.fetch_and_store_studies()
+
+    assert "pageToken" not in studies_requests(data_service.http)[0]
+    mock_db["ingestion_runs"].insert_one.assert_called_once()
+
+def test_checkpoints_follow_the_written_prefix():
+    pages = [[{"n": i}] for i in range(20)]
+    checkpoints = []
+
+    def write(studies):
+        # later pages finish first
+        time.sleep(0.02 * (20 - studies[0]["n"]) / 20)
+        return {"documents": 1}
+
+    IngestionPipeline(paged_source(pages), write, writers=4, queue_size=4).run(
+        on_checkpoint=lambda token, committed: checkpoints.append((token, committed["pages"]))
+    )
+
+    tokens = [token for token, _ in checkpoints]
+    assert tokens[-1] is None
+    assert [int(token) for token in tokens[:-1]] == sorted(int(token) for token in tokens[:-1])
+    assert all(int(token or 20) == pages_written for token, pages_written in checkpoints)
+
+def test_search_keys_are_backfilled(data_service, mock_db):
+    data_service.collection.find.return_value = [
+        {"_id": 1, "protocolSection": {"contactsLocationsModule": {"locations": [{"city": "Recife"}]}}},
+    ]
+
+    assert data_service.precompute_search_keys() == 1
+    data_service.collection.find.assert_called_once()
+    assert data_service.collection.find.call_args.args[0] == {"search_keys": {"$exists": False}}
+    operation = data_service.collection.bulk_write.call_args.args[0][0]
+    assert operation._doc["$set"]["search_keys"]["cities"] == ["recife"]
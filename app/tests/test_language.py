@@ -0,0 +1,14 @@
+import pytest
+from app.services.language import detect_language
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Estudo randomizado para avaliar a eficácia do tratamento em pacientes com asma", "pt"),
+    ("câncer de mama", "pt"),
+    ("A randomized study of the efficacy of the treatment in patients with asthma", "en"),
+    ("Breast cancer", None),
+    ("Pembrolizumab", None),
+    ("", None),
+])
+def test_detect_language(text, expected):
+    assert detect_language(text) == expected
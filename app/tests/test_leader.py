@@ -0,0 +1,131 @@
+import socket
+from unittest.mock import MagicMock, patch
+from flask import Flask
+from pymongo.errors import DuplicateKeyError
+from app.services.leader import LeaderElector, LeaderLease
+
+
+def make_elector(results):
+    lease = MagicMock(ttl_seconds=30, holder="host:1", acquire=MagicMock(side_effect=results))
+    lease.name = "scheduler"
+    elected, demoted = MagicMock(), MagicMock()
+    return LeaderElector(lease, on_elected=elected, on_demoted=demoted), elected, demoted
+
+def test_elector_calls_back_only_on_transitions():
+    elector, elected, demoted = make_elector([True, True, False, False, True])
+
+    for _ in range(5):
+        elector.step()
+
+    assert elected.call_count == 2
+    assert demoted.call_count == 1
+    assert elector.is_leader is True
+
+def test_elector_steps_down_when_mongo_is_unreachable():
+    elector, elected, demoted = make_elector([True, Exception("connection refused")])
+
+    elector.step()
+    elector.step()
+
+    assert elector.is_leader is False
+    demoted.assert_called_once()
+
+def test_failed_takeover_releases_the_lease_and_retries():
+    elector, elected, demoted = make_elector([True, True])
+    elected.side_effect = [RuntimeError("no app context"), None]
+
+    elector.step()
+
+    assert elector.is_leader is False
+    # the jobs added before the error are removed again
+    demoted.assert_called_once()
+    elector.lease.release.assert_called_once()
+
+    elector.step()
+
+    assert elector.is_leader is True
+    assert elected.call_count == 2
+
+def test_stop_releases_a_held_lease():
+    elector, _, _ = make_elector([True])
+    elector.step()
+
+    elector.stop()
+
+    elector.lease.release.assert_called_once()
+    assert elector.is_leader is False
+
+def test_acquire_loses_to_a_live_lease_of_another_holder():
+    db = MagicMock()
+    db["leases"].find_one_and_update.side_effect = DuplicateKeyError("E11000 duplicate key")
+
+    assert LeaderLease(db, "scheduler", ttl_seconds=30, holder="host:2").acquire() is False
+
+def test_acquire_renews_its_own_lease():
+    db = MagicMock()
+    db["leases"].find_one_and_update.return_value = {"_id": "scheduler", "holder": "host:1"}
+    lease = LeaderLease(db, "scheduler", ttl_seconds=30, holder="host:1")
+
+    assert lease.acquire() is True
+    query = db["leases"].find_one_and_update.call_args[0][0]
+    assert query["_id"] == "scheduler"
+    assert {"holder": "host:1"} in query["$or"]
+
+def readiness(db):
+    from app.api.endpoints import scheduler
+    app = Flask(__name__)
+    app.mongo = db
+    app.add_url_rule("/ready", view_func=scheduler.ready)
+    return app.test_client().get("/ready")
+
+def test_ready_once_the_mirror_was_ingested():
+    collections = {"metadata": MagicMock(), "ingestion_runs": MagicMock()}
+    collections["metadata"].find_one.return_value = {"_id": "data_timestamp"}
+    collections["ingestion_runs"].find_one.return_value = {"status": "completed", "mode": "incremental"}
+    db = MagicMock()
+    db.__getitem__.side_effect = lambda name: collections.setdefault(name, MagicMock())
+
+    response = readiness(db)
+
+    assert response.status_code == 200
+    assert response.get_json()["ingestion"]["status"] == "completed"
+
+def test_not_ready_before_the_first_ingestion():
+    collections = {"metadata": MagicMock(), "ingestion_runs": MagicMock()}
+    collections["metadata"].find_one.return_value = None
+    collections["ingestion_runs"].find_one.return_value = {"status": "running", "mode": "full"}
+    db = MagicMock()
+    db.__getitem__.side_effect = lambda name: collections.setdefault(name, MagicMock())
+
+    response = readiness(db)
+
+    assert response.status_code == 503
+    assert response.get_json()["local_mirror"] is False
+    assert response.get_json()["mongo"] is True
+
+def test_local_vector_store_is_not_ready_on_another_host_than_the_leader():
+    collections = {"metadata": MagicMock(), "leases": MagicMock(), "ingestion_runs": MagicMock()}
+    collections["metadata"].find_one.return_value = {"_id": "data_timestamp"}
+    collections["ingestion_runs"].find_one.return_value = None
+    collections["leases"].find_one.return_value = {"_id": "scheduler", "holder": "other-host:12:abcd1234"}
+    db = MagicMock()
+    db.__getitem__.side_effect = lambda name: collections.setdefault(name, MagicMock())
+
+    with patch("app.api.endpoints.scheduler.Config.VECTOR_BACKEND", "local"):
+        response = readiness(db)
+
+    assert response.status_code == 503
+    assert response.get_json()["vector_store"] is False
+
+def test_local_vector_store_is_ready_on_the_leader_host():
+    collections = {"metadata": MagicMock(), "leases": MagicMock(), "ingestion_runs": MagicMock()}
+    collections["metadata"].find_one.return_value = {"_id": "data_timestamp"}
+    collections["ingestion_runs"].find_one.return_value = None
+    collections["leases"].find_one.return_value = {"_id": "scheduler", "holder": f"{socket.gethostname()}:12:abcd1234"}
+    db = MagicMock()
+    db.__getitem__.side_effect = lambda name: collections.setdefault(name, MagicMock())
+
+    with patch("app.api.endpoints.scheduler.Config.VECTOR_BACKEND", "local"):
+        response = readiness(db)
+
+    assert response.status_code == 200
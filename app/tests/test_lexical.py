@@ -0,0 +1,65 @@
+from unittest.mock import MagicMock
+from bson import ObjectId
+from app.services.lexical import LexicalIndex, tokenize
+
+
+def make_index():
+    index = LexicalIndex()
+    index.add("NCT1", "Asthma in children, inhaled corticosteroids", {"cities": ["recife"]})
+    index.add("NCT2", "Breast cancer radiotherapy", {"cities": ["sao paulo"]})
+    index.add("NCT3", "Severe asthma asthma biologics", {"cities": ["sao paulo"]})
+    return index
+
+def test_tokenize_drops_stopwords_and_accents():
+    assert tokenize("Câncer de mama in the elderly") == ["cancer", "mama", "elderly"]
+
+def test_bm25_ranks_by_term_frequency_and_filters():
+    index = make_index()
+
+    assert [key for key, _ in index.search("asthma")] == ["NCT3", "NCT1"]
+    assert [key for key, _ in index.search("asthma", filter={"cities": {"$in": ["recife"]}})] == ["NCT1"]
+    assert index.search("diabetes") == []
+
+def test_changed_and_removed_documents_are_tombstoned():
+    index = make_index()
+
+    assert index.add("NCT1", "Asthma in children, inhaled corticosteroids", {"cities": ["recife"]}) is False
+    assert index.add("NCT3", "Breast cancer surgery") is True
+    index.remove("NCT2")
+
+    assert [key for key, _ in index.search("asthma")] == ["NCT1"]
+    assert [key for key, _ in index.search("cancer")] == ["NCT3"]
+    assert index.stats()["tombstones"] == 2
+
+def test_compaction_keeps_results():
+    index = LexicalIndex()
+    for i in range(3000):
+        index.add(f"NCT{i}", f"study {i} asthma" if i % 2 else f"study {i} cancer")
+    for i in range(0, 3000, 2):
+        index.remove(f"NCT{i}")
+
+    assert index.stats()["tombstones"] < 1000
+    assert len(index.search("asthma", k=5000)) == 1500
+    assert index.search("cancer") == []
+
+def test_sync_indexes_accepted_platform_studies_only():
+    index = LexicalIndex()
+    collections = {"local_studies": MagicMock(), "studies": MagicMock()}
+    db = MagicMock()
+    db.__getitem__.side_effect = collections.__getitem__
+    accepted, rejected = ObjectId(), ObjectId()
+    db["local_studies"].find.return_value = [{"protocolSection": {
+        "identificationModule": {"nctId": "NCT1", "briefTitle": "Asthma study"},
+        "contactsLocationsModule": {"locations": [{"city": "Recife", "country": "Brazil"}]},
+    }}]
+    db["studies"].find.return_value = [
+        {"_id": accepted, "Title": "Asthma registry", "sub_status": "accepted"},
+        {"_id": rejected, "Title": "Asthma trial", "sub_status": "rejected"},
+    ]
+
+    assert index.sync(db) == {"indexed": 2, "removed": 0}
+    assert {key for key, _ in index.search("asthma")} == {"NCT1", str(accepted)}
+    assert index.metadata[0] == {"cities": ["recife"], "countries": ["brazil"]}
+
+    index.sync(db)
+    assert "last_updated" in db["local_studies"].find.call_args.args[0]
@@ -0,0 +1,137 @@
+import pytest
+from unittest.mock import MagicMock
+from app.services.local_search import LocalSearchService, search_keys
+
+
+@pytest.fixture
+def mock_db():
+    return MagicMock()
+
+@pytest.fixture
+def local_search(mock_db):
+    return LocalSearchService(mock_db)
+
+@pytest.mark.parametrize("location, expected", [
+    ("Brazil", True),
+    ("São Paulo, Brasil", True),
+    ("Recife, PE", True),
+    ("Recife", False),
+    ("Boston, MA", False),
+    (None, False),
+])
+def test_is_brazil_scoped(location, expected):
+    assert LocalSearchService.is_brazil_scoped(location) == expected
+
+def test_build_query_paciente(local_search):
+    query = local_search.build_query({
+        "condition": "breast cancer",
+        "status": ["RECRUITING"],
+        "location": "Recife, PE",
+        "age": "senior",
+        "sex": "female",
+    })
+
+    assert query == {
+        "$text": {"$search": '"breast cancer"'},
+        "protocolSection.statusModule.overallStatus": {"$in": ["RECRUITING"]},
+        "search_keys.cities": "recife",
+        "protocolSection.eligibilityModule.stdAges": "OLDER_ADULT",
+        "protocolSection.eligibilityModule.sex": {"$in": ["FEMALE", "ALL"]},
+    }
+
+def test_build_query_medico(local_search):
+    query = local_search.build_query({
+        "title": "Diabetes Study",
+        "location": "Brazil",
+        "studyPhase": "PHASE3",
+        "studyType": "INTERVENTIONAL",
+        "acceptsHealthyVolunteers": False,
+        "hasResults": True,
+        "organization": "UFPE",
+        "studyId": "nct01234567",
+        "sex": "all",
+    })
+
+    assert query == {
+        "$text": {"$search": "Diabetes Study"},
+        "protocolSection.designModule.phases": "PHASE3",
+        "protocolSection.designModule.studyType": "INTERVENTIONAL",
+        "protocolSection.eligibilityModule.healthyVolunteers": False,
+        "hasResults": True,
+        "search_keys.organization": {"$all": ["ufpe"]},
+        "protocolSection.identificationModule.nctId": "NCT01234567",
+    }
+
+def test_search_pages_with_skip_and_limit(local_search, mock_db):
+    collection = mock_db["local_studies"]
+    collection.count_documents.return_value = 7
+    cursor = collection.find.return_value.sort.return_value.skip.return_value.limit.return_value
+    cursor.__iter__.return_value = iter([{"protocolSection": {}}])
+
+    studies, total = local_search.search({"location": "Brazil"}, target_page=3, page_size=3)
+
+    assert total == 7
+    assert len(studies) == 1
+    collection.find.return_value.sort.return_value.skip.assert_called_once_with(6)
+    collection.find.return_value.sort.return_value.skip.return_value.limit.assert_called_once_with(3)
+
+def test_search_out_of_range_page_skips_find(local_search, mock_db):
+    collection = mock_db["local_studies"]
+    collection.count_documents.return_value = 3
+
+    studies, total = local_search.search({"location": "Brazil"}, target_page=2, page_size=3)
+
+    assert studies is None
+    assert total == 3
+    collection.find.assert_not_called()
+
+def test_radius_search_uses_the_geo_index(local_search):
+    data_dict = {"location": "Recife, PE", "radius_km": 50}
+    query = local_search.build_query(data_dict)
+
+    assert "protocolSection.contactsLocationsModule.locations.city" not in query
+    assert query["geo"]["$geoWithin"]["$centerSphere"][0] == [-34.8770, -8.0476]
+    assert query["geo"]["$geoWithin"]["$centerSphere"][1] == pytest.approx(50 / 6378.1)
+
+def test_radius_search_is_local_and_keeps_nearby_sites(local_search, mock_db):
+    collection = mock_db["local_studies"]
+    collection.count_documents.return_value = 1
+    cursor = collection.find.return_value.sort.return_value.skip.return_value.limit.return_value
+    cursor.__iter__.return_value = iter([{"protocolSection": {"contactsLocationsModule": {"locations": [
+        {"city": "Sao Paulo", "state": "SP", "country": "Brazil"},
+        {"city": "Olinda", "country": "Brazil", "geoPoint": {"lat": -8.0089, "lon": -34.8553}},
+    ]}}}])
+
+    assert local_search.should_serve({"location": "Recife", "radius_km": 50})
+    studies, _ = local_search.search({"location": "Recife", "radius_km": 50}, target_page=1, page_size=3)
+
+    assert [loc["city"] for loc in studies[0]["protocolSection"]["contactsLocationsModule"]["locations"]] == ["Olinda"]
+
+def test_exact_age_replaces_the_age_bucket(local_search):
+    query = local_search.build_query({"location": "Brazil", "age": "adult", "ageYears": 16})
+
+    assert "protocolSection.eligibilityModule.stdAges" not in query
+    assert query["min_age_months"] == {"$lte": 192}
+    assert query["max_age_months"] == {"$gte": 192}
+
+def test_search_keys_are_normalized_for_indexed_matches(local_search):
+    keys = search_keys({"protocolSection": {
+        "identificationModule": {"organization": {"fullName": "Universidade Federal de São Paulo"}},
+        "sponsorCollaboratorsModule": {"leadSponsor": {"name": "Pfizer Inc."}},
+        "armsInterventionsModule": {"interventions": [{"name": "Dupilumab"}, {"name": "Placebo"}]},
+        "contactsLocationsModule": {"locations": [{"city": "São Paulo"}, {"city": "Recife"}, {"city": "Recife"}]},
+    }})["search_keys"]
+
+    assert keys["cities"] == ["recife", "sao paulo"]
+    assert keys["interventions"] == ["dupilumab", "placebo"]
+    assert keys["sponsor"] == ["inc", "pfizer"]
+    assert "sao" in keys["organization"] and "universidade" in keys["organization"]
+
+    query = local_search.build_query({"location": "SÃO PAULO, SP", "sponsor": " pfizer ", "intervention": "?"})
+    assert query == {"search_keys.cities": "sao paulo", "search_keys.sponsor": {"$all": ["pfizer"]}}
+
+def test_availability_is_cached(local_search, mock_db):
+    mock_db["metadata"].find_one.return_value = {"_id": "data_timestamp"}
+
+    assert local_search.is_available() and local_search.is_available()
+    mock_db["metadata"].find_one.assert_called_once()
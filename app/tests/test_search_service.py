@@ -0,0 +1,519 @@
+import time
+from datetime import datetime, timedelta
+import pytest
+import threading
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+from flask import Flask
+from bson import ObjectId
+from langchain_core.documents import Document
+from app.services.vector_store import LocalVectorStore
+from app.services.lexical import LexicalIndex
+from app.services.snapshots import SearchSnapshotStore
+from app.schemas.search import PacienteSearch
+import app.services.search as search_module
+from app.services.search import get_search_service
+
+
+@pytest.fixture
+def app_context():
+    app = Flask(__name__)
+    app.mongo = MagicMock()
+    with app.app_context():
+        yield app
+
+@pytest.fixture
+def fresh_service():
+    search_module._search_service = None
+    yield
+    search_module._search_service = None
+
+def test_shared_service_builds_each_client_once(app_context, fresh_service):
+    with patch("app.services.search.TranslateService") as mock_translate, \
+         patch("app.services.search.OpenAIEmbeddings") as mock_embeddings, \
+         patch("app.services.search.Pinecone") as mock_pinecone, \
+         patch("app.services.vector_store.SlimPineconeVectorStore") as mock_vector_store:
+        mock_vector_store.return_value.similarity_search_with_score.return_value = []
+
+        def handle_request(_):
+            with app_context.app_context():
+                service = get_search_service()
+                service.search_by_similarity("cancer")
+                service.translate_service
+                return service
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            services = list(executor.map(handle_request, range(50)))
+
+        assert all(service is services[0] for service in services)
+        mock_translate.assert_called_once()
+        mock_embeddings.assert_called_once()
+        mock_pinecone.assert_called_once()
+        mock_vector_store.assert_called_once()
+
+def test_clients_are_not_built_until_used(app_context, fresh_service):
+    with patch("app.services.search.TranslateService") as mock_translate, \
+         patch("app.services.search.OpenAIEmbeddings") as mock_embeddings, \
+         patch("app.services.search.Pinecone") as mock_pinecone:
+        app_context.mongo.studies.find.return_value = []
+
+        stats = get_search_service().cache_stats()
+
+        assert stats["translations"] is None
+        mock_translate.assert_not_called()
+        mock_embeddings.assert_not_called()
+        mock_pinecone.assert_not_called()
+
+def fake_upstream(total=100):
+    """Mimics the CT api paging: the token of page n is 'token-n' and totalCount only comes with countTotal."""
+    def get(url, params=None):
+        response = MagicMock()
+        response.status_code = 200
+        if url.endswith("/version"):
+            response.json.return_value = {"dataTimestamp": "2024-11-20T10:00:00"}
+            return response
+
+        page = int(params.get("pageToken", "token-1").split("-")[1])
+        page_size = int(params["pageSize"])
+        first = (page - 1) * page_size
+        response.content = b"{}"
+        response.json.return_value = {
+            "studies": [
+                {"protocolSection": {
+                    "identificationModule": {"briefTitle": f"study {i}", "organization": {"fullName": "HSL"}},
+                    "contactsLocationsModule": {"locations": [{"city": "Recife"}, {"city": "Sao Paulo"}]},
+                }}
+                for i in range(first, min(first + page_size, total))
+            ],
+            "nextPageToken": f"token-{page + 1}",
+            **({"totalCount": total} if params.get("countTotal") else {}),
+        }
+        return response
+    return get
+
+def studies_calls(mock_get):
+    return [call for call in mock_get.call_args_list if call.args[0].endswith("/studies")]
+
+@pytest.fixture
+def block_size():
+    def set_block_size(size):
+        patcher = patch.object(search_module.Config, "UPSTREAM_BLOCK_SIZE", size)
+        patcher.start()
+        patchers.append(patcher)
+    patchers = []
+    yield set_block_size
+    for patcher in patchers:
+        patcher.stop()
+
+@pytest.fixture
+def search_service(app_context):
+    translate_service = MagicMock()
+    translate_service.translate_fields.side_effect = lambda x: x
+    return search_module.SearchService(translate_service=translate_service)
+
+def test_deep_page_reuses_cached_cursor(search_service, block_size):
+    block_size(0)
+    params = {"format": "json", "pageSize": 3, "query.cond": "cancer"}
+
+    with patch.object(search_service.http, "get", side_effect=fake_upstream()) as mock_get:
+        first = search_service._paginate_results(search_service.BASE_URL, dict(params), "5", page_size=3)
+        assert len(studies_calls(mock_get)) == 5
+
+        mock_get.reset_mock()
+        search_service.response_cache.clear()
+        second = search_service._paginate_results(search_service.BASE_URL, dict(params), "5", page_size=3)
+        assert len(studies_calls(mock_get)) == 1
+        sent_params = mock_get.call_args.kwargs["params"]
+        assert sent_params["pageToken"] == "token-5"
+        assert "countTotal" not in sent_params
+
+        mock_get.reset_mock()
+        search_service.response_cache.clear()
+        search_service._paginate_results(search_service.BASE_URL, dict(params), "7", page_size=3)
+        assert len(studies_calls(mock_get)) == 2
+
+    assert first["totalPages"] == second["totalPages"] == 34
+    assert second["currentPage"] == 5
+
+def test_cursor_cache_is_per_query(search_service, block_size):
+    block_size(0)
+    with patch.object(search_service.http, "get", side_effect=fake_upstream()) as mock_get:
+        search_service._paginate_results(search_service.BASE_URL, {"pageSize": 3, "query.cond": "cancer"}, "3", page_size=3)
+        search_service._paginate_results(search_service.BASE_URL, {"pageSize": 3, "query.cond": "diabetes"}, "3", page_size=3)
+
+    assert len(studies_calls(mock_get)) == 6
+
+def test_block_mode_serves_many_pages_from_one_call(search_service, block_size):
+    block_size(12)
+    params = {"format": "json", "pageSize": 3, "query.cond": "cancer"}
+
+    with patch.object(search_service.http, "get", side_effect=fake_upstream(total=30)) as mock_get:
+        pages = [search_service._paginate_results(search_service.BASE_URL, dict(params), str(page), page_size=3) for page in range(1, 5)]
+        assert len(studies_calls(mock_get)) == 1
+        assert mock_get.call_args.kwargs["params"]["pageSize"] == 12
+
+        fifth = search_service._paginate_results(search_service.BASE_URL, dict(params), "5", page_size=3)
+        assert len(studies_calls(mock_get)) == 2
+
+    titles = [study["Title"] for page in pages for study in page["studies"]]
+    assert titles == [f"study {i}" for i in range(12)]
+    assert [study["Title"] for study in fifth["studies"]] == ["study 12", "study 13", "study 14"]
+    assert all(page["totalPages"] == 10 for page in pages + [fifth])
+    assert [page["currentPage"] for page in pages + [fifth]] == [1, 2, 3, 4, 5]
+
+def test_block_mode_matches_page_mode(search_service, block_size):
+    params = {"format": "json", "pageSize": 3, "query.cond": "cancer"}
+    with patch.object(search_service.http, "get", side_effect=fake_upstream(total=10)):
+        block_size(0)
+        paged = [search_service._paginate_results(search_service.BASE_URL, dict(params), str(page), page_size=3) for page in range(1, 6)]
+        block_size(100)
+        blocked = [search_service._paginate_results(search_service.BASE_URL, dict(params), str(page), page_size=3) for page in range(1, 6)]
+
+    assert paged == blocked
+    assert blocked[-1] == {"studies": [], "totalPages": 4, "currentPage": 1, "totalStudies": 10}
+
+def test_cached_block_is_not_mutated_by_location_filter(search_service, block_size):
+    block_size(12)
+    params = {"format": "json", "pageSize": 3, "query.locn": "Recife"}
+
+    with patch.object(search_service.http, "get", side_effect=fake_upstream(total=12)):
+        search_service._paginate_results(search_service.BASE_URL, dict(params), "1", page_size=3)
+        block = next(iter(search_service.block_cache._data.values()))[0]
+
+    assert [loc["City"] for loc in block["studies"][0]["Location"]] == ["Recife", "Sao Paulo"]
+
+def test_repeated_query_is_served_from_response_cache(search_service, block_size):
+    block_size(0)
+    params = {"format": "json", "pageSize": 3, "query.cond": "diabetes"}
+
+    with patch.object(search_service.http, "get", side_effect=fake_upstream()) as mock_get:
+        first = search_service._paginate_results(search_service.BASE_URL, dict(params), "1", page_size=3)
+        second = search_service._paginate_results(search_service.BASE_URL, dict(params), "1", page_size=3)
+
+    assert first == second
+    assert len(studies_calls(mock_get)) == 1
+    stats = search_service.cache_stats()["responses"]
+    assert stats["hits"] == 1 and stats["misses"] == 1
+
+def test_new_data_timestamp_invalidates_cached_responses(search_service):
+    params = {"format": "json", "pageSize": 3, "query.cond": "diabetes"}
+
+    with patch.object(search_service.http, "get", side_effect=fake_upstream()) as mock_get:
+        search_service._get_upstream(dict(params))
+        search_service.version_cache.set("dataTimestamp", "2024-11-21T10:00:00")
+        search_service._get_upstream(dict(params))
+
+    assert len(studies_calls(mock_get)) == 2
+
+def test_new_data_timestamp_invalidates_cached_blocks_and_cursors(search_service, block_size):
+    params = {"format": "json", "pageSize": 3, "query.cond": "diabetes"}
+
+    with patch.object(search_service.http, "get", side_effect=fake_upstream()) as mock_get:
+        for size in (12, 0):
+            block_size(size)
+            search_service._paginate_results(search_service.BASE_URL, dict(params), "2", page_size=3)
+        search_service.version_cache.set("dataTimestamp", "2024-11-21T10:00:00")
+        search_service.response_cache.clear()
+        mock_get.reset_mock()
+        block_size(12)
+        search_service._paginate_results(search_service.BASE_URL, dict(params), "2", page_size=3)
+        block_size(0)
+        search_service._paginate_results(search_service.BASE_URL, dict(params), "2", page_size=3)
+
+    # a new block, then page 2 walked again from page 1 (with the old keys: no block call, one call from the cached token)
+    assert len(studies_calls(mock_get)) == 3
+
+def test_concurrent_misses_are_coalesced(search_service):
+    search_service.version_cache.set("dataTimestamp", "2024-11-20T10:00:00")
+    release = threading.Event()
+    upstream = fake_upstream()
+
+    def slow_get(url, params=None):
+        release.wait(timeout=5)
+        return upstream(url, params)
+
+    with patch.object(search_service.http, "get", side_effect=slow_get) as mock_get:
+        with ThreadPoolExecutor(max_workers=50) as executor:
+            futures = [executor.submit(search_service._get_upstream, {"pageSize": 3, "query.cond": "cancer"}) for _ in range(50)]
+            while search_service.upstream_calls.coalesced < 49:
+                time.sleep(0.01)
+            release.set()
+            results = [future.result() for future in futures]
+
+    assert mock_get.call_count == 1
+    assert all(result is results[0] for result in results)
+
+def test_branches_run_concurrently(search_service, app_context):
+    def slow(result):
+        def branch():
+            time.sleep(0.3)
+            return result
+        return branch
+
+    started_at = time.monotonic()
+    result = search_service._fan_out(
+        api_branch=slow({"studies": [{"Title": "api study"}], "totalPages": 1, "currentPage": 1}),
+        semantic_branch=slow([{"Title": "platform study"}])
+    )
+
+    assert time.monotonic() - started_at < 0.5
+    assert [study["Title"] for study in result["studies"]] == ["platform study", "api study"]
+    assert "degraded" not in result
+
+def test_failed_api_branch_degrades_to_semantic_results(search_service, app_context):
+    def api_branch():
+        raise requests.exceptions.HTTPError("503 Server Error")
+
+    result = search_service._fan_out(api_branch=api_branch, semantic_branch=lambda: [{"Title": "platform study"}], page="2")
+
+    assert result == {
+        "studies": [{"Title": "platform study"}],
+        "totalPages": 1,
+        "currentPage": 2,
+        "degraded": ["api"],
+    }
+
+def test_slow_semantic_branch_times_out(search_service, app_context):
+    api_results = {"studies": [{"Title": "api study"}], "totalPages": 1, "currentPage": 1}
+
+    with patch.object(search_module.Config, "SEARCH_SEMANTIC_TIMEOUT", 0.1):
+        result = search_service._fan_out(api_branch=lambda: api_results, semantic_branch=lambda: time.sleep(1) or [])
+
+    assert result["studies"] == [{"Title": "api study"}]
+    assert result["degraded"] == ["semantic"]
+
+def test_invalid_page_is_still_raised(search_service, app_context):
+    with pytest.raises(ValueError):
+        search_service._fan_out(api_branch=lambda: search_service._parse_target_page("0"), semantic_branch=lambda: [])
+
+def test_upstream_requests_only_ask_for_the_filtered_fields(search_service, block_size):
+    block_size(0)
+    with patch.object(search_service.http, "get", side_effect=fake_upstream()) as mock_get:
+        search_service._paginate_results(search_service.BASE_URL, {"pageSize": 3, "query.cond": "cancer"}, "1", page_size=3)
+
+    fields = mock_get.call_args.kwargs["params"]["fields"].split(",")
+    assert fields == [f"protocolSection.{module}" for module in search_module.STUDY_MODULES] + ["hasResults"]
+
+def test_projection_does_not_change_filtered_studies():
+    full_study = {
+        "protocolSection": {
+            "identificationModule": {"nctId": "NCT01", "briefTitle": "study", "organization": {"fullName": "HSL", "class": "OTHER"}},
+            "descriptionModule": {"briefSummary": "summary"},
+            "conditionsModule": {"conditions": ["cancer"], "keywords": ["tumor"]},
+            "eligibilityModule": {"sex": "ALL", "minimumAge": "18 Years", "eligibilityCriteria": " adults "},
+            "contactsLocationsModule": {"locations": [{"city": "Recife", "country": "Brazil"}]},
+            "outcomesModule": {"primaryOutcomes": [{"measure": "survival"}]},
+            "referencesModule": {"references": [{"pmid": "1"}]},
+        },
+        "resultsSection": {"baselineCharacteristicsModule": {}},
+        "derivedSection": {"conditionBrowseModule": {}},
+        "hasResults": True,
+    }
+    projected_study = {
+        "protocolSection": {
+            module: content for module, content in full_study["protocolSection"].items()
+            if module in search_module.STUDY_MODULES
+        },
+        "hasResults": True,
+    }
+
+    full = search_module.SearchService.filter_studies({"studies": [full_study]}, {})
+    projected = search_module.SearchService.filter_studies({"studies": [projected_study]}, {})
+
+    assert full == projected
+
+def test_similarity_results_are_hydrated_with_one_lookup(search_service):
+    accepted, rejected, cached = (str(ObjectId()) for _ in range(3))
+    search_service.study_cache.set(cached, {"_id": cached, "Title": "cached", "sub_status": "accepted"})
+    search_service._vector_store = MagicMock()
+    search_service._vector_store.similarity_search_with_score.return_value = [
+        (Document(page_content="", metadata={"_id": _id}), score)
+        for _id, score in [(cached, 0.9), (accepted, 0.8), (rejected, 0.7), (str(ObjectId()), 0.1)]
+    ]
+    search_service.collection.find.return_value = [
+        {"_id": ObjectId(accepted), "Title": "accepted", "Location": [{"City": "Recife"}], "sub_status": "accepted"},
+        {"_id": ObjectId(rejected), "Title": "rejected", "sub_status": "rejected"},
+    ]
+
+    results = search_service.search_by_similarity("cancer")
+
+    assert [study["Title"] for study in results] == ["cached", "accepted"]
+    assert results[1]["Location"] == [{"City": "Recife"}]
+    query = search_service.collection.find.call_args.args[0]
+    assert query == {"_id": {"$in": [ObjectId(accepted), ObjectId(rejected)]}}
+    assert search_service.study_cache.get(accepted)["Title"] == "accepted"
+
+def test_platform_studies_are_filtered_by_exact_age(search_service):
+    child, adult, fetched = (str(ObjectId()) for _ in range(3))
+    search_service.study_cache.set(child, {"_id": child, "sub_status": "accepted", "min_age_months": 0, "max_age_months": 216})
+    search_service.study_cache.set(adult, {"_id": adult, "sub_status": "accepted", "min_age_months": 216, "max_age_months": 780})
+    search_service.collection.find.return_value = [
+        {"_id": ObjectId(fetched), "sub_status": "accepted", "min_age_months": 216, "max_age_months": 2400},
+    ]
+
+    results = search_service.hydrate_studies([child, adult, fetched], age_years=40)
+
+    assert [study["_id"] for study in results] == [adult, fetched]
+    query = search_service.collection.find.call_args.args[0]
+    assert query == {"_id": {"$in": [ObjectId(fetched)]}, "min_age_months": {"$lte": 480}, "max_age_months": {"$gte": 480}}
+
+@pytest.mark.parametrize("location, expected", [
+    ("São Paulo, SP", {"cities": {"$in": ["sao paulo"]}}),
+    ("Brasil", {"$or": [{"cities": {"$in": ["brazil"]}}, {"states": {"$in": ["brazil"]}}, {"countries": {"$in": ["brazil"]}}]}),
+    (None, None),
+])
+def test_location_filter(location, expected):
+    assert search_module.SearchService._location_filter(location) == expected
+
+def test_similarity_search_prefilters_by_location(search_service, tmp_path):
+    store = LocalVectorStore(MagicMock(), path=str(tmp_path))
+    store.embedding.embed_query.return_value = [1.0, 0.0]
+    ids = [str(ObjectId()) for _ in range(6)]
+    # the closest studies are in another city, they must not take the top_k slots
+    store.add_vectors(
+        [[1.0, 0.01 * i] for i in range(6)],
+        ids,
+        [{"_id": _id, "sub_status": "accepted", "cities": ["boston" if i < 4 else "recife"]} for i, _id in enumerate(ids)]
+    )
+    search_service._vector_store = store
+    search_service.collection.find.side_effect = lambda query, projection: [
+        {"_id": _id, "Title": str(_id), "sub_status": "accepted"} for _id in query["_id"]["$in"]
+    ]
+
+    results = search_service.search_by_similarity("cancer", location="Recife, PE", top_k=2)
+
+    assert [study["_id"] for study in results] == ids[4:]
+
+def test_fuse_results_ranks_by_rrf_and_dedupes_by_id():
+    vector = [{"_id": "a", "Title": "A"}, {"NCTId": "NCT1", "Title": "Same title"}]
+    api = [{"NCTId": "NCT1", "Title": "Same title"}, {"NCTId": "NCT2", "Title": "Same title"}]
+
+    fused = search_module.SearchService.fuse_results([vector, api])
+
+    # NCT1 is in both lists, the two "Same title" studies are different trials
+    assert [search_module.SearchService.study_key(study) for study in fused] == ["NCT1", "a", "NCT2"]
+
+def test_hybrid_search_fuses_vector_and_lexical_hits(search_service):
+    platform_id = str(ObjectId())
+    search_service.lexical_index = LexicalIndex()
+    search_service.lexical_index.add("NCT1", "Asthma biologics", {"cities": ["recife"]})
+    search_service.lexical_index.add(platform_id, "Asthma registry", {"cities": ["recife"]})
+    search_service.lexical_index.add("NCT2", "Asthma in Boston", {"cities": ["boston"]})
+    search_service.translate_service.translate_texts.side_effect = lambda texts, target_language: {texts[0]: "asthma"}
+    search_service.study_cache.set(platform_id, {"_id": platform_id, "Title": "Asthma registry", "sub_status": "accepted"})
+    search_service.local_search.collection.find.return_value = [
+        {"protocolSection": {"identificationModule": {"nctId": "NCT1", "briefTitle": "Asthma biologics", "organization": {}}}}
+    ]
+
+    with patch.object(search_service, "search_by_similarity", return_value=[{"_id": platform_id, "Title": "Asthma registry"}]):
+        results = search_service.search_hybrid("asma", location="Recife, PE", top_k=3)
+
+    assert [search_module.SearchService.study_key(study) for study in results] == [platform_id, "NCT1"]
+
+def test_lexical_ct_hits_get_the_structured_filters(search_service):
+    search_service.lexical_index = LexicalIndex()
+    search_service.lexical_index.add("NCT1", "Asthma biologics", {"cities": ["recife"]})
+    search_service.translate_service.translate_texts.side_effect = lambda texts, target_language: {texts[0]: "asthma"}
+    search_service.local_search.collection.find.return_value = []
+
+    with patch.object(search_service, "search_by_similarity", return_value=[]):
+        results = search_service.search_hybrid(
+            "asma", location="Recife, PE", top_k=3,
+            filters={"condition": "asma", "location": "Recife, PE", "status": ["RECRUITING"], "sex": "female"}
+        )
+
+    assert results == []
+    query = search_service.local_search.collection.find.call_args.args[0]
+    assert query == {"$and": [
+        {"protocolSection.identificationModule.nctId": {"$in": ["NCT1"]}},
+        {
+            "protocolSection.statusModule.overallStatus": {"$in": ["RECRUITING"]},
+            "protocolSection.eligibilityModule.sex": {"$in": ["FEMALE", "ALL"]},
+        },
+    ]}
+
+def test_hybrid_search_without_query_text_is_empty(search_service):
+    search_service._vector_store = MagicMock()
+
+    assert search_service.search_hybrid("  ", location="Recife, PE") == []
+    search_service.translate_service.translate_texts.assert_not_called()
+    search_service._vector_store.similarity_search_with_score.assert_not_called()
+
+def fake_api_results(total=20):
+    def api_results(search_data, page_size, page, translate=True):
+        first = (int(page) - 1) * page_size
+        return {
+            "studies": [{"NCTId": f"NCT{i}", "Title": f"study {i}"} for i in range(first, min(first + page_size, total))],
+            "totalPages": -(-total // page_size),
+            "currentPage": int(page),
+            "totalStudies": total,
+        }
+    return MagicMock(side_effect=api_results)
+
+def test_snapshot_pages_do_not_query_again(search_service, app_context):
+    api_results = fake_api_results()
+    semantic = [{"_id": "a", "Title": "A"}, {"NCTId": "NCT1", "Title": "study 1"}]
+
+    with patch.object(search_module.Config, "SEARCH_SNAPSHOT_DEPTH", 6), \
+         patch.object(search_service, "search_hybrid", return_value=semantic) as mock_hybrid:
+        first = search_service._snapshot_search(PacienteSearch(condition="asthma"), api_results, 3, '1')
+        second = search_service._snapshot_search(PacienteSearch(condition="asthma", cursor=first["cursor"]), api_results, 3, '2')
+        third = search_service._snapshot_search(PacienteSearch(condition="asthma", cursor=first["cursor"]), api_results, 3, '3')
+
+    mock_hybrid.assert_called_once()
+    api_results.assert_called_once()
+    assert api_results.call_args.args[1:] == (6, '1')
+    assert first["cursor"] and second["cursor"] == first["cursor"]
+    keys = [search_module.SearchService.study_key(study) for page in (first, second, third) for study in page["studies"]]
+    assert keys == ["NCT1", "a", "NCT0", "NCT2", "NCT3", "NCT4", "NCT5"]
+    # 7 merged studies in the snapshot, then the api pages after its first 6 results
+    assert first["totalPages"] == second["totalPages"] == third["totalPages"] == 3 + 5
+
+def test_pages_past_the_snapshot_come_from_the_api(search_service, app_context):
+    api_results = fake_api_results()
+
+    with patch.object(search_module.Config, "SEARCH_SNAPSHOT_DEPTH", 6), \
+         patch.object(search_service, "search_hybrid", return_value=[{"NCTId": "NCT7", "Title": "study 7"}]):
+        first = search_service._snapshot_search(PacienteSearch(condition="asthma"), api_results, 3, '1')
+        fourth = search_service._snapshot_search(PacienteSearch(condition="asthma", cursor=first["cursor"]), api_results, 3, '4')
+
+    assert api_results.call_args.args[1:] == (3, '3')
+    # NCT7 was already shown from the snapshot
+    assert [study["NCTId"] for study in fourth["studies"]] == ["NCT6", "NCT8"]
+    assert fourth["currentPage"] == 4
+
+def test_degraded_results_get_no_cursor(search_service, app_context):
+    api_results = fake_api_results()
+
+    with patch.object(search_service, "search_hybrid", side_effect=RuntimeError("vector store down")):
+        response = search_service._snapshot_search(PacienteSearch(condition="asthma"), api_results, 3, '1')
+
+    assert response["cursor"] is None
+    assert response["degraded"] == ["semantic"]
+    search_service.db["search_snapshots"].insert_one.assert_not_called()
+
+def test_snapshots_expire_at_their_stored_expiry():
+    db = MagicMock()
+    store = SearchSnapshotStore(db, ttl=60)
+    cursor = store.create([{"NCTId": "NCT1"}], ["NCT1"], 3, 6, 0)
+    stored = db["search_snapshots"].insert_one.call_args.args[0]
+    assert stored["expires_at"] == stored["created_at"] + timedelta(seconds=60)
+
+    db["search_snapshots"].find_one.return_value = {**stored, "expires_at": datetime.utcnow() - timedelta(seconds=1)}
+    assert SearchSnapshotStore(db, ttl=60).get(cursor) is None
+
+def test_radius_is_sent_upstream_as_a_geo_filter():
+    data_dict = {"condition": "asthma", "location": "Recife, PE", "radius_km": 25.0}
+    assert search_module.SearchService._radius_params(data_dict) == {"filter.geo": "distance(-8.0476,-34.877,25km)"}
+    assert data_dict == {"condition": "asthma"}
+
+    data_dict = {"location": "Boston, MA", "radius_km": 25.0}
+    assert search_module.SearchService._radius_params(data_dict) == {}
+    assert data_dict == {"location": "Boston, MA"}
+
+def test_radius_location_filter_covers_nearby_cities():
+    location_filter = search_module.SearchService._location_filter("Sao Paulo, SP", radius_km=30)
+    assert location_filter["cities"]["$in"][0] == "sao paulo"
+    assert {"guarulhos", "santo andre"} <= set(location_filter["cities"]["$in"])
+    assert "campinas" not in location_filter["cities"]["$in"]
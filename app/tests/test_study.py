@@ -0,0 +1,27 @@
+from unittest.mock import MagicMock, patch
+import pytest
+from bson import ObjectId
+from flask import Flask
+from app.services.study import StudyService
+from app.services.vector_store import LocalVectorStore
+
+
+@pytest.fixture
+def app_context():
+    app = Flask(__name__)
+    app.mongo = MagicMock()
+    with app.app_context():
+        yield app
+
+def test_approving_an_unindexed_study_on_the_local_backend(app_context, tmp_path):
+    study_id = str(ObjectId())
+    app_context.mongo.studies.find_one.return_value = {"_id": ObjectId(study_id), "sub_status": "pending"}
+    search_service = MagicMock()
+    search_service.vector_store = LocalVectorStore(MagicMock(), path=str(tmp_path))
+
+    with patch("app.services.study.get_search_service", return_value=search_service):
+        result = StudyService().approve_study(study_id)
+
+    assert result == "Study successfully accepted"
+    app_context.mongo.studies.update_one.assert_called_once_with({"_id": ObjectId(study_id)}, {"$set": {"sub_status": "accepted"}})
+    assert search_service.vector_store.count == 0
@@ -0,0 +1,73 @@
+from unittest.mock import MagicMock
+from bson import ObjectId
+from app.services.data_analysis import DataService
+from app.services.search import SearchService
+from app.services.study_translation import StudyTranslationStore, display_fields, source_hash
+
+
+def make_doc(nct_id, title, translations=None):
+    doc = {
+        "_id": ObjectId(),
+        "protocolSection": {
+            "identificationModule": {"nctId": nct_id, "briefTitle": title, "organization": {"fullName": "UFPE"}},
+            "conditionsModule": {"keywords": ["asthma"]},
+            "eligibilityModule": {"eligibilityCriteria": "Adults"},
+        }
+    }
+    if translations:
+        doc["translations"] = translations
+    return doc
+
+def fake_translate_texts(texts, target_language):
+    return {text: f"{target_language}:{text}" for text in texts if text != "fails"}
+
+def make_data_service(docs):
+    db = MagicMock()
+    db["local_studies"].find.return_value = iter(docs)
+    search_service = MagicMock()
+    search_service.filter_studies.side_effect = SearchService.filter_studies
+    search_service.translate_service.translate_texts.side_effect = fake_translate_texts
+    return DataService(search_service, db), db
+
+def stored_entry(doc):
+    fields = display_fields(SearchService.filter_studies({"studies": [doc]}, None)[0])
+    return {"source_hash": source_hash(fields), "fields": {"Title": "Estudo"}}
+
+def test_only_new_or_changed_studies_are_translated():
+    fresh = make_doc("NCT1", "Asthma study")
+    fresh["translations"] = {"pt": stored_entry(fresh)}
+    changed = make_doc("NCT2", "Asthma study v2", translations={"pt": {"source_hash": "old"}})
+    new = make_doc("NCT3", "Diabetes study")
+    data_service, db = make_data_service([fresh, changed, new])
+
+    stats = data_service.translate_local_studies()
+
+    assert stats == {"checked": 3, "translated": 2, "failed": 0}
+    data_service.search_service.translate_service.translate_texts.assert_called_once()
+    operations = db["local_studies"].bulk_write.call_args.args[0]
+    assert [op._filter["_id"] for op in operations] == [changed["_id"], new["_id"]]
+    entry = operations[1]._doc["$set"]["translations.pt"]
+    assert entry["fields"]["Title"] == "pt:Diabetes study"
+    assert entry["fields"]["Keywords"] == ["pt:asthma"]
+
+def test_partially_translated_studies_are_not_stored():
+    data_service, db = make_data_service([make_doc("NCT1", "fails")])
+
+    assert data_service.translate_local_studies()["failed"] == 1
+    db["local_studies"].bulk_write.assert_not_called()
+
+def test_apply_uses_stored_translations_only_when_source_matches():
+    doc = make_doc("NCT1", "Asthma study")
+    study = SearchService.filter_studies({"studies": [doc]}, None)[0]
+    stale = dict(study, NCTId="NCT2")
+    unknown = dict(study, NCTId="NCT3")
+    db = MagicMock()
+    db["local_studies"].find.return_value = [
+        {"protocolSection": {"identificationModule": {"nctId": "NCT1"}}, "translations": {"pt": stored_entry(doc)}},
+        {"protocolSection": {"identificationModule": {"nctId": "NCT2"}}, "translations": {"pt": {"source_hash": "old"}}},
+    ]
+
+    pending = StudyTranslationStore(db).apply([study, stale, unknown])
+
+    assert study["Title"] == "Estudo"
+    assert pending == [stale, unknown]
@@ -0,0 +1,83 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from app.services.translate import TranslateService
+
+
+def fake_translate(texts, target_language):
+    return [{"translatedText": f"{target_language}:{text}"} for text in texts]
+
+@pytest.fixture
+def mock_db():
+    db = MagicMock()
+    db["translations"].find.return_value = []
+    return db
+
+@pytest.fixture
+def translate_service(mock_db):
+    with patch("app.services.translate.translate.Client"):
+        service = TranslateService(db=mock_db)
+    service.translator.translate.side_effect = fake_translate
+    return service
+
+def test_repeated_strings_hit_the_memory_cache(translate_service, mock_db):
+    first = translate_service.translate_texts(["Heart failure", "Heart failure", "Asthma"])
+    second = translate_service.translate_texts(["Asthma", "Heart failure"])
+
+    assert first == second == {"Heart failure": "pt:Heart failure", "Asthma": "pt:Asthma"}
+    translate_service.translator.translate.assert_called_once_with(["Heart failure", "Asthma"], target_language="pt")
+    mock_db["translations"].bulk_write.assert_called_once()
+
+    stats = translate_service.cache_stats()
+    assert stats["memory_hits"] == 2
+    assert stats["duplicates"] == 1
+    # the duplicate of the first call plus the whole second call
+    assert stats["chars_saved"] == 2 * len("Heart failure") + len("Asthma")
+    assert stats["hit_rate"] == 0.5
+
+def test_strings_cached_by_another_worker_come_from_mongo(translate_service, mock_db):
+    key = TranslateService.cache_key("Asthma", "pt")
+    mock_db["translations"].find.return_value = [{"_id": key, "translated": "Asma"}]
+
+    translations = translate_service.translate_texts(["Asthma", "Diabetes"])
+
+    assert translations == {"Asthma": "Asma", "Diabetes": "pt:Diabetes"}
+    translate_service.translator.translate.assert_called_once_with(["Diabetes"], target_language="pt")
+    assert translate_service.memory_cache.get(key) == "Asma"
+    assert translate_service.cache_stats()["mongo_hits"] == 1
+
+def test_misses_are_chunked_within_api_limits(translate_service):
+    translate_service.MAX_SEGMENTS_PER_REQUEST = 3
+    translate_service.MAX_CHARS_PER_REQUEST = 10
+
+    translate_service.translate_texts(["a", "b", "c", "d", "eeeeeeeeee"])
+
+    chunks = [call.args[0] for call in translate_service.translator.translate.call_args_list]
+    assert chunks == [["a", "b", "c"], ["d"], ["eeeeeeeeee"]]
+
+def test_api_errors_leave_fields_untranslated(translate_service, mock_db):
+    translate_service.translator.translate.side_effect = Exception("quota exceeded")
+    data = [{"Title": "Asthma study", "Phase": "PHASE2"}]
+
+    assert translate_service.translate_fields(data) == [{"Title": "Asthma study", "Phase": "PHASE2"}]
+    mock_db["translations"].bulk_write.assert_not_called()
+    assert translate_service.cache_stats()["chars_saved"] == 0
+
+def test_strings_already_in_the_target_language_skip_the_api(translate_service):
+    portuguese = "Estudo de fase 3 com pacientes que não responderam ao tratamento"
+
+    translations = translate_service.translate_texts([portuguese, "Asthma"], target_language="pt")
+
+    assert translations[portuguese] == portuguese
+    translate_service.translator.translate.assert_called_once_with(["Asthma"], target_language="pt")
+    stats = translate_service.cache_stats()
+    assert stats["already_in_target"] == 1
+    assert stats["chars_saved"] == len(portuguese)
+
+def test_memory_cache_is_bounded_by_length(translate_service):
+    translate_service.memory_cache.maxweight = 100
+    long_texts = [f"{i} " + "x" * 40 for i in range(5)]
+
+    translate_service.translate_texts(long_texts)
+
+    assert translate_service.memory_cache.weight <= 100
+    assert translate_service.memory_cache.stats()["evictions"] > 0
@@ -0,0 +1,107 @@
+import time
+import threading
+import pytest
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import MagicMock, patch
+from app.core.upstream import UpstreamClient
+
+URL = "https://clinicaltrials.gov/api/v2/studies"
+
+
+def make_response(status_code, headers=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.headers = headers or {}
+    return response
+
+@pytest.fixture
+def client():
+    return UpstreamClient(max_retries=3, max_concurrency_per_host=2)
+
+def test_retries_server_errors_then_succeeds(client):
+    responses = [make_response(503), make_response(502), make_response(200)]
+
+    with patch.object(client.session, "get", side_effect=responses) as mock_get, \
+         patch("app.core.upstream.time.sleep") as mock_sleep:
+        response = client.get(URL, params={"format": "json"})
+
+    assert response.status_code == 200
+    assert mock_get.call_count == 3
+    assert mock_sleep.call_count == 2
+    assert mock_get.call_args.kwargs["timeout"] == client.timeout
+
+def test_respects_retry_after(client):
+    responses = [make_response(429, {"Retry-After": "7"}), make_response(200)]
+
+    with patch.object(client.session, "get", side_effect=responses), \
+         patch("app.core.upstream.time.sleep") as mock_sleep:
+        client.get(URL)
+
+    assert mock_sleep.call_args.args[0] >= 7
+
+def test_returns_last_response_when_retries_are_exhausted(client):
+    with patch.object(client.session, "get", return_value=make_response(500)) as mock_get, \
+         patch("app.core.upstream.time.sleep"):
+        response = client.get(URL)
+
+    assert response.status_code == 500
+    assert mock_get.call_count == 4
+
+def test_client_errors_are_not_retried(client):
+    with patch.object(client.session, "get", return_value=make_response(400)) as mock_get:
+        assert client.get(URL).status_code == 400
+
+    mock_get.assert_called_once()
+
+def test_connection_errors_are_raised_after_retries(client):
+    with patch.object(client.session, "get", side_effect=requests.exceptions.ConnectionError("reset")), \
+         patch("app.core.upstream.time.sleep"):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            client.get(URL)
+
+def test_concurrency_is_capped_per_host(client):
+    in_flight = 0
+    peak = 0
+    lock = threading.Lock()
+
+    def slow_get(url, **kwargs):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        time.sleep(0.05)
+        with lock:
+            in_flight -= 1
+        return make_response(200)
+
+    with patch.object(client.session, "get", side_effect=slow_get):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: client.get(URL), range(8)))
+
+    assert peak == 2
+
+def test_deadline_caps_the_timeouts_of_an_attempt(client):
+    with patch.object(client.session, "get", return_value=make_response(200)) as mock_get:
+        client.get(URL, deadline=time.monotonic() + 2)
+
+    connect_timeout, read_timeout = mock_get.call_args.kwargs["timeout"]
+    assert connect_timeout <= 2 and read_timeout <= 2
+    assert read_timeout < client.timeout[1]
+
+def test_no_retry_starts_past_the_deadline(client):
+    with patch.object(client.session, "get", return_value=make_response(503)) as mock_get, \
+         patch.object(client, "_backoff", return_value=5), \
+         patch("app.core.upstream.time.sleep") as mock_sleep:
+        response = client.get(URL, deadline=time.monotonic() + 1)
+
+    assert response.status_code == 503
+    mock_get.assert_called_once()
+    mock_sleep.assert_not_called()
+
+def test_an_expired_deadline_raises_a_timeout(client):
+    with patch.object(client.session, "get") as mock_get:
+        with pytest.raises(requests.exceptions.Timeout):
+            client.get(URL, deadline=time.monotonic() - 1)
+
+    mock_get.assert_not_called()
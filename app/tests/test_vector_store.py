@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+from app.services.vector_store import LocalVectorStore, SlimPineconeVectorStore, matches_filter
+
+
+def make_store(path, **kwargs):
+    embedding = MagicMock()
+    return LocalVectorStore(embedding, path=str(path), **kwargs), embedding
+
+def random_vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+@pytest.mark.parametrize("quantization", ["float32", "int8"])
+def test_exact_search_returns_the_nearest_vectors(tmp_path, quantization):
+    store, _ = make_store(tmp_path, quantization=quantization)
+    vectors = random_vectors(50)
+    store.add_vectors(vectors, [str(i) for i in range(50)], [{"text": f"study {i}"} for i in range(50)])
+
+    results = store.similarity_search_by_vector_with_score(vectors[7], k=3)
+
+    assert results[0][0].page_content == "study 7"
+    assert results[0][1] == pytest.approx(1.0, abs=0.01)
+    assert [score for _, score in results] == sorted([score for _, score in results], reverse=True)
+
+def test_metadata_filter_and_update(tmp_path):
+    store, _ = make_store(tmp_path)
+    vectors = random_vectors(10)
+    store.add_vectors(vectors, [str(i) for i in range(10)], [{"sub_status": "pending"} for _ in range(10)])
+    store.update_metadata("3", {"sub_status": "accepted"})
+
+    results = store.similarity_search_by_vector_with_score(vectors[0], k=4, filter={"sub_status": "accepted"})
+
+    assert [document.metadata["sub_status"] for document, _ in results] == ["accepted"]
+
+def test_documents_are_upserted_and_persisted(tmp_path):
+    store, embedding = make_store(tmp_path)
+    embedding.embed_documents.side_effect = lambda texts: random_vectors(len(texts), seed=len(texts)).tolist()
+    documents = [Document(page_content="asthma", metadata={"_id": "a"}), Document(page_content="cancer", metadata={"_id": "b"})]
+
+    store.add_documents(documents)
+    store.add_documents([Document(page_content="asthma v2", metadata={"_id": "a"})])
+
+    reopened, _ = make_store(tmp_path)
+    assert reopened.count == 2
+    assert reopened.metadata[reopened.positions["a"]] == {"_id": "a"}
+
+def test_pinecone_vectors_only_carry_the_slim_metadata():
+    index = MagicMock()
+    index.query.return_value = {"matches": [{"id": "a", "score": 0.9, "metadata": {"_id": "a", "sub_status": "accepted"}}]}
+    embedding = MagicMock()
+    embedding.embed_documents.return_value = [[0.1, 0.2]]
+    embedding.embed_query.return_value = [0.1, 0.2]
+    store = SlimPineconeVectorStore(index, embedding=embedding)
+
+    store.add_documents([Document(page_content="asthma", metadata={"_id": "a", "sub_status": "accepted"})])
+    results = store.similarity_search_with_score("asthma", k=1, filter={"sub_status": "accepted"})
+
+    upserted = index.upsert.call_args.kwargs["vectors"]
+    assert upserted == [{"id": "a", "values": [0.1, 0.2], "metadata": {"_id": "a", "sub_status": "accepted"}}]
+    assert results[0][0].metadata == {"_id": "a", "sub_status": "accepted"}
+    assert results[0][1] == 0.9
+
+def test_ivf_recall_against_brute_force(tmp_path):
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(20, 32))
+    vectors = (centers[rng.integers(0, 20, size=3000)] + rng.normal(scale=0.3, size=(3000, 32))).astype(np.float32)
+    store, _ = make_store(tmp_path, ann_threshold=1000, nprobe=8)
+    store.add_vectors(vectors, [str(i) for i in range(3000)], [{"id": str(i)} for i in range(3000)])
+
+    recalls = []
+    for query in vectors[:20] + rng.normal(scale=0.1, size=(20, 32)).astype(np.float32):
+        approximate = {document.metadata["id"] for document, _ in store.similarity_search_by_vector_with_score(query, k=10)}
+        exact = {document.metadata["id"] for document, _ in store.similarity_search_by_vector_with_score(query, k=10, exact=True)}
+        recalls.append(len(approximate & exact) / 10)
+
+    assert store._ivf is not None
+    assert np.mean(recalls) >= 0.9
+
+@pytest.mark.parametrize("filter, expected", [
+    ({"sub_status": "accepted"}, True),
+    ({"sub_status": {"$in": ["rejected", "pending"]}}, False),
+    ({"$or": [{"sub_status": "rejected"}, {"phase": {"$ne": "PHASE1"}}]}, True),
+])
+def test_matches_filter(filter, expected):
+    assert matches_filter({"sub_status": "accepted", "phase": "PHASE2"}, filter) == expected
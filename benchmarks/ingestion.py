@@ -0,0 +1,127 @@
+"""
+Sequential vs pipelined local_studies ingestion against a local fake ClinicalTrials.gov api.
+
+    python -m benchmarks.ingestion --studies 20000 --fetch-latency 0.3 --write-ms-per-doc 0.2
+
+The fake api serves synthetic studies in pages with nextPageToken after --fetch-latency seconds. Writes go to an
+in-memory collection that takes --write-ms-per-doc per document, or to a real database with --mongo-uri.
+Both runs go through DataService.fetch_and_store_studies; only INGESTION_WRITERS changes (0 is the sequential loop).
+"""
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from unittest.mock import MagicMock
+from app.core.config import Config
+from app.services.data_analysis import DataService
+
+
+def synthetic_study(i):
+    return {
+        "protocolSection": {
+            "identificationModule": {"nctId": f"NCT{i:08d}", "briefTitle": f"Study {i} of a treatment for condition {i % 97}"},
+            "statusModule": {"overallStatus": "RECRUITING", "lastUpdatePostDateStruct": {"date": f"2024-{i % 12 + 1:02d}-01"}},
+            "descriptionModule": {"briefSummary": "A randomized, double-blind, placebo controlled trial. " * 40},
+            "eligibilityModule": {"minimumAge": "18 Years", "maximumAge": "65 Years", "eligibilityCriteria": "Inclusion criteria. " * 40},
+            "contactsLocationsModule": {"locations": [
+                {"facility": "Hospital", "city": "Sao Paulo", "state": "SP", "country": "Brazil", "geoPoint": {"lat": -23.55, "lon": -46.63}},
+                {"facility": "Hospital", "city": "Recife", "state": "PE", "country": "Brazil"},
+            ]},
+        }
+    }
+
+def fake_api(total, latency):
+    studies = [json.dumps(synthetic_study(i)) for i in range(total)]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = {key: values[0] for key, values in parse_qs(urlparse(self.path).query).items()}
+            time.sleep(latency)
+            page_size = int(query.get("pageSize", 1000))
+            first = int(query.get("pageToken", 0))
+            last = min(first + page_size, total)
+            next_token = f', "nextPageToken": "{last}"' if last < total else ""
+            body = f'{{"studies": [{",".join(studies[first:last])}]{next_token}, "totalCount": {total}}}'.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+class SlowCollection:
+    def __init__(self, name, ms_per_doc):
+        self.name = name
+        self.ms_per_doc = ms_per_doc
+        self.documents = 0
+
+    def bulk_write(self, operations, ordered=True):
+        time.sleep(len(operations) * self.ms_per_doc / 1000)
+        self.documents += len(operations)
+
+    def find(self, *args, **kwargs):
+        return []
+
+    def find_one(self, *args, **kwargs):
+        return None
+
+    def update_one(self, *args, **kwargs):
+        pass
+
+    def insert_one(self, document):
+        return MagicMock(inserted_id=id(document))
+
+def fake_db(ms_per_doc):
+    collections = {}
+    db = MagicMock()
+    db.__getitem__.side_effect = lambda name: collections.setdefault(name, SlowCollection(name, ms_per_doc))
+    return db
+
+def run(db, url, writers):
+    Config.INGESTION_WRITERS = writers
+    service = DataService(MagicMock(), db)
+    service.BASE_URL = url
+    service._get_data_timestamp = lambda: str(time.time())
+    service.translate_local_studies = lambda **kwargs: None
+    return service.fetch_and_store_studies(full_resync=True)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--studies", type=int, default=20000)
+    parser.add_argument("--fetch-latency", type=float, default=0.3)
+    parser.add_argument("--write-ms-per-doc", type=float, default=0.2)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--mongo-uri", default=None)
+    args = parser.parse_args()
+
+    server = fake_api(args.studies, args.fetch_latency)
+    url = f"http://127.0.0.1:{server.server_address[1]}/api/v2/studies"
+
+    for writers in (0, args.writers):
+        if args.mongo_uri:
+            from pymongo import MongoClient
+            db = MongoClient(args.mongo_uri)["ingestion-benchmark"]
+            db["local_studies"].drop()
+        else:
+            db = fake_db(args.write_ms_per_doc)
+        summary = run(db, url, writers)
+        label = "sequential" if writers == 0 else f"pipelined ({writers} writers)"
+        print(
+            f"{label:<24} {summary['seconds']:7.2f}s  {summary['pages_per_second']:6.2f} pages/s  "
+            f"{summary['documents_per_second']:9.1f} docs/s  {summary['bytes_per_second'] / 2**20:6.2f} MiB/s  "
+            f"fetch {summary['fetch_seconds']:.2f}s  write {summary['write_seconds']:.2f}s  blocked {summary['fetcher_blocked_seconds']:.2f}s"
+        )
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Build time, memory and query latency of the BM25 LexicalIndex, plus RRF fusion, on a synthetic corpus.
+
+    python -m benchmarks.lexical --size 20000 --queries 200
+
+Ranking should stay within a few milliseconds per query for the size of local_studies + studies.
+"""
+import time
+import argparse
+import numpy as np
+from app.services.lexical import LexicalIndex
+from app.services.search import SearchService
+
+
+def synthetic_corpus(size, vocabulary, words_per_doc, seed=0):
+    rng = np.random.default_rng(seed)
+    # zipf-like term distribution, like real titles and summaries
+    weights = 1 / np.arange(1, len(vocabulary) + 1)
+    weights /= weights.sum()
+    words = rng.choice(vocabulary, size=(size, words_per_doc), p=weights)
+    return [(f"NCT{i:08d}", " ".join(row)) for i, row in enumerate(words)]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=20000)
+    parser.add_argument("--vocabulary", type=int, default=30000)
+    parser.add_argument("--words", type=int, default=80)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    vocabulary = np.array([f"term{i}" for i in range(args.vocabulary)])
+    corpus = synthetic_corpus(args.size, vocabulary, args.words)
+    index = LexicalIndex()
+    start = time.perf_counter()
+    for key, text in corpus:
+        index.add(key, text)
+    build = time.perf_counter() - start
+
+    postings_bytes = sum(p.itemsize * len(p) for p in index.postings_docs) + sum(p.itemsize * len(p) for p in index.postings_tfs)
+    stats = index.stats()
+    print(f"built {stats['documents']} docs, {stats['terms']} terms in {build:.2f}s, postings {postings_bytes / 2**20:.1f} MiB")
+
+    rng = np.random.default_rng(1)
+    latencies = []
+    fusion = []
+    for _ in range(args.queries):
+        query = " ".join(rng.choice(vocabulary[:2000], size=3))
+        start = time.perf_counter()
+        hits = index.search(query, k=args.k)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        lexical = [{"NCTId": key} for key, _ in hits]
+        vector = [{"NCTId": key} for key, _ in reversed(hits)]
+        start = time.perf_counter()
+        SearchService.fuse_results([vector, lexical])
+        fusion.append((time.perf_counter() - start) * 1000)
+
+    print(f"bm25 query  p50 {np.percentile(latencies, 50):.2f} ms  p95 {np.percentile(latencies, 95):.2f} ms")
+    print(f"rrf fusion  p50 {np.percentile(fusion, 50):.3f} ms  p95 {np.percentile(fusion, 95):.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Recall and latency of LocalVectorStore (exact float32/int8 and IVF) against brute force.
+
+    python -m benchmarks.vector_store --size 50000 --dim 3072 --queries 100
+
+Vectors are synthetic (gaussian clusters), so recall numbers are indicative; run it with --dim matching the
+embeddings model (3072 for text-embedding-3-large).
+"""
+import time
+import argparse
+import tempfile
+import numpy as np
+from unittest.mock import MagicMock
+from app.services.vector_store import LocalVectorStore
+
+
+def clustered_vectors(size, dim, clusters, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(0, clusters, size=size)] + rng.normal(scale=0.5, size=(size, dim))).astype(np.float32)
+
+def run(store, queries, k, exact):
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.similarity_search_by_vector_with_score(query, k=k, exact=exact)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append([document.metadata["id"] for document, _ in hits])
+    return results, latencies
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=8)
+    args = parser.parse_args()
+
+    vectors = clustered_vectors(args.size, args.dim, clusters=max(1, args.size // 500))
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(args.size, size=args.queries)] + rng.normal(scale=0.1, size=(args.queries, args.dim))
+    ids = [str(i) for i in range(args.size)]
+    metadatas = [{"id": vector_id} for vector_id in ids]
+
+    baseline = None
+    print(f"{'backend':<16}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, quantization, exact in [
+        ("exact float32", "float32", True),
+        ("exact int8", "int8", True),
+        ("ivf float32", "float32", False),
+        ("ivf int8", "int8", False),
+    ]:
+        with tempfile.TemporaryDirectory() as path:
+            store = LocalVectorStore(MagicMock(), path=path, quantization=quantization, ann_threshold=1, nprobe=args.nprobe)
+            store.add_vectors(vectors, ids, metadatas)
+            if not exact:
+                # build the ivf lists outside of the timed queries
+                store.similarity_search_by_vector_with_score(queries[0], k=args.k)
+            results, latencies = run(store, queries, args.k, exact)
+
+        if baseline is None:
+            baseline = results
+        recall = np.mean([len(set(found) & set(expected)) / args.k for found, expected in zip(results, baseline)])
+        print(f"{name:<16}{recall:>10.3f}{np.percentile(latencies, 50):>10.2f}{np.percentile(latencies, 95):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()